@@ -0,0 +1 @@
+'''Benchmarks for the preference graph, run through management commands against a disposable database'''
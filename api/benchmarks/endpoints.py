@@ -0,0 +1,135 @@
+'''Times every endpoint in core.urls, and the catalog endpoints which read the graph or its caches,
+through the full Django request cycle
+
+Requests go through an in-process APIClient authenticated as each seeded user, so the
+timings include routing, permissions and serialization but no network. The admin endpoints
+are timed once per repeat, as a staff user.'''
+import random
+from rest_framework.test import APIClient
+from movies.cache import invalidate_catalog
+from preferences.cache import invalidate_ranker
+from preferences.consensus import invalidate_consensus
+from preferences.export import latest_export, write_export
+from users.models import User
+from .seed import SEED_PREFIX
+from .timing import summarize, time_call_result
+
+
+def _cases(movie_ids: list[str], rng):
+    '''Each case takes a client and ranker id and returns the method, path and body to time, or None to skip'''
+
+    def cold(method, path, data=None, invalidate=invalidate_ranker):
+        def _setup(client, ranker_id):
+            invalidate(ranker_id)
+            return method, path, data
+        return _setup
+
+    def typeahead(client, ranker_id):
+        invalidate_catalog()
+        return 'get', '/api/movies/info/typeahead/', {'q': f'movie {rng.randrange(len(movie_ids))}'}
+
+    def known_ids(client, count):
+        known = [movie['id'] for movie in client.get('/api/movies/knows/', {'page_size': 1000}).data['results']]
+        return rng.sample(known, count) if len(known) >= count else None
+
+    def with_known(method, path, count):
+        def _setup(client, ranker_id):
+            ids = known_ids(client, count)
+            return (method, path.format(*ids), None) if ids else None
+        return _setup
+
+    def post_knows(client, ranker_id):
+        return 'post', '/api/movies/knows/', {'known_ids': rng.sample(movie_ids, 10), 'unknown_ids': []}
+
+    def post_preferences(client, ranker_id):
+        ids = known_ids(client, 2)
+        if not ids:
+            return None
+        return 'post', '/api/movies/preferences/', {'preferences': [{'preferred_id': ids[0], 'nonpreferred_id': ids[1]}]}
+
+    def delete_preference(client, ranker_id):
+        preferences = client.get('/api/movies/preferences/', {'page_size': 1000}).data['preferences']
+        if not preferences:
+            return None
+        preferred, nonpreferred = rng.choice(preferences)
+        return 'delete', f"/api/movies/preferences/{preferred['id']}/{nonpreferred['id']}/", None
+
+    return {
+        'GET /': cold('get', '/'),
+        'GET /api/movies/sort/': cold('get', '/api/movies/sort/'),
+        'GET /api/movies/recommend/': cold('get', '/api/movies/recommend/'),
+        'GET /api/movies/queue/': cold('get', '/api/movies/queue/'),
+        'POST /api/movies/queue/': cold('post', '/api/movies/queue/'),
+        'DELETE /api/movies/queue/': cold('delete', '/api/movies/queue/'),
+        'GET /api/movies/discover/': cold('get', '/api/movies/discover/'),
+        'GET /api/movies/knows/': cold('get', '/api/movies/knows/'),
+        'POST /api/movies/knows/': post_knows,
+        'GET /api/movies/knows/<item_id>/': with_known('get', '/api/movies/knows/{}/', 1),
+        'DELETE /api/movies/knows/<item_id>/': with_known('delete', '/api/movies/knows/{}/', 1),
+        'GET /api/movies/preferences/': cold('get', '/api/movies/preferences/'),
+        'POST /api/movies/preferences/': post_preferences,
+        'GET /api/movies/preferences/<preferred_id>/<nonpreferred_id>/':
+            with_known('get', '/api/movies/preferences/{}/{}/', 2),
+        'DELETE /api/movies/preferences/<preferred_id>/<nonpreferred_id>/': delete_preference,
+        'GET /api/movies/consensus/': cold('get', '/api/movies/consensus/', invalidate=lambda _: invalidate_consensus()),
+        'GET /api/movies/affinity/': cold('get', '/api/movies/affinity/'),
+        'GET /api/movies/info/typeahead/': typeahead,
+    }
+
+
+def _admin_cases():
+    '''Each case returns the method, path and body to time as a staff user'''
+
+    def get_export():
+        # Only the manifest of the latest export is read, so one is written the first time
+        if latest_export() is None:
+            write_export()
+        return 'get', '/api/graph/export/', None
+
+    return {
+        'GET /api/graph/export/': get_export,
+        'GET /api/graph/metrics/': lambda: ('get', '/api/graph/metrics/', None),
+        'DELETE /api/graph/metrics/': lambda: ('delete', '/api/graph/metrics/', None),
+    }
+
+
+def _time(client, prepared, samples: list, statuses: set):
+    method, path, data = prepared
+    # The data of a get is its query string
+    if data is None:
+        kwargs = {}
+    elif method == 'get':
+        kwargs = {'data': data}
+    else:
+        kwargs = {'data': data, 'format': 'json'}
+    elapsed, response = time_call_result(getattr(client, method), path, **kwargs)
+    samples.append(elapsed)
+    statuses.add(response.status_code)
+
+
+def run(users: list, movie_ids: list[str], repeat: int, seed=None) -> dict:
+    rng = random.Random(seed)
+    cases = _cases(movie_ids, rng)
+    admin_cases = _admin_cases()
+
+    # Removed along with the seeded users by clear_seeded_catalog
+    admin, _ = User.objects.get_or_create(username=f'{SEED_PREFIX}admin', defaults={'is_staff': True})
+
+    samples = {name: [] for name in [*cases, *admin_cases]}
+    statuses = {name: set() for name in samples}
+    for _ in range(repeat):
+        for user in users:
+            # Outside of the test runner only localhost is an allowed host
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=user)
+            for name, setup in cases.items():
+                prepared = setup(client, str(user.id))
+                if prepared is not None:
+                    _time(client, prepared, samples[name], statuses[name])
+
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=admin)
+        for name, setup in admin_cases.items():
+            _time(client, setup(), samples[name], statuses[name])
+
+    return {name: {**summarize(times), 'statuses': sorted(statuses[name])} for name, times in samples.items()}
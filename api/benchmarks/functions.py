@@ -0,0 +1,186 @@
+'''Times every public function in preferences.cypher against a seeded catalog
+
+Each case prepares its arguments outside of the timed call. Reads start from an invalidated
+cache so they measure the queries themselves, apart from the cached_ cases which read twice.'''
+import random
+from neomodel import db
+from core.models import Movie as MovieNode, User as UserNode
+from preferences import cypher
+from preferences.cache import invalidate_ranker
+from preferences.consensus import invalidate_consensus
+from preferences.ordinals import ordinal_count
+from .seed import MOVIE_PREFIX, SEED_PREFIX, seed_preferences
+from .timing import summarize, time_call
+
+
+def _known_ids(ranker) -> list[str]:
+    results, _ = db.cypher_query("MATCH (:Ranker {ranker_id: $ranker_id})-[:KNOWS]->(i:Item) RETURN i.item_id",
+                                 {'ranker_id': ranker.ranker_id})
+    return [row[0] for row in results]
+
+
+def _nodes(item_ids: list[str]) -> list[MovieNode]:
+    return [MovieNode.nodes.get(item_id=item_id) for item_id in item_ids]
+
+
+def _throwaway_properties(n: int) -> dict:
+    return {'item_id': f'{MOVIE_PREFIX}x{n:07d}', 'title': 'Benchmark throwaway', 'year': 2000}
+
+
+def _throwaway_item(n: int) -> MovieNode:
+    return MovieNode(**_throwaway_properties(n)).save()
+
+
+def _throwaway_ranker(n: int, movie_ids: list[str], rng) -> UserNode:
+    ranker = UserNode(ranker_id=f'{SEED_PREFIX}throwaway-{n}').save()
+    seed_preferences([ranker.ranker_id], movie_ids, 100, 200, rng)
+    return ranker
+
+
+def _cases(movie_ids: list[str], rng):
+    '''Each case takes a ranker and returns the function to time and its arguments, or None to skip'''
+    throwaway = iter(range(10 ** 7))
+
+    def cold(fn, *args, **kwargs):
+        def _setup(ranker):
+            invalidate_ranker(ranker.ranker_id)
+            return fn, (ranker, *args), kwargs
+        return _setup
+
+    def cached(fn, *args, **kwargs):
+        def _setup(ranker):
+            fn(ranker, *args, **kwargs)
+            return fn, (ranker, *args), kwargs
+        return _setup
+
+    def known_item(ranker):
+        known = _known_ids(ranker)
+        return _nodes(rng.sample(known, 1))[0] if known else None
+
+    def known_pair(ranker):
+        known = _known_ids(ranker)
+        return _nodes(rng.sample(known, 2)) if len(known) > 1 else None
+
+    def with_item(fn):
+        def _setup(ranker):
+            item = known_item(ranker)
+            return (fn, (ranker, item), {}) if item else None
+        return _setup
+
+    def with_pair(fn):
+        def _setup(ranker):
+            pair = known_pair(ranker)
+            return (fn, (ranker, *pair), {}) if pair else None
+        return _setup
+
+    def insert_ranker_knows_ids(ranker):
+        return cypher.insert_ranker_knows_ids, (ranker, rng.sample(movie_ids, 10), []), {}
+
+    def insert_ranker_knows(ranker):
+        known, unknown = _nodes(rng.sample(movie_ids, 2))
+        return cypher.insert_ranker_knows, (ranker, [known], [unknown]), {}
+
+    def insert_preference_ids(ranker):
+        pair = known_pair(ranker)
+        return (cypher.insert_preference_ids, (ranker, [tuple(item.item_id for item in pair)]), {}) if pair else None
+
+    def insert_preferences(ranker):
+        pair = known_pair(ranker)
+        return (cypher.insert_preferences, (ranker, [tuple(pair)]), {}) if pair else None
+
+    def insert_queued_compares(ranker):
+        pair = known_pair(ranker)
+        return (cypher.insert_queued_compares, (ranker, [tuple(pair)]), {}) if pair else None
+
+    def delete_direct_preference(ranker):
+        preferences = cypher.get_direct_preferences(ranker, MovieNode)
+        return (cypher.delete_direct_preference, (ranker, *rng.choice(preferences)), {}) if preferences else None
+
+    def delete_item(ranker):
+        item = _throwaway_item(next(throwaway))
+        cypher.insert_ranker_knows_ids(ranker, [item.item_id], [])
+        pair = known_pair(ranker)
+        if pair:
+            cypher.insert_preference_ids(ranker, [(pair[0].item_id, item.item_id)])
+        return cypher.delete_item, (item,), {}
+
+    def delete_item_ids(ranker):
+        items = [_throwaway_item(next(throwaway)) for _ in range(10)]
+        cypher.insert_ranker_knows_ids(ranker, [item.item_id for item in items], [])
+        return cypher.delete_item_ids, ([item.item_id for item in items],), {}
+
+    def delete_ranker(ranker):
+        return cypher.delete_ranker, (_throwaway_ranker(next(throwaway), movie_ids, rng),), {}
+
+    def delete_ranker_ids(ranker):
+        rankers = [_throwaway_ranker(next(throwaway), movie_ids, rng) for _ in range(2)]
+        return cypher.delete_ranker_ids, ([throwaway_ranker.ranker_id for throwaway_ranker in rankers],), {}
+
+    def insert_items(ranker):
+        return cypher.insert_items, (MovieNode, [_throwaway_properties(next(throwaway)) for _ in range(100)]), {}
+
+    def insert_rankers(ranker):
+        return cypher.insert_rankers, (UserNode, [f'{SEED_PREFIX}throwaway-{next(throwaway)}' for _ in range(10)]), {}
+
+    def get_items_by_ordinal(ranker):
+        count = ordinal_count()
+        return cypher.get_items_by_ordinal, (MovieNode, rng.sample(range(count), min(100, count))), {}
+
+    def consensus_page(ranker):
+        invalidate_consensus()
+        return cypher.consensus_page, (MovieNode,), {}
+
+    return {
+        'ranker_knows_item': with_item(cypher.ranker_knows_item),
+        'ranker_does_not_know_item': with_item(cypher.ranker_does_not_know_item),
+        'ranker_knows_status': with_item(cypher.ranker_knows_status),
+        'direct_preference_exists': with_pair(cypher.direct_preference_exists),
+        'find_existing_item_ids': lambda ranker: (cypher.find_existing_item_ids,
+                                                  (MovieNode, rng.sample(movie_ids, min(100, len(movie_ids)))), {}),
+        'list_item_properties': lambda ranker: (cypher.list_item_properties, (MovieNode,), {}),
+        'list_ranker_ids': lambda ranker: (cypher.list_ranker_ids, (UserNode,), {}),
+        'get_items_by_ordinal': get_items_by_ordinal,
+        'consensus_page': consensus_page,
+        'get_direct_preferences': cold(cypher.get_direct_preferences, MovieNode),
+        'get_direct_preferences_page': cold(cypher.get_direct_preferences_page, MovieNode),
+        'topological_sort': cold(cypher.topological_sort, MovieNode),
+        'topological_sort_page': cold(cypher.topological_sort_page, MovieNode),
+        'cached_topological_sort_page': cached(cypher.topological_sort_page, MovieNode),
+        'list_known_items_page': cold(cypher.list_known_items_page, MovieNode),
+        'list_queued_compares': cold(cypher.list_queued_compares, MovieNode),
+        'list_queued_compares_page': cold(cypher.list_queued_compares_page, MovieNode),
+        'list_undefined_known_items': cold(cypher.list_undefined_known_items, MovieNode),
+        'insert_items': insert_items,
+        'insert_rankers': insert_rankers,
+        'insert_ranker_knows_ids': insert_ranker_knows_ids,
+        'insert_ranker_knows': insert_ranker_knows,
+        'insert_preference_ids': insert_preference_ids,
+        'insert_preferences': insert_preferences,
+        'insert_queued_compares': insert_queued_compares,
+        'populate_queued_compares': cold(cypher.populate_queued_compares, MovieNode),
+        'delete_direct_preference': delete_direct_preference,
+        'delete_ranker_knows': with_item(cypher.delete_ranker_knows),
+        'delete_all_queued_compares': cold(cypher.delete_all_queued_compares, MovieNode),
+        'refresh_descendant_counts': cold(cypher.refresh_descendant_counts),
+        'delete_item': delete_item,
+        'delete_item_ids': delete_item_ids,
+        'delete_ranker': delete_ranker,
+        'delete_ranker_ids': delete_ranker_ids,
+    }
+
+
+def run(ranker_ids: list[str], movie_ids: list[str], repeat: int, seed=None) -> dict:
+    rng = random.Random(seed)
+    rankers = [UserNode.nodes.get(ranker_id=ranker_id) for ranker_id in ranker_ids]
+    cases = _cases(movie_ids, rng)
+
+    samples = {name: [] for name in cases}
+    for _ in range(repeat):
+        for ranker in rankers:
+            for name, setup in cases.items():
+                prepared = setup(ranker)
+                if prepared is not None:
+                    fn, args, kwargs = prepared
+                    samples[name].append(time_call(fn, *args, **kwargs))
+
+    return {name: summarize(times) for name, times in samples.items()}
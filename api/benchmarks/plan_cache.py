@@ -0,0 +1,126 @@
+'''Compares parameterized statements against the same statements with their values inlined
+
+Neo4j caches execution plans by query text, so every distinct text sent costs a planning step.
+The planning done is read from Neo4j's own query statistics, collected with db.stats while each
+workload runs: the distinct query texts it planned, how many times each ran, and the time spent
+compiling them, which is the time the plan cache saves when the same text is sent again.
+
+Both variants insert preferences, so each runs on a freshly seeded graph with empty query caches,
+and the variant that goes first alternates between rounds.'''
+import json
+import random
+import re
+from contextlib import contextmanager
+from neomodel import db
+from preferences.cypher import insert_preference_ids, populate_queued_compares, topological_sort, list_queued_compares
+from preferences.models import Item, Ranker
+from .seed import clear_seeded_graph, seed_graph
+from .timing import summarize, time_call
+
+PARAMETER = re.compile(r'\$(\w+)')
+
+
+def inline_parameters(statement: str, params: dict) -> str:
+    '''Substitutes each $parameter with its literal value, as the queries were built before'''
+    return PARAMETER.sub(lambda match: json.dumps(params[match.group(1)]), statement)
+
+
+@contextmanager
+def inlined_statements():
+    '''Sends every statement through db.cypher_query with its parameters inlined'''
+    cypher_query = db.cypher_query
+
+    def _cypher_query(query, params=None, *args, **kwargs):
+        if params:
+            query, params = inline_parameters(query, params), None
+        return cypher_query(query, params, *args, **kwargs)
+
+    db.cypher_query = _cypher_query
+    try:
+        yield
+    finally:
+        db.cypher_query = cypher_query
+
+
+@contextmanager
+def query_statistics():
+    '''Collects Neo4j's statistics of the queries run inside, filling in the yielded dict once they stop'''
+    db.cypher_query("CALL db.clearQueryCaches()")
+    db.cypher_query("CALL db.stats.clear('QUERIES')")
+    db.cypher_query("CALL db.stats.collect('QUERIES')")
+    statistics = {}
+    try:
+        yield statistics
+    finally:
+        db.cypher_query("CALL db.stats.stop('QUERIES')")
+        results, _ = db.cypher_query("CALL db.stats.retrieve('QUERIES') YIELD data RETURN data")
+        db.cypher_query("CALL db.stats.clear('QUERIES')")
+
+        invocations = [row[0]['invocationSummary'] for row in results]
+        counts = [summary['invocationCount'] for summary in invocations]
+        compile_us = [summary['compileTimeInUs']['avg'] * count for summary, count in zip(invocations, counts)]
+        statistics.update({'statements': sum(counts),
+                           'planned_statements': len(invocations),
+                           'compile_ms': sum(compile_us) / 1000,
+                           'mean_compile_ms': sum(compile_us) / 1000 / sum(counts) if counts else 0.0})
+
+
+def run_workloads(ranker_ids: list[str], repeat: int, seed=None) -> dict:
+    '''Times each workload for every ranker, returning the samples of each'''
+    rng = random.Random(seed)
+    rankers = [Ranker(ranker_id=ranker_id) for ranker_id in ranker_ids]
+
+    def sort(ranker):
+        topological_sort(ranker, Item)
+
+    def queue(ranker):
+        populate_queued_compares(ranker, Item)
+        list_queued_compares(ranker, Item)
+
+    def insert(ranker):
+        known = [item.item_id for item in topological_sort(ranker, Item)]
+        if len(known) > 1:
+            insert_preference_ids(ranker, [tuple(rng.sample(known, 2))])
+
+    samples = {'sort': [], 'queue': [], 'insert': []}
+    for _ in range(repeat):
+        for ranker in rankers:
+            samples['sort'].append(time_call(sort, ranker))
+            samples['queue'].append(time_call(queue, ranker))
+            samples['insert'].append(time_call(insert, ranker))
+
+    return samples
+
+
+def run_mode(inline: bool, graph: dict, repeat: int, seed=None) -> tuple[dict, dict]:
+    '''Seeds a fresh graph and runs the workloads on it, returning their samples and the query statistics'''
+    clear_seeded_graph()
+    ranker_ids, _ = seed_graph(graph['rankers'], graph['items'], graph['known'], graph['preferences'], seed=seed)
+    try:
+        with query_statistics() as statistics:
+            if inline:
+                with inlined_statements():
+                    samples = run_workloads(ranker_ids, repeat, seed=seed)
+            else:
+                samples = run_workloads(ranker_ids, repeat, seed=seed)
+    finally:
+        clear_seeded_graph()
+    return samples, statistics
+
+
+def run(graph: dict, repeat: int, rounds: int = 2, seed=None) -> dict:
+    '''Runs each variant once per round on a graph seeded with the rankers, items, known and
+    preferences counts in graph, alternating which variant goes first'''
+    modes = [('inlined', True), ('parameterized', False)]
+    samples = {mode: {} for mode, _ in modes}
+    statistics = {mode: [] for mode, _ in modes}
+    for n in range(rounds):
+        for mode, inline in (modes if n % 2 == 0 else modes[::-1]):
+            mode_samples, mode_statistics = run_mode(inline, graph, repeat, seed=seed)
+            for name, times in mode_samples.items():
+                samples[mode].setdefault(name, []).extend(times)
+            statistics[mode].append(mode_statistics)
+
+    return {mode: {'rounds': statistics[mode],
+                   'workloads': {name: summarize(times) for name, times in samples[mode].items()}}
+            for mode, _ in modes}
@@ -0,0 +1,141 @@
+import random
+from django.contrib.auth.hashers import make_password
+from django.db.models.signals import post_delete
+from neomodel import db
+from core.models import Movie as MovieNode, User as UserNode
+from core.signals.handlers import enqueue_delete_of_deleted_movie, enqueue_delete_of_deleted_user
+from movies.models import Movie
+from users.models import User
+from preferences import queries
+from preferences.models import Item, Ranker
+from preferences.cypher import delete_item_ids, delete_ranker_ids, insert_items, insert_rankers
+
+SEED_PREFIX = 'benchmark-'
+# Movie ids are at most 12 characters, and real IMDB ids all start with tt
+MOVIE_PREFIX = 'bm'
+BATCH_SIZE = 5000
+
+
+def _batches(rows: list, size: int = BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _create_items(item_class, items: list[dict]):
+    for batch in _batches(items):
+        insert_items(item_class, batch)
+
+
+def _create_rankers(ranker_class, ranker_ids: list[str]):
+    for batch in _batches(ranker_ids):
+        insert_rankers(ranker_class, batch)
+
+
+def seed_preferences(ranker_ids: list[str], item_ids: list[str], n_known: int, n_preferences: int, rng):
+    '''Has each existing ranker know n_known random items with n_preferences random preferences among them
+
+    Preferences always point from earlier to later items in a random order per ranker, so
+    each ranker's preferences form a DAG'''
+    for ranker_id in ranker_ids:
+        known = rng.sample(item_ids, min(n_known, len(item_ids)))
+        pairs = set()
+        while len(known) > 1 and len(pairs) < min(n_preferences, len(known) * (len(known) - 1) // 2):
+            i, j = sorted(rng.sample(range(len(known)), 2))
+            pairs.add((known[i], known[j]))
+
+        query = "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+        query += "MATCH (i:Item) WHERE i.item_id IN $known "
+        query += "MERGE (r)-[k:KNOWS]->(i) "
+        query += "ON CREATE SET k.descendants = 0"
+        db.cypher_query(query, {'ranker_id': ranker_id, 'known': known})
+
+        query = "UNWIND $pairs AS pair "
+        query += "MATCH (i:Item {item_id: pair[0]}), (j:Item {item_id: pair[1]}) "
+        query += "MERGE (i)-[p:PREFERRED_TO_BY {by: $ranker_id}]->(j) "
+        query += "ON CREATE SET p.created = timestamp()"
+        db.cypher_query(query, {'ranker_id': ranker_id, 'pairs': [list(pair) for pair in pairs]})
+
+        db.cypher_query(queries.REBUILD_DESCENDANT_COUNTS, {'ranker_id': ranker_id})
+
+
+def seed_graph(n_rankers: int, n_items: int, n_known: int, n_preferences: int, seed=None):
+    '''Creates synthetic rankers and items, each ranker knowing n_known random items
+    with n_preferences random preferences among them
+
+    Only the graph is seeded, with generic Item and Ranker nodes. Returns the created ranker ids and item ids.'''
+    rng = random.Random(seed)
+
+    item_ids = [f'{SEED_PREFIX}item-{n}' for n in range(n_items)]
+    ranker_ids = [f'{SEED_PREFIX}ranker-{n}' for n in range(n_rankers)]
+
+    _create_items(Item, [{'item_id': item_id} for item_id in item_ids])
+    _create_rankers(Ranker, ranker_ids)
+    seed_preferences(ranker_ids, item_ids, n_known, n_preferences, rng)
+
+    return ranker_ids, item_ids
+
+
+def _seeded_node_ids(item_prefix: str, ranker_ids: list[str] = ()) -> tuple[list[str], list[str]]:
+    query = "MATCH (i:Item) WHERE i.item_id STARTS WITH $item_prefix RETURN i.item_id"
+    results, _ = db.cypher_query(query, {'item_prefix': item_prefix})
+    item_ids = [row[0] for row in results]
+
+    query = "MATCH (r:Ranker) WHERE r.ranker_id STARTS WITH $prefix OR r.ranker_id IN $ranker_ids RETURN r.ranker_id"
+    results, _ = db.cypher_query(query, {'prefix': SEED_PREFIX, 'ranker_ids': list(ranker_ids)})
+    return item_ids, [row[0] for row in results]
+
+
+def _delete_nodes(item_ids: list[str], ranker_ids: list[str]):
+    # Through the same deletes as the api, so the ordinal cache and ranker caches are kept consistent
+    for batch in _batches(ranker_ids):
+        delete_ranker_ids(batch)
+    for batch in _batches(item_ids):
+        delete_item_ids(batch)
+
+
+def clear_seeded_graph():
+    '''Removes every node created by seed_graph, along with their relationships'''
+    _delete_nodes(*_seeded_node_ids(SEED_PREFIX))
+
+
+def seed_catalog(n_users: int, n_movies: int, n_known: int, n_preferences: int, seed=None):
+    '''Creates synthetic users and movies in both Postgres and the graph, each user knowing
+    n_known random movies with n_preferences random preferences among them
+
+    Rows are bulk created, so the post_save signals never fire and the matching nodes are
+    created here in batches instead. Returns the created users and movie ids.'''
+    rng = random.Random(seed)
+
+    movies = [Movie(id=f'{MOVIE_PREFIX}{n:08d}', title=f'Benchmark movie {n}', year=rng.randint(1920, 2022))
+              for n in range(n_movies)]
+    Movie.objects.bulk_create(movies, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    _create_items(MovieNode, [{'item_id': movie.id, 'title': movie.title, 'year': movie.year} for movie in movies])
+
+    password = make_password(None)
+    users = [User(username=f'{SEED_PREFIX}user-{n}', password=password) for n in range(n_users)]
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    ranker_ids = [str(user.id) for user in users]
+    _create_rankers(UserNode, ranker_ids)
+
+    movie_ids = [movie.id for movie in movies]
+    seed_preferences(ranker_ids, movie_ids, n_known, n_preferences, rng)
+
+    return users, movie_ids
+
+
+def clear_seeded_catalog():
+    '''Removes every user and movie created by seed_catalog, along with their nodes'''
+    ranker_ids = [str(user_id) for user_id in
+                  User.objects.filter(username__startswith=SEED_PREFIX).values_list('id', flat=True)]
+
+    _delete_nodes(*_seeded_node_ids(MOVIE_PREFIX, ranker_ids))
+
+    # The nodes are already gone, so no delete events are needed for the graph sync
+    post_delete.disconnect(enqueue_delete_of_deleted_movie, sender=Movie)
+    post_delete.disconnect(enqueue_delete_of_deleted_user, sender=User)
+    try:
+        Movie.objects.filter(id__startswith=MOVIE_PREFIX).delete()
+        User.objects.filter(username__startswith=SEED_PREFIX).delete()
+    finally:
+        post_delete.connect(enqueue_delete_of_deleted_movie, sender=Movie)
+        post_delete.connect(enqueue_delete_of_deleted_user, sender=User)
@@ -0,0 +1,39 @@
+'''Seeds the catalog at each graph size in turn and times every cypher function and endpoint against it
+
+The documented scale follows docs/scale_estimation.txt for each user, with 1000 seen movies and
+2000 preferences out of a 100k catalog. Only the number of users is cut down to fit one machine.'''
+import platform
+from datetime import datetime, timezone
+from . import endpoints, functions
+from .seed import clear_seeded_catalog, seed_catalog
+from .timing import time_call_result
+
+SCALES = {
+    'tiny': {'users': 5, 'movies': 200, 'known': 50, 'preferences': 100},
+    'small': {'users': 10, 'movies': 2000, 'known': 200, 'preferences': 400},
+    'medium': {'users': 20, 'movies': 20000, 'known': 500, 'preferences': 1000},
+    'documented': {'users': 50, 'movies': 100000, 'known': 1000, 'preferences': 2000},
+}
+
+
+def run_scale(scale: dict, repeat: int, seed=None, include_endpoints: bool = True) -> dict:
+    clear_seeded_catalog()
+    seed_ms, (users, movie_ids) = time_call_result(seed_catalog, scale['users'], scale['movies'], scale['known'],
+                                                   scale['preferences'], seed=seed)
+    try:
+        results = {'parameters': scale, 'seed_ms': seed_ms,
+                   'functions': functions.run([str(user.id) for user in users], movie_ids, repeat, seed=seed)}
+        if include_endpoints:
+            results['endpoints'] = endpoints.run(users, movie_ids, repeat, seed=seed)
+    finally:
+        clear_seeded_catalog()
+    return results
+
+
+def run(scale_names: list[str], repeat: int, seed=None, include_endpoints: bool = True) -> dict:
+    return {'meta': {'started': datetime.now(timezone.utc).isoformat(),
+                     'python': platform.python_version(),
+                     'repeat': repeat,
+                     'seed': seed},
+            'scales': {name: run_scale(SCALES[name], repeat, seed=seed, include_endpoints=include_endpoints)
+                       for name in scale_names}}
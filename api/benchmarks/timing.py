@@ -0,0 +1,59 @@
+import json
+from time import perf_counter
+
+
+def time_call(fn, *args, **kwargs) -> float:
+    '''Runs fn once and returns the elapsed time in milliseconds'''
+    return time_call_result(fn, *args, **kwargs)[0]
+
+
+def time_call_result(fn, *args, **kwargs) -> tuple[float, object]:
+    '''Runs fn once and returns the elapsed time in milliseconds along with its result'''
+    start = perf_counter()
+    result = fn(*args, **kwargs)
+    return (perf_counter() - start) * 1000, result
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict:
+    return {'n': len(samples),
+            'mean_ms': sum(samples) / len(samples) if samples else 0.0,
+            'p50_ms': percentile(samples, 50),
+            'p99_ms': percentile(samples, 99)}
+
+
+def write_results(results: dict, output=None, stream=None):
+    '''Writes results as JSON to the output path if given, otherwise to the stream'''
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    elif stream is not None:
+        stream.write(text)
+
+
+def find_regressions(baseline: dict, results: dict, threshold: float = 1.5, statistic: str = 'p50_ms') -> list[dict]:
+    '''Compares every timing summary present in both results, returning those slower than threshold times baseline
+
+    Summaries are found by walking both dicts in step, so any nesting of scales and groups works'''
+    regressions = []
+
+    def _walk(old, new, path):
+        if statistic in old and statistic in new:
+            if old[statistic] > 0 and new[statistic] > threshold * old[statistic]:
+                regressions.append({'name': '/'.join(path), 'baseline': old[statistic],
+                                    'result': new[statistic], 'ratio': new[statistic] / old[statistic]})
+            return
+        for key in old.keys() & new.keys():
+            if isinstance(old[key], dict) and isinstance(new[key], dict):
+                _walk(old[key], new[key], [*path, key])
+
+    _walk(baseline, results, [])
+    return sorted(regressions, key=lambda regression: regression['name'])
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import SyncEvent
 
-# Register your models here.
+
+@admin.register(SyncEvent)
+class SyncEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'operation', 'object_id', 'created_at', 'attempts', 'available_at']
+    list_filter = ['kind', 'operation']
+    search_fields = ['object_id']
+    readonly_fields = ['kind', 'operation', 'object_id', 'payload', 'created_at', 'last_error']
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.sync import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Compares movies and users in Postgres against their nodes in the graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Queue changes to repair any differences, to be written by sync_graph')
+
+    def handle(self, *args, **options):
+        differences = reconcile(fix=options['fix'])
+
+        for kind, counts in differences.items():
+            self.stdout.write(f"{kind}: {counts['missing']} missing, {counts['stale']} stale, "
+                              f"{counts['extra']} extra")
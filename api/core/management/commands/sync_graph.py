@@ -0,0 +1,40 @@
+import logging
+from time import sleep
+from django.core.management.base import BaseCommand
+from core.sync import BATCH_SIZE, flush, flush_all
+
+logger = logging.getLogger(__name__)
+
+# The longest wait after flushes which keep failing, such as while the graph or Postgres is down
+MAX_FAILURE_INTERVAL = 60.0
+
+
+class Command(BaseCommand):
+    help = 'Writes pending movie and user changes from Postgres to the graph, polling for new changes until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait between polls once the queue is drained')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write(f'Synced {flush_all(options["batch_size"])} changes')
+            return
+
+        failures = 0
+        while True:
+            try:
+                applied = flush(options['batch_size'])
+            except Exception:
+                # A failed batch is rolled back and left pending, so wait longer after each failure and try again
+                failures += 1
+                logger.exception('Could not flush graph sync events')
+                sleep(min(options['interval'] * 2 ** min(failures, 16), MAX_FAILURE_INTERVAL))
+                continue
+
+            failures = 0
+            # Keep going straight away while there is a backlog, and only wait once it is drained
+            if applied < options['batch_size']:
+                sleep(options['interval'])
@@ -1,12 +1,42 @@
+from django.db import models
+from django.utils import timezone
 from preferences.models import Item, Ranker
-from neomodel.properties import StringProperty, IntegerProperty
+from neomodel.properties import ArrayProperty, StringProperty, IntegerProperty
 class Movie(Item):
     '''Extends the Item class in preferences with simple movie information
     
     This denormalization is an efficiency improvement to prevent excessive 1-row SQL queries'''
     title = StringProperty(max_length=100)
-    year = IntegerProperty()
+    year = IntegerProperty(index=True)
+    # Kept in sync with the Postgres links, so rankings and discovery can be filtered in the graph
+    genre_ids = ArrayProperty(IntegerProperty())
+    star_ids = ArrayProperty(IntegerProperty())
 
 class User(Ranker):
     '''Extends the Ranker class in preferences'''
-    pass
\ No newline at end of file
+    pass
+
+class SyncEvent(models.Model):
+    '''A change to a Postgres row which is still to be written to its node in the graph
+
+    Events are recorded in the same transaction as the change, and written to the graph in batches by sync_graph'''
+    KIND_MOVIE = 'movie'
+    KIND_USER = 'user'
+    KIND_CHOICES = [(KIND_MOVIE, 'Movie'), (KIND_USER, 'User')]
+
+    OPERATION_UPSERT = 'upsert'
+    OPERATION_DELETE = 'delete'
+    OPERATION_CHOICES = [(OPERATION_UPSERT, 'Upsert'), (OPERATION_DELETE, 'Delete')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    object_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True,
+                                        help_text='When the event is next due, pushed back after each failure')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
@@ -1,2 +1,2 @@
-from .handlers import (create_node_for_new_movie, delete_node_of_deleted_movie,
-                       create_node_for_new_user, delete_node_of_deleted_user)
+from .handlers import (enqueue_upsert_of_saved_movie, enqueue_delete_of_deleted_movie,
+                       enqueue_upsert_of_new_user, enqueue_delete_of_deleted_user)
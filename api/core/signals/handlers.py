@@ -1,31 +1,48 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from core.models import Movie as MovieNode, User as UserNode
-from movies.models import Movie
+from core.models import SyncEvent
+from core.sync import enqueue, movie_event, movie_upserts, user_event
+from movies.models import Genre, Movie, Star
+from movies.signals.links import changed_movie_ids
 from users.models import User
-from preferences.cypher import delete_ranker, delete_item
 
 
+# Nodes are written by the graph sync worker, so these only record what changed
 @receiver(post_save, sender=Movie)
-def create_node_for_new_movie(sender, **kwargs):
-    if kwargs['created']:
-        created_movie = kwargs['instance']
-        MovieNode(item_id=created_movie.id, title=created_movie.title, year=created_movie.year).save()  
+def enqueue_upsert_of_saved_movie(sender, **kwargs):
+    # Every save is synced, as the node holds a copy of the title and year
+    enqueue([movie_event(kwargs['instance'], SyncEvent.OPERATION_UPSERT)])
 
 @receiver(post_delete, sender=Movie)
-def delete_node_of_deleted_movie(sender, **kwargs):
-    deleted_movie = kwargs['instance']
-    node_to_delete = MovieNode.nodes.get(item_id=deleted_movie.id)
-    delete_item(node_to_delete)
+def enqueue_delete_of_deleted_movie(sender, **kwargs):
+    enqueue([movie_event(kwargs['instance'], SyncEvent.OPERATION_DELETE)])
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.stars.through)
+def enqueue_upsert_of_relinked_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    # The node holds the genre and star ids too
+    movie_ids = changed_movie_ids(instance, action, reverse, pk_set)
+    if movie_ids:
+        enqueue(movie_upserts(movie_ids))
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Star)
+def remember_movies_of_deleted_link(sender, instance, **kwargs):
+    # Deleting a genre or star removes its links without sending m2m_changed
+    instance._relinked_movie_ids = list(instance.movies.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Star)
+def enqueue_upsert_of_unlinked_movies(sender, instance, **kwargs):
+    movie_ids = getattr(instance, '_relinked_movie_ids', [])
+    if movie_ids:
+        enqueue(movie_upserts(movie_ids))
 
 @receiver(post_save, sender=User)
-def create_node_for_new_user(sender, **kwargs):
+def enqueue_upsert_of_new_user(sender, **kwargs):
     if kwargs['created']:
-        created_user = kwargs['instance']
-        UserNode(ranker_id=created_user.id).save()  
+        enqueue([user_event(kwargs['instance'], SyncEvent.OPERATION_UPSERT)])
 
 @receiver(post_delete, sender=User)
-def delete_node_of_deleted_user(sender, **kwargs):
-    deleted_user = kwargs['instance']
-    node_to_delete = UserNode.nodes.get(ranker_id=deleted_user.id)
-    delete_ranker(node_to_delete)
\ No newline at end of file
+def enqueue_delete_of_deleted_user(sender, **kwargs):
+    enqueue([user_event(kwargs['instance'], SyncEvent.OPERATION_DELETE)])
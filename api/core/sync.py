@@ -0,0 +1,182 @@
+'''Writes changes to movies and users from Postgres to their nodes in the graph, in batches
+
+The signal handlers only record a SyncEvent in the same transaction as the change, so a request
+never waits on Neo4j. flush applies the pending events in order, and only ever takes the oldest
+pending event of each object, so an object's events are applied one after another however many
+workers flush at once, and a later event waits behind one held back after a failure. Every write
+is a MERGE or a DETACH DELETE, so applying an event twice is harmless and a batch which fails is
+simply retried later.'''
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from preferences.cypher import (delete_item_ids, delete_ranker_ids, insert_items, insert_rankers,
+                                list_item_properties, list_ranker_ids)
+from preferences.ordinals import assign_missing_ordinals
+from movies.models import Movie
+from users.models import User
+from .models import Movie as MovieNode, User as UserNode, SyncEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'GRAPH_SYNC_BATCH_SIZE', 1000)
+MAX_BACKOFF = timedelta(hours=1)
+# 2 ** 30 seconds is far past MAX_BACKOFF, and a timedelta of 2 ** 47 seconds or more overflows
+MAX_BACKOFF_EXPONENT = 30
+
+
+def movie_links(movie_ids: list[str] = None) -> dict[str, dict]:
+    '''The sorted genre and star ids of each movie, or of every movie, read with one query per relation'''
+    links = {}
+    for through, field in ((Movie.genres.through, 'genre'), (Movie.stars.through, 'star')):
+        rows = through.objects.all() if movie_ids is None else through.objects.filter(movie_id__in=movie_ids)
+        for movie_id, link_id in rows.order_by(f'{field}_id').values_list('movie_id', f'{field}_id').iterator():
+            links.setdefault(movie_id, {'genre_ids': [], 'star_ids': []})[f'{field}_ids'].append(link_id)
+    for movie_id in movie_ids or []:
+        links.setdefault(movie_id, {'genre_ids': [], 'star_ids': []})
+    return links
+
+
+def movie_event(movie: Movie, operation: str, links: dict = None) -> SyncEvent:
+    '''An event for the movie, with its genre and star ids from links, or read here if not given'''
+    payload = {}
+    if operation == SyncEvent.OPERATION_UPSERT:
+        links = links if links is not None else movie_links([movie.id])[movie.id]
+        payload = {'title': movie.title, 'year': movie.year, **links}
+    return SyncEvent(kind=SyncEvent.KIND_MOVIE, operation=operation, object_id=movie.id, payload=payload)
+
+
+def movie_upserts(movie_ids: list[str]) -> list[SyncEvent]:
+    '''Upsert events for the movies which still exist, reading their genres and stars in bulk'''
+    links = movie_links(movie_ids)
+    return [movie_event(movie, SyncEvent.OPERATION_UPSERT, links[movie.id])
+            for movie in Movie.objects.filter(id__in=movie_ids).only('id', 'title', 'year')]
+
+
+def user_event(user: User, operation: str) -> SyncEvent:
+    return SyncEvent(kind=SyncEvent.KIND_USER, operation=operation, object_id=str(user.id))
+
+
+def enqueue(events: list[SyncEvent]):
+    '''Records events to be written to the graph, in the current transaction if there is one'''
+    SyncEvent.objects.bulk_create(events)
+
+    # Tests expect nodes to exist as soon as their rows do, with no worker running
+    if getattr(settings, 'GRAPH_SYNC_IMMEDIATE', False):
+        flush_all()
+
+
+def apply_events(events: list[SyncEvent]):
+    '''Writes the events to the graph, with one statement per kind and operation'''
+    # Only the latest event for each object matters, except that a delete before an upsert
+    # must still clear the old node's relationships first
+    latest, deleted = {}, set()
+    for event in events:
+        latest[event.kind, event.object_id] = event
+        if event.operation == SyncEvent.OPERATION_DELETE:
+            deleted.add((event.kind, event.object_id))
+    upserted = [event for event in latest.values() if event.operation == SyncEvent.OPERATION_UPSERT]
+
+    delete_item_ids(sorted(object_id for kind, object_id in deleted if kind == SyncEvent.KIND_MOVIE))
+    delete_ranker_ids(sorted(object_id for kind, object_id in deleted if kind == SyncEvent.KIND_USER))
+
+    movies = [{**event.payload, 'item_id': event.object_id} for event in upserted
+              if event.kind == SyncEvent.KIND_MOVIE]
+    if movies:
+        insert_items(MovieNode, movies)
+
+    user_ids = [event.object_id for event in upserted if event.kind == SyncEvent.KIND_USER]
+    if user_ids:
+        insert_rankers(UserNode, user_ids)
+
+
+def _defer(failed: list[tuple[SyncEvent, Exception]]):
+    now = timezone.now()
+    for event, error in failed:
+        event.attempts += 1
+        delay = min(2 ** min(event.attempts, MAX_BACKOFF_EXPONENT), MAX_BACKOFF.total_seconds())
+        event.available_at = now + timedelta(seconds=delay)
+        event.last_error = repr(error)
+    SyncEvent.objects.bulk_update([event for event, _ in failed], ['attempts', 'available_at', 'last_error'])
+
+
+def flush(batch_size: int = BATCH_SIZE) -> int:
+    '''Applies up to batch_size of the events which are due, returning how many were applied
+
+    Locked events are skipped, so several workers can flush at once without applying the same events.
+    An event with any earlier event for the same object still pending, whether it is due, held back
+    or being applied by another worker, is left for a later flush'''
+    now = timezone.now()
+    earlier = SyncEvent.objects.filter(kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__lt=OuterRef('id'))
+    with transaction.atomic():
+        events = list(SyncEvent.objects.select_for_update(skip_locked=True)
+                      .filter(available_at__lte=now).exclude(Exists(earlier))[:batch_size])
+        if not events:
+            return 0
+
+        try:
+            apply_events(events)
+            applied, failed = events, []
+        except Exception:
+            # Fall back to one event at a time, so only the events which fail are held back
+            applied, failed = [], []
+            for event in events:
+                try:
+                    apply_events([event])
+                    applied.append(event)
+                except Exception as error:
+                    logger.exception('Could not sync %s %s %s', event.operation, event.kind, event.object_id)
+                    failed.append((event, error))
+
+        SyncEvent.objects.filter(id__in=[event.id for event in applied]).delete()
+        if failed:
+            _defer(failed)
+
+    return len(applied)
+
+
+def flush_all(batch_size: int = BATCH_SIZE) -> int:
+    '''Applies every event which is due, stopping early if a batch makes no progress'''
+    total = 0
+    while applied := flush(batch_size):
+        total += applied
+    return total
+
+
+def reconcile(fix: bool = False) -> dict:
+    '''Compares movies and users in Postgres against their nodes in the graph
+
+    Returns the number of missing, stale and extra nodes of each kind. With fix, events are
+    enqueued to create or update the missing and stale nodes and to delete the extra ones, and
+    any items created before ordinals were assigned are given one.'''
+    nodes = list_item_properties(MovieNode)
+    links = movie_links()
+    rows = {movie_id: {'title': title, 'year': year, **links.get(movie_id, {'genre_ids': [], 'star_ids': []})}
+            for movie_id, title, year in Movie.objects.values_list('id', 'title', 'year').iterator()}
+    missing_movies = rows.keys() - nodes.keys()
+    stale_movies = {movie_id for movie_id in rows.keys() & nodes.keys()
+                    if any(nodes[movie_id].get(key) != value for key, value in rows[movie_id].items())}
+    extra_movies = nodes.keys() - rows.keys()
+
+    ranker_ids = list_ranker_ids(UserNode)
+    user_ids = {str(user_id) for user_id in User.objects.values_list('id', flat=True).iterator()}
+    missing_users = user_ids - ranker_ids
+    extra_users = ranker_ids - user_ids
+
+    if fix:
+        events = [SyncEvent(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_UPSERT,
+                            object_id=movie_id, payload=rows[movie_id])
+                  for movie_id in sorted(missing_movies | stale_movies)]
+        events += [SyncEvent(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_DELETE, object_id=movie_id)
+                   for movie_id in sorted(extra_movies)]
+        events += [SyncEvent(kind=SyncEvent.KIND_USER, operation=SyncEvent.OPERATION_UPSERT, object_id=user_id)
+                   for user_id in sorted(missing_users)]
+        events += [SyncEvent(kind=SyncEvent.KIND_USER, operation=SyncEvent.OPERATION_DELETE, object_id=user_id)
+                   for user_id in sorted(extra_users)]
+        enqueue(events)
+        assign_missing_ordinals()
+
+    return {'movies': {'missing': len(missing_movies), 'stale': len(stale_movies), 'extra': len(extra_movies)},
+            'users': {'missing': len(missing_users), 'stale': 0, 'extra': len(extra_users)}}
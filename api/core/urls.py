@@ -1,27 +1,35 @@
 from django.urls import path
 from django.views.generic import TemplateView
+from preferences.views import export_graph, graph_metrics
+from preferences.asynchronous import graph_view
 from . import views
 
 urlpatterns = [
     path('', TemplateView.as_view(template_name='core/index.html')),
     path('api/movies/sort/',
-         views.MovieRankerViewSet.as_view({'get': 'get_sorted_list'})),
+         graph_view(views.MovieRankerViewSet, {'get': 'get_sorted_list'})),
+    path('api/movies/recommend/',
+         graph_view(views.MovieRankerViewSet, {'get': 'recommend'})),
     path('api/movies/queue/',
-         views.MovieRankerViewSet.as_view({'get': 'get_comparisons_queue',
-                                           'post': 'reset_comparisons_queue',
-                                           'delete': 'clear_comparisons_queue'})),
+         graph_view(views.MovieRankerViewSet, {'get': 'get_comparisons_queue',
+                                               'post': 'reset_comparisons_queue',
+                                               'delete': 'clear_comparisons_queue'})),
     path('api/movies/discover/',
-         views.MovieRankerKnowsViewSet.as_view({'get': 'discover'})),                                   
+         graph_view(views.MovieRankerKnowsViewSet, {'get': 'discover'})),                                   
     path('api/movies/knows/',
-         views.MovieRankerKnowsViewSet.as_view({'get': 'list',
-                                                'post': 'create'})),
+         graph_view(views.MovieRankerKnowsViewSet, {'get': 'list',
+                                                    'post': 'create'})),
     path('api/movies/knows/<str:item_id>/',
-         views.MovieRankerKnowsViewSet.as_view({'get': 'retrieve',
-                                                'delete': 'destroy'})),
+         graph_view(views.MovieRankerKnowsViewSet, {'get': 'retrieve',
+                                                    'delete': 'destroy'})),
     path('api/movies/preferences/',
-         views.MovieRankerPairwiseViewSet.as_view({'get': 'list',
-                                                   'post': 'create'})),
+         graph_view(views.MovieRankerPairwiseViewSet, {'get': 'list',
+                                                       'post': 'create'})),
     path('api/movies/preferences/<str:preferred_id>/<str:nonpreferred_id>/',
-         views.MovieRankerPairwiseViewSet.as_view({'get': 'retrieve',
-                                                   'delete': 'destroy'}))
+         graph_view(views.MovieRankerPairwiseViewSet, {'get': 'retrieve',
+                                                       'delete': 'destroy'})),
+    path('api/movies/consensus/',
+         views.MovieConsensusViewSet.as_view({'get': 'list'})),
+    path('api/graph/export/', export_graph),
+    path('api/graph/metrics/', graph_metrics),
 ]
\ No newline at end of file
@@ -1,25 +1,42 @@
 from movies.models import Movie as MovieSql
 from core.models import Movie as MovieNode, User as UserNode
 from movies.serializers import SimpleMovieSerializer
-from preferences.views import RankerKnowsViewSet, RankerPairwiseViewSet, RankerViewSet
+from preferences.views import ConsensusViewSet, RankerKnowsViewSet, RankerPairwiseViewSet, RankerViewSet
 from .serializers import MovieNodeSerialiazer
 
 def get_simple_movie_from_node(self, movie_node: MovieNode):
     return MovieNodeSerialiazer(movie_node)
 
+# The same fields as MovieNodeSerialiazer, read straight from the graph for list responses
+simple_movie_projection = {'id': 'item_id', 'title': 'title', 'year': 'year'}
+
+# Lists of movies can be filtered by genre or star ids, each a comma separated list, and by year
+movie_filters = {'genre': ('genre_ids', 'any'), 'star': ('star_ids', 'any'),
+                 'year_min': ('year', 'gte'), 'year_max': ('year', 'lte')}
+
 class MovieRankerViewSet(RankerViewSet):
     ranker_class = UserNode
     item_class = MovieNode
     serialize_item = get_simple_movie_from_node
+    item_projection = simple_movie_projection
+    item_filters = movie_filters
 
 class MovieRankerKnowsViewSet(RankerKnowsViewSet):
     ranker_class = UserNode
     item_class = MovieNode
     serialize_item = get_simple_movie_from_node
+    item_projection = simple_movie_projection
+    item_filters = movie_filters
+    # New users would otherwise mostly be shown obscure movies they mark unknown
+    discover_weighted = True
 
 class MovieRankerPairwiseViewSet(RankerPairwiseViewSet):
     ranker_class = UserNode
     item_class = MovieNode
     serialize_item = get_simple_movie_from_node
+    item_projection = simple_movie_projection
 
-
+class MovieConsensusViewSet(ConsensusViewSet):
+    item_class = MovieNode
+    serialize_item = get_simple_movie_from_node
+    item_projection = simple_movie_projection
@@ -0,0 +1,62 @@
+'''Which genres and stars a user favors, from where their movies fall in their sorted list
+
+The sorted movie ids come from the graph, and the genres and stars of all of them are read with
+one query per relation. Each movie scores from 1 at the top of the list down to -1 at the bottom,
+and each genre or star scores the sum of its movies' scores, damped towards zero when it only
+has a few movies so one well placed film does not outrank a consistent favorite.'''
+import numpy as np
+from core.models import Movie as MovieNode
+from preferences.cache import get_or_set_for_ranker
+from preferences.cypher import topological_sort
+from preferences.models import Ranker
+from .cache import catalog_version
+from .models import Movie
+
+# Movies a genre or star needs before its score counts fully
+SHRINKAGE = 3.0
+
+
+def rank_scores(count: int) -> np.ndarray:
+    '''Scores for each position in a sorted list of count movies, from 1 at the top to -1 at the bottom'''
+    if count == 1:
+        return np.ones(1)
+    return np.linspace(1.0, -1.0, count)
+
+
+def score_groups(positions: np.ndarray, groups: np.ndarray, n_groups: int, scores: np.ndarray):
+    '''The damped affinity of each group, and the number of movies in it, from (position, group) pairs'''
+    totals = np.bincount(groups, scores[positions], n_groups)
+    counts = np.bincount(groups, minlength=n_groups)
+    return totals / (counts + SHRINKAGE), counts
+
+
+def _affinities(through, field: str, positions: dict, scores: np.ndarray, limit: int) -> list[dict]:
+    rows = list(through.objects.filter(movie_id__in=positions.keys())
+                .values_list('movie_id', f'{field}_id', f'{field}__name'))
+    if not rows:
+        return []
+
+    group_ids = sorted({row[1] for row in rows})
+    index = {group_id: n for n, group_id in enumerate(group_ids)}
+    names = {row[1]: row[2] for row in rows}
+
+    affinity, counts = score_groups(np.array([positions[row[0]] for row in rows]),
+                                    np.array([index[row[1]] for row in rows]), len(group_ids), scores)
+    order = np.lexsort((np.array(group_ids), -affinity))[:limit]
+    return [{'id': group_ids[n], 'name': names[group_ids[n]], 'affinity': round(float(affinity[n]), 4),
+             'movies': int(counts[n])} for n in order]
+
+
+def get_affinities(ranker: Ranker, limit: int = 10) -> dict:
+    '''The genres and stars the ranker favors most, cached until they or the catalog change'''
+    def _compute():
+        movie_ids = [movie.item_id for movie in topological_sort(ranker, MovieNode)]
+        if not movie_ids:
+            return {'genres': [], 'stars': []}
+
+        positions = {movie_id: n for n, movie_id in enumerate(movie_ids)}
+        scores = rank_scores(len(movie_ids))
+        return {'genres': _affinities(Movie.genres.through, 'genre', positions, scores, limit),
+                'stars': _affinities(Movie.stars.through, 'star', positions, scores, limit)}
+
+    return get_or_set_for_ranker(ranker.ranker_id, f'affinity:{catalog_version()}:{limit}', _compute)
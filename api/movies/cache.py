@@ -0,0 +1,38 @@
+'''Cache of catalog reads, invalidated by a single version number for the whole catalog
+
+Every cached result is keyed on the current catalog version, which is bumped whenever a movie,
+or the genres and stars shown with it, change. Old entries are never read again and simply expire.'''
+from time import time_ns
+from django.conf import settings
+from django.core.cache import cache
+
+RESULT_TIMEOUT = getattr(settings, 'MOVIES_CACHE_TIMEOUT', 60 * 60)
+TYPEAHEAD_TIMEOUT = getattr(settings, 'MOVIES_TYPEAHEAD_CACHE_TIMEOUT', 60)
+
+_VERSION_KEY = 'movies:catalog:version'
+
+
+def catalog_version() -> int:
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        # Start from the current time rather than zero so a lost version never matches old entries
+        cache.add(_VERSION_KEY, time_ns(), timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.add(_VERSION_KEY, time_ns(), timeout=None)
+
+
+def get_or_set_for_catalog(name: str, compute, timeout: int):
+    '''Returns the cached result of compute for the current catalog version, computing it on a miss'''
+    key = f'movies:catalog:{catalog_version()}:{name}'
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout=timeout)
+    return result
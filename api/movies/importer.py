@@ -0,0 +1,199 @@
+'''Bulk import of the movie catalog from IMDB-API
+
+Pages of search results are fetched concurrently and parsed as each one arrives, and the movies
+are written in batches with one bulk insert per table. Bulk inserts do not send post_save, so the
+graph sync events the signal handlers would record are recorded here, one bulk insert per batch.
+A page which cannot be fetched is recorded and skipped, and the rest of the import carries on.'''
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from core.models import SyncEvent
+from core.sync import enqueue, movie_event
+from .cache import invalidate_catalog
+from .models import Movie, Star, Genre
+from .search import update_search_vectors
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 250
+SEARCH_URL = 'https://imdb-api.com/API/AdvancedSearch/'
+
+
+class ImportedMovie(NamedTuple):
+    id: str
+    title: str
+    year: int
+    runtime: int
+    plot: str
+    content_rating: str
+    genres: list[str]
+    stars: list[str]
+
+
+class ImportResult(NamedTuple):
+    pages: int
+    created: int
+    skipped: int
+    # The offsets of the pages which could not be fetched
+    failed: tuple[int, ...] = ()
+
+
+class PageNotCached(Exception):
+    pass
+
+
+def get_api_key() -> str:
+    if settings.DEBUG:
+        with open('api/.imdb_apikey', 'r') as f:
+            return f.read().strip()
+    return os.environ.get('IMDB_API_KEY', '')
+
+
+def _cache_path(offset: int) -> Path:
+    cache_dir = getattr(settings, 'IMDB_CACHE_DIR', None)
+    return Path(cache_dir) / f'{offset}.json' if cache_dir else None
+
+
+def fetch_page(offset: int, key: str = None) -> dict:
+    '''Returns one page of search results starting from offset, from the local cache if it has them'''
+    path = _cache_path(offset)
+    if path is not None and path.exists():
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    # Tests read from a fixture directory and must never reach the API
+    if getattr(settings, 'IMDB_OFFLINE', False):
+        raise PageNotCached(f'No cached IMDB page at offset {offset}')
+
+    url = SEARCH_URL + (key if key is not None else get_api_key())
+    response = requests.get(url, params={'title_type': 'feature', 'count': PAGE_SIZE,
+                                         'sort': 'num_votes,desc', 'start': offset}, timeout=60)
+    response.raise_for_status()
+    json_data = response.json()
+
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(json_data, f)
+
+    return json_data
+
+
+def parse_movies(json_data: dict):
+    '''Yields each well-formed movie on a page of results, skipping any with missing fields'''
+    for movie in json_data.get('results') or []:
+        try:
+            # Text is cut to the column lengths, as bulk inserts skip model validation
+            yield ImportedMovie(id=movie['id'],
+                                title=movie['title'][:100],
+                                year=int(movie['description'][-5:-1]),  # '(1999)' -> 1999
+                                runtime=int(movie['runtimeStr'].split(' ')[0]),  # '150 min' -> 150
+                                plot=movie['plot'] or '',
+                                content_rating=str(movie['contentRating'] or '')[:12],
+                                genres=sorted({genre['value'][:20] for genre in movie['genreList'] or []}),
+                                stars=sorted({star['name'][:100] for star in movie['starList'] or []}))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            logger.warning('Skipping malformed IMDB result %s', movie.get('id'))
+
+
+def _ids_by_name(model, names: set[str]) -> dict[str, int]:
+    # Names are unique, so an import running at the same time inserting the same name leaves a single row
+    existing = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+    model.objects.bulk_create([model(name=name) for name in names - existing.keys()], ignore_conflicts=True)
+    return dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def write_batch(movies: list[ImportedMovie]) -> int:
+    '''Inserts the movies which do not exist yet, with their genres, stars and search vectors,
+    and queues their graph nodes
+
+    Returns the number of movies created'''
+    movies = list({movie.id: movie for movie in movies}.values())
+    existing = set(Movie.objects.filter(id__in=[movie.id for movie in movies]).values_list('id', flat=True))
+    movies = [movie for movie in movies if movie.id not in existing]
+    if not movies:
+        return 0
+
+    with transaction.atomic():
+        rows = [Movie(id=movie.id, title=movie.title, year=movie.year, runtime=movie.runtime,
+                      plot=movie.plot, content_rating=movie.content_rating) for movie in movies]
+        Movie.objects.bulk_create(rows, ignore_conflicts=True)
+
+        genre_ids = _ids_by_name(Genre, {name for movie in movies for name in movie.genres})
+        star_ids = _ids_by_name(Star, {name for movie in movies for name in movie.stars})
+
+        Movie.genres.through.objects.bulk_create(
+            [Movie.genres.through(movie_id=movie.id, genre_id=genre_ids[name])
+             for movie in movies for name in movie.genres], ignore_conflicts=True)
+        Movie.stars.through.objects.bulk_create(
+            [Movie.stars.through(movie_id=movie.id, star_id=star_ids[name])
+             for movie in movies for name in movie.stars], ignore_conflicts=True)
+
+        update_search_vectors(Movie.objects.filter(id__in=[movie.id for movie in movies]))
+        enqueue([movie_event(row, SyncEvent.OPERATION_UPSERT,
+                             {'genre_ids': sorted(genre_ids[name] for name in movie.genres),
+                              'star_ids': sorted(star_ids[name] for name in movie.stars)})
+                 for row, movie in zip(rows, movies)])
+
+    invalidate_catalog()
+
+    return len(movies)
+
+
+def import_catalog(start: int = None, pages: int = 1, max_workers: int = 8, batch_size: int = 1000,
+                   key: str = None) -> ImportResult:
+    '''Imports pages of the most voted feature films, starting from the offset after the current catalog
+
+    Only a few pages per worker are in flight at once, so memory stays flat however many pages are imported'''
+    start = start if start is not None else Movie.objects.count() + 1
+    offsets = [start + n * PAGE_SIZE for n in range(pages)]
+    window = 2 * max_workers
+
+    created, skipped, batch, failed = 0, 0, [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for first in range(0, len(offsets), window):
+            futures = {executor.submit(fetch_page, offset, key): offset for offset in offsets[first:first + window]}
+            for future in as_completed(futures):
+                try:
+                    page = future.result()
+                except Exception:
+                    logger.exception('Could not fetch the IMDB page at offset %d', futures[future])
+                    failed.append(futures[future])
+                    continue
+
+                for movie in parse_movies(page):
+                    batch.append(movie)
+                    if len(batch) >= batch_size:
+                        written = write_batch(batch)
+                        created, skipped, batch = created + written, skipped + len(batch) - written, []
+
+    written = write_batch(batch)
+    created, skipped = created + written, skipped + len(batch) - written
+
+    logger.info('Imported %d movies from %d IMDB pages, skipped %d, failed to fetch %d pages',
+                created, pages, skipped, len(failed))
+    return ImportResult(pages, created, skipped, tuple(sorted(failed)))
+
+
+def _import_in_background(**kwargs):
+    try:
+        import_catalog(**kwargs)
+    except Exception:
+        logger.exception('Background IMDB import failed')
+    finally:
+        # The thread opened its own database connection, which nothing else will close
+        connection.close()
+
+
+def start_import(**kwargs) -> threading.Thread:
+    '''Runs import_catalog in a background thread, so a request can start an import without waiting on it'''
+    thread = threading.Thread(target=_import_in_background, kwargs=kwargs, name='imdb-import', daemon=True)
+    thread.start()
+    return thread
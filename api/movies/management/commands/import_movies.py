@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from movies.importer import import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Imports pages of the most voted feature films from IMDB-API, after the movies already in the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1, help='Number of 250-movie pages to import')
+        parser.add_argument('--start', type=int, default=None,
+                            help='Offset of the first movie to import (defaults to after the current catalog)')
+        parser.add_argument('--workers', type=int, default=8, help='Number of pages fetched concurrently')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of movies written at once')
+
+    def handle(self, *args, **options):
+        result = import_catalog(start=options['start'], pages=options['pages'],
+                                max_workers=options['workers'], batch_size=options['batch_size'])
+
+        self.stdout.write(f'Imported {result.created} movies from {result.pages} pages '
+                          f'({result.skipped} already existed)')
+        if result.failed:
+            self.stderr.write(f'Could not fetch the pages at offsets {", ".join(map(str, result.failed))}')
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_stars(apps, schema_editor):
+    # Concurrent imports could each insert the same name, so every movie of a duplicate moves to the first star
+    Movie = apps.get_model('movies', 'Movie')
+    Star = apps.get_model('movies', 'Star')
+    through = Movie.stars.through
+
+    duplicates = Star.objects.values('name').annotate(first=Min('id'), count=Count('id')).filter(count__gt=1)
+    for row in duplicates:
+        others = Star.objects.filter(name=row['name']).exclude(id=row['first'])
+        movie_ids = through.objects.filter(star__in=others).values_list('movie_id', flat=True)
+        through.objects.bulk_create([through(movie_id=movie_id, star_id=row['first']) for movie_id in movie_ids],
+                                    ignore_conflicts=True)
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_title_upper_trigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stars, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='star',
+            name='name',
+            field=models.CharField(help_text='The name of the star', max_length=100, unique=True),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db.models import Model, CharField, SmallIntegerField, TextField, ManyToManyField
+from django.db.models.functions import Upper
 
 
 class Genre(Model):
@@ -7,7 +10,7 @@ class Genre(Model):
 
 
 class Star(Model):
-    name = CharField(max_length=100, help_text='The name of the star')
+    name = CharField(max_length=100, help_text='The name of the star', unique=True)
 
 
 class Movie(Model):
@@ -28,3 +31,11 @@ class Movie(Model):
     # Database links
     genres = ManyToManyField(Genre, blank=True, related_name='movies')
     stars = ManyToManyField(Star, blank=True, related_name='movies')
+
+    # Maintained by movies.search whenever the movie, its genres or its stars change
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+                   # Substring matches on titles for typeahead, which icontains and istartswith compare in upper case
+                   GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='movie_title_upper_trgm_idx')]
@@ -0,0 +1,28 @@
+'''The stored full text search vector of each movie
+
+Titles and years are weighted highest, then the names of the movie's stars and genres, then its plot
+and rating. The vectors are rebuilt in a single UPDATE whenever any of these change, so searches only
+read the GIN index and never aggregate over the stars and genres.'''
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db.models import OuterRef, Subquery
+
+
+def _names(through, field: str):
+    # The space separated names of every related star or genre of the movie in the outer query
+    return Subquery(through.objects.filter(movie_id=OuterRef('pk'))
+                    .values('movie_id')
+                    .annotate(names=StringAgg(f'{field}__name', delimiter=' '))
+                    .values('names'))
+
+
+def search_vector(movie_model):
+    return (SearchVector('title', 'year', weight='A')
+            + SearchVector(_names(movie_model.stars.through, 'star'), weight='B')
+            + SearchVector(_names(movie_model.genres.through, 'genre'), weight='B')
+            + SearchVector('plot', 'content_rating', weight='D'))
+
+
+def update_search_vectors(queryset) -> int:
+    '''Rebuilds the search vector of every movie in the queryset, returning the number updated'''
+    return queryset.update(search_vector=search_vector(queryset.model))
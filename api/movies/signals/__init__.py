@@ -0,0 +1,2 @@
+from .handlers import (update_search_vector_of_saved_movie, invalidate_catalog_of_deleted_movie,
+                       update_search_vectors_of_renamed_links, update_search_vectors_of_changed_links)
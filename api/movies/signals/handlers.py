@@ -0,0 +1,31 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from movies.cache import invalidate_catalog
+from movies.models import Genre, Movie, Star
+from movies.search import update_search_vectors
+from .links import changed_movie_ids
+
+
+@receiver(post_save, sender=Movie)
+def update_search_vector_of_saved_movie(sender, **kwargs):
+    update_search_vectors(Movie.objects.filter(pk=kwargs['instance'].pk))
+    invalidate_catalog()
+
+@receiver(post_delete, sender=Movie)
+def invalidate_catalog_of_deleted_movie(sender, **kwargs):
+    invalidate_catalog()
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Star)
+def update_search_vectors_of_renamed_links(sender, **kwargs):
+    if not kwargs['created']:
+        update_search_vectors(Movie.objects.filter(pk__in=kwargs['instance'].movies.values('pk')))
+        invalidate_catalog()
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.stars.through)
+def update_search_vectors_of_changed_links(sender, instance, action, reverse, pk_set, **kwargs):
+    movie_ids = changed_movie_ids(instance, action, reverse, pk_set)
+    if movie_ids:
+        update_search_vectors(Movie.objects.filter(pk__in=movie_ids))
+        invalidate_catalog()
@@ -0,0 +1,16 @@
+def changed_movie_ids(instance, action: str, reverse: bool, pk_set) -> list:
+    '''The ids of the movies whose genres or stars an m2m_changed signal changed, once it has happened
+
+    From the genre or star side, the changed movies are in pk_set, except on a clear where they are
+    not passed at all, so they are remembered on the instance before it happens'''
+    if action == 'pre_clear' and reverse:
+        instance._cleared_movie_ids = list(instance.movies.values_list('pk', flat=True))
+        return []
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return []
+
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, '_cleared_movie_ids', [])
+    return list(pk_set or [])
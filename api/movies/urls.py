@@ -6,7 +6,8 @@ router = DefaultRouter()
 router.register('info', views.MovieViewSet)
 
 urlpatterns = [
-    path('populate/', views.populate_movies)
+    path('populate/', views.populate_movies),
+    path('affinity/', views.movie_affinity),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
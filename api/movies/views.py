@@ -1,14 +1,17 @@
-
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-from django.contrib.postgres.aggregates import StringAgg
+import hashlib
+from django.utils.cache import patch_vary_headers
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Case, F, IntegerField, Value, When
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import IsAdminUser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework import status
+from core.models import User as UserNode
+from preferences.membership import item_statuses
+from .affinity import get_affinities
+from .cache import RESULT_TIMEOUT, TYPEAHEAD_TIMEOUT, get_or_set_for_catalog
 from .models import Movie
 from .serializers import MovieSerializer, SimpleMovieSerializer
 from .imdb import do_populate_movies
@@ -20,47 +23,118 @@ def populate_movies(request):
     if request.method == 'GET':
         return Response(status=status.HTTP_200_OK)
 
-    return do_populate_movies()
+    try:
+        pages = int(request.data.get('pages', 1))
+    except (TypeError, ValueError):
+        return Response(data={'error': 'pages must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return do_populate_movies(pages=max(pages, 1))
+
+
+@api_view(http_method_names=['GET'])
+@permission_classes([IsAuthenticated])
+def movie_affinity(request):
+    ranker = UserNode.nodes.get_or_none(ranker_id=str(request.user.id))
+    if ranker is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        return Response(data={'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(data=get_affinities(ranker, limit))
 
 
 class MovieViewSet(ReadOnlyModelViewSet):
     queryset = Movie.objects.all()
     serializer_class = SimpleMovieSerializer
 
-    @method_decorator(cache_page(60*60))
+    # Responses are cached in two tiers: the movie data shared by everyone, cached per catalog version,
+    # and whether the logged-in user knows each movie, merged in from their cached membership
+    def get_knows_overlay(self, movie_ids: list[str]) -> dict:
+        if not self.request.user.is_authenticated:
+            return None
+
+        return item_statuses(str(self.request.user.id), movie_ids)
+
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        def _page():
+            return super(MovieViewSet, self).list(request, *args, **kwargs).data
+
+        uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        data = get_or_set_for_catalog(f'list:{uri}', _page, RESULT_TIMEOUT)
+
+        overlay = self.get_knows_overlay([movie['id'] for movie in data['results']])
+        if overlay is not None:
+            data = {**data, 'results': [{**movie, 'knows': overlay[movie['id']]} for movie in data['results']]}
+
+        response = Response(data)
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
-    @method_decorator(cache_page(60 * 60))
     def retrieve(self, request, *args, **kwargs):
-        movie = Movie.objects.prefetch_related('genres').prefetch_related(
-            'stars').filter(id=kwargs['pk']).first()
-        if not movie:
+        def _detail():
+            movie = Movie.objects.prefetch_related('genres').prefetch_related(
+                'stars').filter(id=kwargs['pk']).first()
+            return MovieSerializer(movie).data if movie else None
+
+        data = get_or_set_for_catalog(f'detail:{kwargs["pk"]}', _detail, RESULT_TIMEOUT)
+        if data is None:
             return Response(data={'error': 'No movie with id {} found'.format(kwargs['pk'])}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = MovieSerializer(movie)
-        return Response(serializer.data)
+        overlay = self.get_knows_overlay([data['id']])
+        if overlay is not None:
+            data = {**data, 'knows': overlay[data['id']]}
 
+        response = Response(data)
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
     @action(detail=False)
-    @method_decorator(cache_page(5 * 60))
     def search(self, request):
-        search_vector = SearchVector('title', 'year', weight='A')
-        search_vector += SearchVector(StringAgg('stars__name', delimiter=' '),
-                                      weight='B')
-        search_vector += SearchVector(StringAgg('genres__name', delimiter=' '),
-                                      weight='B')
-        search_vector += SearchVector('plot', 'content_rating', weight='D')
-
         query = self.request.GET.get('q')
         if not query:
             return Response(data={'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        search_query = SearchQuery(self.request.GET.get('q'))
-        search_rank = SearchRank(vector=search_vector, query=search_query)
-        queryset = Movie.objects.annotate(search=search_vector,
-                                          rank=search_rank
-                                          ).filter(search=search_query
-                                                   ).order_by('-rank')
-        serializer = SimpleMovieSerializer(queryset, many=True)
-        return Response(serializer.data)
+        def _page():
+            # The weighted vector is stored on each movie, so this is a lookup on its GIN index
+            search_query = SearchQuery(query)
+            queryset = Movie.objects.annotate(rank=SearchRank(F('search_vector'), search_query)
+                                              ).filter(search_vector=search_query
+                                                       ).order_by('-rank', 'id')
+
+            page = self.paginate_queryset(queryset)
+            serializer = SimpleMovieSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+
+        uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return Response(get_or_set_for_catalog(f'search:{uri}', _page, RESULT_TIMEOUT))
+
+    @action(detail=False)
+    def typeahead(self, request):
+        query = ' '.join(self.request.GET.get('q', '').split())
+        if not query:
+            return Response(data={'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(max(int(self.request.GET.get('limit', 10)), 1), 25)
+        except ValueError:
+            return Response(data={'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        def _matches():
+            # Titles starting with the query come first, then the closest trigram matches
+            # The trigram index covers substring matches, while shorter queries can only match prefixes
+            if len(query) >= 3:
+                queryset = Movie.objects.filter(title__icontains=query)
+            else:
+                queryset = Movie.objects.filter(title__istartswith=query)
+            queryset = queryset.annotate(
+                prefix=Case(When(title__istartswith=query, then=Value(0)), default=Value(1),
+                            output_field=IntegerField()),
+                similarity=TrigramSimilarity('title', query)
+            ).order_by('prefix', '-similarity', '-year', 'id')[:limit]
+            return SimpleMovieSerializer(queryset, many=True).data
+
+        data = get_or_set_for_catalog(f'typeahead:{limit}:{query.lower()}', _matches, TYPEAHEAD_TIMEOUT)
+        return Response(data)
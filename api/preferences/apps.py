@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class PreferencesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'preferences'
\ No newline at end of file
+    name = 'preferences'
+
+    def ready(self):
+        from .connection import install
+        install()
@@ -0,0 +1,119 @@
+'''Async variants of the ranker views, for serving under ASGI
+
+Under ASGI, Django runs every synchronous view on one shared thread, so a single slow query to the
+graph holds up every other request on the worker. async_view wraps a viewset's actions in an async
+view which runs each request on threads from an executor of its own instead. The executor has
+GRAPH_ASYNC_THREADS threads, as many as the driver's pool has connections unless set otherwise,
+and that bounds how many queries one worker has in flight at once, not the pool alone.
+
+Before the action runs, the user is read from Postgres while the ranker and any items named in the
+url are read from the graph, at the same time, as the token already holds the user's id. The view
+then finds them on the request instead of looking them up in turn, authenticating the user with
+GraphUserAuthentication.
+
+The 4.4 driver's experimental AsyncGraphDatabase is not used for the pre-read, because every query
+here goes through neomodel, which is synchronous and bound to its own driver, the pooled one that
+connection.py installs. Reading the nodes with a second, async driver would bypass that pool, the
+shared sessions and the read routing, and return records rather than neomodel nodes. DRF is also
+synchronous, so the actions themselves are unchanged, and each runs its remaining queries in order
+on its thread.'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, update_wrapper
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .connection import MAX_CONNECTION_POOL_SIZE, install
+
+# The url parameters which name items, which are read along with the ranker
+ITEM_KWARGS = ('item_id', 'preferred_id', 'nonpreferred_id')
+
+# Sized explicitly, as the event loop's default executor only has a handful of threads per cpu
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'GRAPH_ASYNC_THREADS', MAX_CONNECTION_POOL_SIZE),
+                               thread_name_prefix='graph')
+
+
+def _in_worker(function):
+    # neomodel and Django both keep their connections per thread, and worker threads are reused
+    def _run(*args, **kwargs):
+        install()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(_run, thread_sensitive=False, executor=_executor)
+
+
+def _validated_token(request):
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+
+    try:
+        return authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+def _get_user(validated_token):
+    try:
+        return JWTAuthentication().get_user(validated_token)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+
+class GraphUserAuthentication(BaseAuthentication):
+    '''Authenticates the user async_view already read for the request's token, if it found one'''
+    def authenticate(self, request):
+        user = getattr(request, 'graph_user', None)
+        if user is None:
+            return None
+        return user, request.graph_token
+
+
+def lookup_nodes(viewset_class, ranker_id, kwargs: dict) -> dict:
+    '''The ranker with ranker_id and the items named in kwargs, by item id, in at most two queries'''
+    nodes = {'ranker': viewset_class.ranker_class.nodes.get_or_none(ranker_id=ranker_id)}
+    item_ids = [kwargs[name] for name in ITEM_KWARGS if name in kwargs]
+    if item_ids:
+        nodes['items'] = {item.item_id: item for item in viewset_class.item_class.nodes.filter(item_id__in=item_ids)}
+    return nodes
+
+
+def async_view(viewset_class, actions: dict, **initkwargs):
+    '''The viewset's actions as an async view, which runs each request on threads of its own'''
+    # Any request without a user read beforehand is authenticated by the viewset as usual
+    authentication_classes = [GraphUserAuthentication, *viewset_class.authentication_classes]
+    view = viewset_class.as_view(actions, **{'authentication_classes': authentication_classes, **initkwargs})
+    run = _in_worker(view)
+    get_user = _in_worker(_get_user)
+    get_nodes = _in_worker(partial(lookup_nodes, viewset_class))
+
+    async def _view(request, *args, **kwargs):
+        validated_token = _validated_token(request)
+        if validated_token is not None:
+            user, nodes = await asyncio.gather(get_user(validated_token),
+                                               get_nodes(validated_token[api_settings.USER_ID_CLAIM], kwargs))
+            # Without a user the view authenticates as usual, and refuses the request
+            if user is not None:
+                request.graph_user, request.graph_token = user, validated_token
+                request.graph_nodes = nodes
+
+        return await run(request, *args, **kwargs)
+
+    # Keep csrf_exempt and the viewset's attributes, which are set on the view as_view returns
+    return update_wrapper(_view, view)
+
+
+def graph_view(viewset_class, actions: dict, **initkwargs):
+    '''The async variant of the viewset's actions when GRAPH_ASYNC_VIEWS is set, else the usual view'''
+    if getattr(settings, 'GRAPH_ASYNC_VIEWS', False):
+        return async_view(viewset_class, actions, **initkwargs)
+    return viewset_class.as_view(actions, **initkwargs)
@@ -0,0 +1,56 @@
+'''Per-ranker cache of query results, invalidated by a version number for each ranker
+
+Every cached result is keyed on the ranker's current version. Every function in cypher.py that
+changes a ranker's data bumps that version once its transaction has committed, so later reads
+miss the cache instead of returning stale results, and the old entries simply expire.'''
+from time import time_ns
+from django.conf import settings
+from django.core.cache import cache
+
+RESULT_TIMEOUT = getattr(settings, 'PREFERENCES_CACHE_TIMEOUT', 60 * 60)
+
+
+def _version_key(ranker_id: str) -> str:
+    return f'preferences:ranker:{ranker_id}:version'
+
+
+def ranker_version(ranker_id: str) -> int:
+    version = cache.get(_version_key(ranker_id))
+    if version is None:
+        # Start from the current time rather than zero so a lost version never matches old entries
+        cache.add(_version_key(ranker_id), time_ns(), timeout=None)
+        version = cache.get(_version_key(ranker_id))
+    return version
+
+
+def invalidate_ranker(ranker_id: str):
+    try:
+        cache.incr(_version_key(ranker_id))
+    except ValueError:
+        cache.add(_version_key(ranker_id), time_ns(), timeout=None)
+
+
+def get_or_set_for_ranker(ranker_id: str, name: str, compute):
+    '''Returns the cached result of compute for the ranker's current version, computing it on a miss'''
+    key = f'preferences:ranker:{ranker_id}:{ranker_version(ranker_id)}:{name}'
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout=RESULT_TIMEOUT)
+    return result
+
+
+class CachedNode(dict):
+    '''The properties and id of a node, which is all StructuredNode.inflate needs from a driver node'''
+
+    def __init__(self, id: int, properties: dict):
+        super().__init__(properties)
+        self.id = id
+
+
+def freeze_node(node) -> tuple[int, dict]:
+    return node.id, dict(node)
+
+
+def thaw_node(item_class, row: tuple[int, dict]):
+    return item_class.inflate(CachedNode(*row))
@@ -0,0 +1,243 @@
+'''Connection management for the graph: a configured pool, one session per request, and timings
+
+neomodel opens a new session for every query outside a transaction. install replaces its driver
+with a pooled one sized from settings, whose sessions are shared for the length of a request by
+GraphSessionMiddleware, so a request borrows at most one connection per access mode on each thread
+it runs on, however many queries it runs. Retrieve functions read in read_transaction, which a cluster routes to its read
+replicas, and mutators write in write_transaction.
+
+Every session borrowed and every query run is timed, and the totals are kept per process for
+graph_metrics to report.'''
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from urllib.parse import urlparse
+from django.conf import settings
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS, basic_auth
+from neomodel import db
+
+MAX_CONNECTION_POOL_SIZE = getattr(settings, 'NEO4J_MAX_CONNECTION_POOL_SIZE', 100)
+CONNECTION_ACQUISITION_TIMEOUT = getattr(settings, 'NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 60.0)
+MAX_CONNECTION_LIFETIME = getattr(settings, 'NEO4J_MAX_CONNECTION_LIFETIME', 3600)
+
+# The sessions opened so far in the current request, by access mode and database, if in a request
+_request_sessions: ContextVar = ContextVar('graph_request_sessions', default=None)
+
+
+class _Metrics:
+    '''Counts and total and maximum milliseconds of each kind of timing, shared by every thread'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    def record(self, name: str, elapsed_ms: float):
+        with self._lock:
+            count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+            self._timings[name] = (count + 1, total + elapsed_ms, max(maximum, elapsed_ms))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: {'count': count, 'mean_ms': round(total / count, 3), 'max_ms': round(maximum, 3)}
+                    for name, (count, total, maximum) in self._timings.items()}
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+
+
+metrics = _Metrics()
+
+
+class _TimedTransaction:
+    def __init__(self, transaction, access_mode: str):
+        self._transaction = transaction
+        self._access_mode = access_mode
+
+    def run(self, query, parameters=None, **kwargs):
+        # Records only arrive once they are read, so this times the wait for the first of them
+        started = perf_counter()
+        result = self._transaction.run(query, parameters, **kwargs)
+        result.peek()
+        metrics.record(f'query.{self._access_mode}', (perf_counter() - started) * 1000)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+
+class _SharedSession:
+    '''A session which stays open until the request ends, whatever its borrowers do with it'''
+
+    def __init__(self, session, access_mode: str, shared: bool):
+        self._session = session
+        self._access_mode = access_mode
+        self._shared = shared
+
+    def begin_transaction(self, *args, **kwargs):
+        # Beginning the first transaction is what borrows a connection from the pool
+        started = perf_counter()
+        transaction = self._session.begin_transaction(*args, **kwargs)
+        metrics.record('begin', (perf_counter() - started) * 1000)
+        return _TimedTransaction(transaction, self._access_mode)
+
+    def run(self, query, parameters=None, **kwargs):
+        started = perf_counter()
+        result = self._session.run(query, parameters, **kwargs)
+        result.peek()
+        metrics.record(f'query.{self._access_mode}', (perf_counter() - started) * 1000)
+        return result
+
+    def close(self):
+        if not self._shared:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class PooledDriver:
+    '''Wraps the driver neomodel uses, handing out the current request's session for each access mode'''
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def session(self, default_access_mode=WRITE_ACCESS, **kwargs):
+        access_mode = default_access_mode or WRITE_ACCESS
+        sessions = _request_sessions.get()
+        if sessions is None:
+            return _SharedSession(self._driver.session(default_access_mode=access_mode, **kwargs),
+                                  access_mode.lower(), shared=False)
+
+        # Sessions are not thread safe, and an async request may run its queries on several threads at once
+        key = (access_mode, kwargs.get('database'), threading.get_ident())
+        if key not in sessions:
+            started = perf_counter()
+            sessions[key] = _SharedSession(self._driver.session(default_access_mode=access_mode, **kwargs),
+                                           access_mode.lower(), shared=True)
+            metrics.record('session', (perf_counter() - started) * 1000)
+        return sessions[key]
+
+    def close(self):
+        self._driver.close()
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def _pooled_driver(url: str) -> PooledDriver:
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            parsed = urlparse(url)
+            _driver = PooledDriver(GraphDatabase.driver(
+                f'{parsed.scheme}://{parsed.hostname}:{parsed.port or 7687}',
+                auth=basic_auth(parsed.username, parsed.password),
+                max_connection_pool_size=MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=CONNECTION_ACQUISITION_TIMEOUT,
+                max_connection_lifetime=MAX_CONNECTION_LIFETIME))
+        return _driver
+
+
+def install(url: str = None):
+    '''Connects neomodel in this thread through the one driver with the configured pool, in place of its own
+
+    neomodel keeps its connection per thread, so this runs again in every thread that serves requests'''
+    if isinstance(getattr(db, 'driver', None), PooledDriver):
+        return
+
+    url = url or settings.NEOMODEL_NEO4J_BOLT_URL
+    db.set_connection(url)
+    db.driver.close()
+    db.driver = _pooled_driver(url)
+
+
+@contextmanager
+def request_sessions():
+    '''Shares one session per access mode between every query run inside, closing them at the end'''
+    if _request_sessions.get() is not None:
+        yield
+        return
+
+    token = _request_sessions.set({})
+    try:
+        yield
+    finally:
+        for session in _request_sessions.get().values():
+            session._session.close()
+        _request_sessions.reset(token)
+
+
+@contextmanager
+def read_transaction():
+    '''A read only transaction, or the transaction already in progress if there is one'''
+    install()
+    if db._active_transaction is not None:
+        yield
+        return
+
+    with db.read_transaction:
+        yield
+
+
+@contextmanager
+def write_transaction():
+    '''A write transaction, or the transaction already in progress if there is one'''
+    install()
+    if db._active_transaction is not None:
+        yield
+        return
+
+    with db.write_transaction:
+        yield
+
+
+class GraphSessionMiddleware:
+    '''Shares the graph sessions across each request, under WSGI or ASGI
+
+    Django only keeps a request asynchronous while every middleware in the chain can be, so this
+    takes whichever form get_response has, as MiddlewareMixin does.'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Django 4.0 checks for this marker to call the instance as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        install()
+        with request_sessions():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The ContextVar is copied into each thread the request's views run on, so they see its sessions
+        with request_sessions():
+            return await self.get_response(request)
+
+
+def run_in_auto_commit(query: str, params: dict = None):
+    '''Runs a query in a session of its own, outside any transaction
+
+    CALL {} IN TRANSACTIONS commits as it goes, which Neo4j refuses inside an explicit transaction'''
+    install()
+    with db.driver._driver.session(default_access_mode=WRITE_ACCESS) as session:
+        started = perf_counter()
+        session.run(query, params or {}).consume()
+        metrics.record('query.write', (perf_counter() - started) * 1000)
@@ -0,0 +1,191 @@
+'''A consensus score for every item, aggregated from every ranker's direct preferences
+
+Each preference is one game won by the preferred item under a Bradley-Terry model, where the
+chance that i is preferred to j is 1 / (1 + exp(score_j - score_i)). Scores are fitted online,
+Elo style: each batch of preferences is read from the graph as arrays of winner and loser
+ordinals, and every item's score moves by its average surprise over the batch, with NumPy.
+
+Only the preferences created since the last run are read, so an update costs time in proportion
+to the new preferences rather than to every preference ever recorded. Deleted preferences are not
+taken back out of the scores, so a rebuild now and then replays every preference from scratch.
+Each run reads the preferences created in a half-open window of creation times, from the end of
+the last run's window to a minute before now by the database's clock, so no preference is read
+by two runs. A rebuild reads every preference by ranges of ordinals instead, through the ordinal
+index, as the preferences from before creation times were recorded share no order to page by.
+
+Scores are stored on the item nodes, and pages of the ranking are cached under a version which
+is bumped after every update. Only one run reads, applies and records its window at a time, under
+a lock held in the cache, so two runs which overlap never both apply the same preferences.'''
+import logging
+from secrets import token_hex
+from time import time_ns
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from neomodel import db
+from . import queries
+from .connection import run_in_auto_commit
+from .ordinals import ordinal_count
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'PREFERENCES_CONSENSUS_BATCH_SIZE', 100000)
+# How many items have their preferences read by each query of a rebuild
+ORDINAL_BATCH_SIZE = getattr(settings, 'PREFERENCES_CONSENSUS_ORDINAL_BATCH_SIZE', 1000)
+RESULT_TIMEOUT = getattr(settings, 'PREFERENCES_CONSENSUS_CACHE_TIMEOUT', 60 * 60)
+# How far each item's score moves for a completely surprising batch
+K_FACTOR = 0.5
+# Preferences are only read once they are this old, so none are missed by a transaction still committing
+SETTLE_MS = 60 * 1000
+REBUILD_EPOCHS = 3
+# A run which has not finished after this long is taken to have died, and its lock is given up
+LOCK_TIMEOUT = getattr(settings, 'PREFERENCES_CONSENSUS_LOCK_TIMEOUT', 60 * 60)
+
+_VERSION_KEY = 'preferences:consensus:version'
+_LOCK_KEY = 'preferences:consensus:lock'
+
+
+def consensus_version() -> int:
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        # Start from the current time rather than zero so a lost version never matches old entries
+        cache.add(_VERSION_KEY, time_ns(), timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate_consensus():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.add(_VERSION_KEY, time_ns(), timeout=None)
+
+
+def get_or_set_for_consensus(name: str, compute):
+    '''Returns the cached result of compute for the current consensus version, computing it on a miss'''
+    key = f'preferences:consensus:{consensus_version()}:{name}'
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout=RESULT_TIMEOUT)
+    return result
+
+
+def update_scores(scores: np.ndarray, counts: np.ndarray, winners: np.ndarray, losers: np.ndarray,
+                  k: float = K_FACTOR) -> np.ndarray:
+    '''Moves the scores in place towards a batch of games, returning the number of games each item played
+
+    Every game in the batch is scored against the scores from before the batch, so items which play
+    many games in one batch move by their average surprise rather than overshooting'''
+    n = len(scores)
+    surprise = 1.0 / (1.0 + np.exp(scores[winners] - scores[losers]))
+    delta = np.bincount(winners, surprise, n) - np.bincount(losers, surprise, n)
+    games = np.bincount(winners, minlength=n) + np.bincount(losers, minlength=n)
+
+    played = games > 0
+    scores[played] += k * delta[played] / games[played]
+    counts += games
+    return games
+
+
+def _edge_arrays(results) -> tuple[np.ndarray, np.ndarray]:
+    edges = np.array([row[:2] for row in results if row[0] is not None and row[1] is not None],
+                     dtype=np.int64).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+
+def iter_preference_edges(since: int, until: int, batch_size: int = BATCH_SIZE):
+    '''Yields the winner and loser ordinals of each page of preferences created after since, up to and including until'''
+    after = None
+    while True:
+        results, _ = db.cypher_query(queries.LIST_PREFERENCE_EDGES_PAGE,
+                                     {'since': since, 'until': until, 'after': after, 'limit': batch_size})
+        if not results:
+            return
+
+        yield _edge_arrays(results)
+
+        after = results[-1][2:]
+        if len(results) < batch_size:
+            return
+
+
+def iter_all_preference_edges(size: int, until: int, ordinal_batch_size: int = ORDINAL_BATCH_SIZE):
+    '''Yields the winner and loser ordinals of every preference created up to until, a range of winners at a time'''
+    for first in range(0, size, ordinal_batch_size):
+        results, _ = db.cypher_query(queries.LIST_PREFERENCE_EDGES_BY_ORDINAL,
+                                     {'first': first, 'last': first + ordinal_batch_size, 'until': until})
+        if results:
+            yield _edge_arrays(results)
+
+
+def _load_scores(size: int) -> tuple[np.ndarray, np.ndarray]:
+    scores, counts = np.zeros(size), np.zeros(size, dtype=np.int64)
+    results, _ = db.cypher_query(queries.LIST_CONSENSUS_SCORES)
+    for ordinal, score, count in results:
+        if ordinal is not None and ordinal < size:
+            scores[ordinal], counts[ordinal] = score, count or 0
+    return scores, counts
+
+
+def _save_scores(scores: np.ndarray, counts: np.ndarray, ordinals: np.ndarray, batch_size: int):
+    rows = [[int(ordinal), float(scores[ordinal]), int(counts[ordinal])] for ordinal in ordinals]
+    for start in range(0, len(rows), batch_size):
+        db.cypher_query(queries.SET_CONSENSUS_SCORES, {'scores': rows[start:start + batch_size]})
+
+
+def refresh_consensus(rebuild: bool = False, batch_size: int = BATCH_SIZE) -> int:
+    '''Updates the consensus scores with every preference created since the last run, returning how many were read
+
+    With rebuild, the scores are reset and fitted again over every preference, several times over.
+    If another run is still going, nothing is done and None is returned.'''
+    token = token_hex(8)
+    if not cache.add(_LOCK_KEY, token, timeout=LOCK_TIMEOUT):
+        logger.info('Skipped updating the consensus, as another update is running')
+        return None
+
+    try:
+        return _refresh_consensus(rebuild, batch_size)
+    finally:
+        # Leave the lock alone if it timed out and another run has taken it since
+        if cache.get(_LOCK_KEY) == token:
+            cache.delete(_LOCK_KEY)
+
+
+def _refresh_consensus(rebuild: bool, batch_size: int) -> int:
+    db.cypher_query(queries.CREATE_PREFERENCE_CREATED_INDEX)
+    results, _ = db.cypher_query(queries.GET_CONSENSUS_STATE, {'settle_ms': SETTLE_MS})
+    since, until = results[0]
+
+    size = ordinal_count()
+    if rebuild:
+        run_in_auto_commit(queries.CLEAR_CONSENSUS_SCORES)
+        scores, counts = np.zeros(size), np.zeros(size, dtype=np.int64)
+        epochs = REBUILD_EPOCHS
+    else:
+        scores, counts = _load_scores(size)
+        epochs = 1
+    touched = np.zeros(size, dtype=bool)
+
+    read = 0
+    for epoch in range(epochs):
+        edges = iter_all_preference_edges(size, until) if rebuild else iter_preference_edges(since, until, batch_size)
+        for winners, losers in edges:
+            # Items given ordinals after they were counted have no scores to move
+            current = (winners < size) & (losers < size)
+            winners, losers = winners[current], losers[current]
+            games = update_scores(scores, counts, winners, losers)
+            touched |= games > 0
+            if epoch == 0:
+                read += len(winners)
+
+    if rebuild and epochs > 1:
+        # Each preference was replayed once per epoch, but is still only one game
+        counts //= epochs
+
+    _save_scores(scores, counts, np.flatnonzero(touched), batch_size)
+    db.cypher_query(queries.SET_CONSENSUS_STATE, {'until': until})
+    invalidate_consensus()
+
+    logger.info('Updated the consensus of %d items from %d preferences', touched.sum(), read)
+    return read
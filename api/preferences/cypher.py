@@ -1,250 +1,542 @@
+import json
 from random import sample
+from secrets import token_hex
+from typing import NamedTuple
 from .models import Item, Ranker
+from .graph import PreferenceGraph
+from . import queries
+from .queries import for_item_class, for_ranker_class
+from .cache import freeze_node, get_or_set_for_ranker, invalidate_ranker, thaw_node
+from .membership import UNDEFINED, get_membership, item_statuses
+from .ordinals import forget_ordinals, ordinal_count, ordinals_for_new_items
+from .consensus import get_or_set_for_consensus
+from .popularity import get_popularity
+from .sampling import candidate_ordinals, get_order
+from .connection import read_transaction, write_transaction
 from neomodel import db
+from rest_framework.exceptions import NotFound
+
+
+def _read(query: str, params: dict = None):
+    # Reads run in a read only transaction, which a cluster routes to a read replica
+    with read_transaction():
+        return db.cypher_query(query, params)
+
 
 # Boolean checks
+# Both are answered from the ranker's cached membership index, without a query once it is built
 def ranker_knows_item(ranker: Ranker, item: Item) -> bool:
-    return item in ranker.known_items.all()
+    return item_statuses(ranker.ranker_id, [item.item_id])[item.item_id] is True
+
 
 def ranker_does_not_know_item(ranker: Ranker, item: Item) -> bool:
-    return item in ranker.unknown_items.all()
+    return item_statuses(ranker.ranker_id, [item.item_id])[item.item_id] is False
+
+
+def ranker_knows_status(ranker: Ranker, item: Item):
+    '''True if the ranker knows the item, False if they do not, or 'undefined' if they have not said'''
+    return item_statuses(ranker.ranker_id, [item.item_id]).get(item.item_id, UNDEFINED)
+
 
 def direct_preference_exists(ranker: Ranker, preferred: Item, nonpreferred: Item):
-    return nonpreferred in preferred.preferred_to_items.match(by=ranker.ranker_id)
+    results, _ = _read(queries.DIRECT_PREFERENCE_EXISTS,
+                       {'ranker_id': ranker.ranker_id,
+                        'preferred_id': preferred.item_id,
+                        'nonpreferred_id': nonpreferred.item_id})
+    return results[0][0]
+
+
+def find_existing_item_ids(item_class, item_ids: list[str]) -> set[str]:
+    results, _ = _read(for_item_class(queries.FIND_EXISTING_ITEM_IDS, item_class),
+                       {'item_ids': list(set(item_ids))})
+    return {row[0] for row in results}
+
 
 # Create operations
-def insert_ranker_knows(ranker: Ranker, known_items: list[Item], unknown_items: list[Item]):   
-    if known_items:
-        with db.transaction:
-            # Remove that they do not know each item
-            query = "MATCH (r)-[d:DOES_NOT_KNOW]->(i) "
-            query += f"WHERE r.ranker_id='{ranker.ranker_id}' "
-            query += f"AND i.item_id IN {[item.item_id for item in known_items]} "
-            query += f"DELETE d"
-            db.cypher_query(query)
-
-            # Add that they do know each item
-            query = "MATCH (r), (i) "
-            query += f"WHERE r.ranker_id='{ranker.ranker_id}' "
-            query += f"AND i.item_id IN {[item.item_id for item in known_items]} "
-            query += f"MERGE (r)-[:KNOWS]->(i)"
-            db.cypher_query(query)
-
-    if unknown_items:
-        with db.transaction:
-            # Delete any existing preferences or queued comparisons
-            query = "MATCH (i)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY]-() "
-            query += f"WHERE pc.by='{ranker.ranker_id}' "
-            query += f"AND i.item_id IN {[item.item_id for item in unknown_items]} "
-            query += f"DELETE pc"
-            db.cypher_query(query)
-
-            # Remove that they know each item
-            query = "MATCH (r)-[k:KNOWS]->(i) "
-            query += f"WHERE r.ranker_id='{ranker.ranker_id}' "
-            query += f"AND i.item_id IN {[item.item_id for item in unknown_items]} "
-            query += f"DELETE k"
-            db.cypher_query(query)
-
-            # Add that they do not know each item
-            query = "MATCH (r), (i) "
-            query += f"WHERE r.ranker_id='{ranker.ranker_id}' "
-            query += f"AND i.item_id IN {[item.item_id for item in unknown_items]} "
-            query += f"MERGE (r)-[:DOES_NOT_KNOW]->(i)"            
-            db.cypher_query(query)
-
-def insert_preferences(ranker: Ranker, new_preferences: list[tuple[Item,Item]]):
-    warnings = []
-
-    for preferred, nonpreferred in new_preferences:
-        with db.transaction:
-            # If this preference were a queued comparison, we remove that comparison from the queue
-            # We delete this comparison even if the preference is invalid (so that invalid comparisons are no longer queued)
-            query = "MATCH (i)-[r:COMPARE_WITH_BY]-(j) "
-            query += f"WHERE i.item_id='{preferred.item_id}' AND j.item_id='{nonpreferred.item_id}' AND r.by='{ranker.ranker_id}' "
-            query += "DELETE r"
-            db.cypher_query(query)
-
-            query = "MATCH (i), (u), (j) "
-            query += f"WHERE (i.item_id='{preferred.item_id}') AND (u.ranker_id='{ranker.ranker_id}') AND (j.item_id='{nonpreferred.item_id}') "
-            query += "AND EXISTS((i)<-[:KNOWS]-(u)-[:KNOWS]->(j))"
-            query += f"AND NOT EXISTS((i)<-[:PREFERRED_TO_BY* {{by:'{ranker.ranker_id}'}}]-(j)) "
-            query += f"MERGE (i)-[:PREFERRED_TO_BY {{by:'{ranker.ranker_id}'}}]->(j)"
-            query += f"RETURN size((i)-[:PREFERRED_TO_BY {{by:'{ranker.ranker_id}'}}]->(j))=1"
-            results, _ = db.cypher_query(query)
-            if not results or not results[0][0]:
-                warnings.append(f'Cound not insert preference {preferred.item_id}, {nonpreferred.item_id}')
-    
-    return warnings
+def insert_items(item_class, items: list[dict]):
+    '''Creates or updates an item node for each dict of properties, which must include item_id
+
+    New items are each given the next free ordinal, and existing items keep theirs'''
+    item_ids = [item['item_id'] for item in items]
+    with write_transaction():
+        ordinals = ordinals_for_new_items(item_ids)
+        db.cypher_query(for_item_class(queries.MERGE_ITEMS, item_class),
+                        {'items': [{'properties': item, 'ordinal': ordinals.get(item['item_id'])} for item in items]})
+
+        # Rankers who know an updated item have its old properties in their cached lists and filters
+        results, _ = db.cypher_query(queries.RANKERS_KNOWING_ITEMS, {'item_ids': item_ids})
+
+    # An item created again after a delete that went around delete_item_ids may still have its old ordinal cached
+    forget_ordinals(list(ordinals))
+    for ranker_id, _ in results:
+        invalidate_ranker(ranker_id)
+
+
+def insert_rankers(ranker_class, ranker_ids: list[str]):
+    '''Creates a ranker node for each id which does not have one yet'''
+    with write_transaction():
+        db.cypher_query(for_ranker_class(queries.MERGE_RANKERS, ranker_class), {'ranker_ids': ranker_ids})
+
+    for ranker_id in ranker_ids:
+        invalidate_ranker(ranker_id)
+
+
+def insert_ranker_knows(ranker: Ranker, known_items: list[Item], unknown_items: list[Item]):
+    insert_ranker_knows_ids(ranker,
+                            known_ids=[item.item_id for item in known_items],
+                            unknown_ids=[item.item_id for item in unknown_items])
+
+
+def insert_ranker_knows_ids(ranker: Ranker, known_ids: list[str], unknown_ids: list[str]) -> list[str]:
+    '''Marks items as known or unknown by id, returning any ids which have no item'''
+    found = set()
+
+    with write_transaction():
+        if known_ids:
+            # Remove that they do not know each item and add that they do know it, with no descendants yet
+            results, _ = db.cypher_query(queries.MARK_KNOWN, {'ranker_id': ranker.ranker_id, 'item_ids': known_ids})
+            found.update(row[0] for row in results)
+
+        if unknown_ids:
+            # Lock the ranker, as removing preferences changes the descendant counts of anything preferred to these items
+            db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+            graph = PreferenceGraph.load(ranker.ranker_id)
+            counts = graph.forget(unknown_ids)
+
+            # Remove any preferences, queued comparisons and knowledge of each item, and add that they do not know it
+            results, _ = db.cypher_query(queries.MARK_UNKNOWN, {'ranker_id': ranker.ranker_id, 'item_ids': unknown_ids})
+            found.update(row[0] for row in results)
+
+            _set_descendant_counts(ranker.ranker_id, counts)
+
+    invalidate_ranker(ranker.ranker_id)
+    return sorted(set(known_ids).union(unknown_ids).difference(found))
+
+
+PREFERENCE_WARNING = 'Cound not insert preference {}, {}'
+
+
+class InsertedPreferences(NamedTuple):
+    # Whether each preference was inserted, in the order given
+    accepted: list[bool]
+    warnings: list[str]
+
+
+def insert_preferences(ranker: Ranker, new_preferences: list[tuple[Item,Item]]) -> InsertedPreferences:
+    pairs = [(preferred.item_id, nonpreferred.item_id) for preferred, nonpreferred in new_preferences]
+    accepted = insert_preference_ids(ranker, pairs)
+
+    warnings = [PREFERENCE_WARNING.format(preferred_id, nonpreferred_id)
+                for (preferred_id, nonpreferred_id), ok in zip(pairs, accepted) if not ok]
+    return InsertedPreferences(accepted, warnings)
+
+
+def insert_preference_ids(ranker: Ranker, pairs: list[tuple[str,str]]) -> list[bool]:
+    accepted = []
+
+    with write_transaction():
+        # Lock the ranker so that concurrent requests cannot each insert one half of a cycle
+        db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+
+        # Check every new preference against the ranker's DAG in memory, in order
+        graph = PreferenceGraph.load(ranker.ranker_id)
+        accepted = [graph.try_insert(preferred_id, nonpreferred_id) for preferred_id, nonpreferred_id in pairs]
+        inserted = [[preferred_id, nonpreferred_id]
+                    for (preferred_id, nonpreferred_id), ok in zip(pairs, accepted) if ok]
+
+        # If any preference were a queued comparison, we remove that comparison from the queue
+        # We delete this comparison even if the preference is invalid (so that invalid comparisons are no longer queued)
+        db.cypher_query(queries.DELETE_QUEUED_PAIRS,
+                        {'ranker_id': ranker.ranker_id, 'pairs': [list(pair) for pair in pairs]})
+
+        if inserted:
+            db.cypher_query(queries.MERGE_PREFERENCE_PAIRS, {'ranker_id': ranker.ranker_id, 'pairs': inserted})
+
+            # Only the newly preferred items and their ancestors gain descendants
+            counts = graph.descendant_counts([preferred_id for preferred_id, _ in inserted])
+            _set_descendant_counts(ranker.ranker_id, counts)
+
+    invalidate_ranker(ranker.ranker_id)
+    return accepted
 
 
 def insert_queued_compares(ranker: Ranker, new_queued: list[tuple[Item,Item]]):
-    inserted_count = 0
-
-    for left, right in new_queued:
-        query = "MATCH (i), (u), (j) "
-        query += f"WHERE (i.item_id='{left.item_id}') AND (u.ranker_id='{ranker.ranker_id}') AND (j.item_id='{right.item_id}') "
-        query += "AND EXISTS((i)<-[:KNOWS]-(u)-[:KNOWS]->(j))"
-        query += f"AND NOT EXISTS((i)-[:PREFERRED_TO_BY|COMPARE_WITH_BY* {{by:'{ranker.ranker_id}'}}]->(j)) "
-        query += f"AND NOT EXISTS((i)<-[:PREFERRED_TO_BY|COMPARE_WITH_BY* {{by:'{ranker.ranker_id}'}}]-(j)) "
-        query += f"MERGE (i)-[:COMPARE_WITH_BY {{by:'{ranker.ranker_id}'}}]->(j) "
-        query += f"MERGE (i)<-[:COMPARE_WITH_BY {{by:'{ranker.ranker_id}'}}]-(j) "
-        query += f"RETURN size((i)-[:COMPARE_WITH_BY {{by:'{ranker.ranker_id}'}}]-(j))=2"
-        results, _ = db.cypher_query(query)
-        if results and results[0][0]:
-            inserted_count += 1
-    
-    return inserted_count
-       
+    with write_transaction():
+        # Lock the ranker so that concurrent requests cannot queue conflicting comparisons
+        db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+
+        # Check every comparison against the ranker's partial order in memory, in order, then queue them all at once
+        graph = PreferenceGraph.load(ranker.ranker_id)
+        queued = [[left.item_id, right.item_id] for left, right in new_queued
+                  if graph.try_queue(left.item_id, right.item_id)]
+        if queued:
+            db.cypher_query(queries.MERGE_QUEUED_PAIRS, {'ranker_id': ranker.ranker_id, 'pairs': queued})
+
+    invalidate_ranker(ranker.ranker_id)
+    return len(queued)
+
 
 # Retrieve operations
+class ItemFilter(NamedTuple):
+    '''Only matches items whose property shares any of a list of values ('any'), or is at least ('gte')
+    or at most ('lte') a value'''
+    property: str
+    op: str
+    value: object
+
+
+def _filter_params(filters: list[ItemFilter]) -> list[dict]:
+    return [item_filter._asdict() for item_filter in filters or []]
+
+
+class Page(NamedTuple):
+    results: list
+    # The sort key of the last result, if there are more results after it
+    after: list = None
+
+
+def _cache_name(name: str, item_class, *args) -> str:
+    return ':'.join([name, *item_class.inherited_labels(), *map(json.dumps, args)])
+
+
+def _project(projection: dict, values: list) -> dict:
+    return dict(zip(projection.keys(), values))
+
+
+def _read_page(ranker: Ranker, item_class, name: str, statement: str, after: list, limit: int, item_count: int,
+               projection: dict = None, filters: list[ItemFilter] = None) -> Page:
+    # Each row holds item_count items followed by its sort key
+    # One extra row is read to find out whether there is another page
+    # Projected items are read as the values of only the projected properties, and never inflated
+    def _query():
+        results, _ = _read(for_item_class(statement, item_class, projected=projection is not None),
+                           {'ranker_id': ranker.ranker_id, 'after': after, 'limit': limit + 1,
+                            'fields': list(projection.values()) if projection is not None else None,
+                            'filters': _filter_params(filters)})
+        if projection is not None:
+            return [([_project(projection, values) for values in row[:item_count]], list(row[item_count:]))
+                    for row in results]
+        return [([freeze_node(node) for node in row[:item_count]], list(row[item_count:])) for row in results]
+
+    rows = get_or_set_for_ranker(ranker.ranker_id, _cache_name(name, item_class, after, limit, projection, filters),
+                                 _query)
+
+    if projection is not None:
+        results = [items for items, _ in rows[:limit]]
+    else:
+        results = [[thaw_node(item_class, node) for node in nodes] for nodes, _ in rows[:limit]]
+    return Page(results, rows[limit - 1][1] if len(rows) > limit else None)
+
+
 def get_direct_preferences(ranker: Ranker, item_class) -> list[tuple[Item, Item]]:
-    item_labels = ':'.join(item_class.inherited_labels())
+    def _query():
+        results, _ = _read(for_item_class(queries.GET_DIRECT_PREFERENCES, item_class),
+                           {'ranker_id': ranker.ranker_id})
+        return [(freeze_node(row[0]), freeze_node(row[1])) for row in results]
+
+    rows = get_or_set_for_ranker(ranker.ranker_id, _cache_name('preferences', item_class), _query)
+    return [(thaw_node(item_class, i), thaw_node(item_class, j)) for i, j in rows]
 
-    query = f"MATCH (i:{item_labels})-[r:PREFERRED_TO_BY]->(j:{item_labels}) "
-    query += f"WHERE r.by='{ranker.ranker_id}'"
-    query += "RETURN i,j"
 
-    results, _ = db.cypher_query(query)
-    return [(item_class.inflate(row[0]), item_class.inflate(row[1])) for row in results]
+def get_direct_preferences_page(ranker: Ranker, item_class, after: list = None, limit: int = 100,
+                                projection: dict = None) -> Page:
+    page = _read_page(ranker, item_class, 'preferences-page', queries.GET_DIRECT_PREFERENCES_PAGE, after, limit, 2,
+                      projection=projection)
+    return Page([tuple(pair) for pair in page.results], page.after)
 
 
-def topological_sort(ranker: Ranker, item_class):
-    item_labels = ':'.join(item_class.inherited_labels())
+def topological_sort(ranker: Ranker, item_class, filters: list[ItemFilter] = None):
+    _fill_missing_descendant_counts(ranker)
 
-    query = f"MATCH (:Ranker {{ranker_id:'{ranker.ranker_id}'}})-[:KNOWS]->(i:{item_labels}) "
-    query += "RETURN i "
-    query += f"ORDER BY size([(i)-[:PREFERRED_TO_BY*{{by:'{ranker.ranker_id}'}}]->(j:{item_labels}) | j.item_id]) DESC"
+    def _query():
+        results, _ = _read(for_item_class(queries.TOPOLOGICAL_SORT, item_class),
+                           {'ranker_id': ranker.ranker_id, 'filters': _filter_params(filters)})
+        return [freeze_node(row[0]) for row in results]
 
-    results, _ = db.cypher_query(query)
-    return [item_class.inflate(row[0]) for row in results]
+    rows = get_or_set_for_ranker(ranker.ranker_id, _cache_name('sort', item_class, filters), _query)
+    return [thaw_node(item_class, row) for row in rows]
 
 
-def list_queued_compares(ranker: Ranker, item_class, limit=None):
-    item_labels = ':'.join(item_class.inherited_labels())
+def topological_sort_page(ranker: Ranker, item_class, after: list = None, limit: int = 100,
+                          projection: dict = None, filters: list[ItemFilter] = None) -> Page:
+    _fill_missing_descendant_counts(ranker)
+    page = _read_page(ranker, item_class, 'sort-page', queries.TOPOLOGICAL_SORT_PAGE, after, limit, 1,
+                      projection=projection, filters=filters)
+    return Page([item for item, in page.results], page.after)
 
-    # Get any existing comparisons to be made
-    query = f"MATCH (u)-[:KNOWS]->(i:{item_labels})-[r:COMPARE_WITH_BY]->(j:{item_labels})<-[:KNOWS]-(u) "
-    query += f"WHERE r.by='{ranker.ranker_id}' "
-    query += f"AND id(i) < id(j) "  # Don't double-count
-    query += "RETURN i,j"
 
-    # Limit if needed
-    if limit is not None:
-        query += f" LIMIT {limit}"
+def list_known_items_page(ranker: Ranker, item_class, after: list = None, limit: int = 100,
+                          projection: dict = None) -> Page:
+    page = _read_page(ranker, item_class, 'knows-page', queries.LIST_KNOWN_ITEMS_PAGE, after, limit, 1,
+                      projection=projection)
+    return Page([item for item, in page.results], page.after)
 
-    results, _ = db.cypher_query(query)
+
+def list_queued_compares(ranker: Ranker, item_class, limit=None, filters: list[ItemFilter] = None):
+    def _query():
+        # Get any existing comparisons to be made, limited if needed
+        if limit is None:
+            query = for_item_class(queries.LIST_QUEUED_COMPARES, item_class)
+        else:
+            query = for_item_class(queries.LIST_QUEUED_COMPARES_LIMIT, item_class)
+
+        results, _ = _read(query, {'ranker_id': ranker.ranker_id, 'limit': limit,
+                                   'filters': _filter_params(filters)})
+        return [(freeze_node(row[0]), freeze_node(row[1])) for row in results]
+
+    rows = get_or_set_for_ranker(ranker.ranker_id, _cache_name('queue', item_class, limit, filters), _query)
 
     # Present each comparison in a random order
     output = []
-    for row in results:
-        left, right = item_class.inflate(row[0]), item_class.inflate(row[1])
+    for i, j in rows:
+        left, right = thaw_node(item_class, i), thaw_node(item_class, j)
         pair = sample([left, right],2)
         output.append(tuple(pair))
     return output
 
 
-def get_random_possible_queued_compares(ranker: Ranker, item_class, limit=10):
-    item_labels = ':'.join(item_class.inherited_labels())
+def list_queued_compares_page(ranker: Ranker, item_class, after: list = None, limit: int = 100,
+                              projection: dict = None, filters: list[ItemFilter] = None) -> Page:
+    page = _read_page(ranker, item_class, 'queue-page', queries.LIST_QUEUED_COMPARES_PAGE, after, limit, 2,
+                      projection=projection, filters=filters)
 
-    query = f"MATCH (i:{item_labels})<-[:KNOWS]-(u)-[:KNOWS]->(j:{item_labels}) "
-    query += f"WHERE u.ranker_id='{ranker.ranker_id}' "
-    query += "AND id(i) < id(j) "
-    query += f"AND NOT EXISTS((i)-[:PREFERRED_TO_BY|COMPARE_WITH_BY* {{by:'{ranker.ranker_id}'}}]->(j)) "
-    query += f"AND NOT EXISTS((i)<-[:PREFERRED_TO_BY|COMPARE_WITH_BY* {{by:'{ranker.ranker_id}'}}]-(j)) "
-    query += f"WITH i,j, rand() as r "
-    query += "ORDER BY r "
-    query += "RETURN i,j"
-    if limit is not None:
-        query += f" LIMIT {limit}"
-
-    results, _ = db.cypher_query(query)
-
-    return [(item_class.inflate(row[0]), item_class.inflate(row[1])) for row in results]
+    # Present each comparison in a random order
+    return Page([tuple(sample(pair, 2)) for pair in page.results], page.after)
 
 
 def populate_queued_compares(ranker: Ranker, item_class, max_created=10):
-    created = 0
-    to_attempt = get_random_possible_queued_compares(ranker, item_class, limit=max_created)
-
-    while to_attempt and created < max_created:
-        created += insert_queued_compares(ranker, to_attempt)
-        to_attempt = get_random_possible_queued_compares(ranker, item_class, limit=max_created-created)
-    
-
-def list_undefined_known_items(ranker: Ranker, item_class, limit=100):
-    item_labels = ':'.join(item_class.inherited_labels())
-
-    query = f"MATCH (r:Ranker), (i:{item_labels}) "
-    query += f"WHERE r.ranker_id='{ranker.ranker_id}' "
-    query += "AND NOT EXISTS((r)-[:KNOWS]->(i)) " 
-    query += "AND NOT EXISTS((r)-[:DOES_NOT_KNOW]->(i)) "
-    query += "WITH i, rand() as x "
-    query += f"ORDER BY x LIMIT {limit} "
-    query += "RETURN i"
-    results, _ = db.cypher_query(query)
-
-    return [item_class.inflate(row[0]) for row in results]
+    with write_transaction():
+        # Lock the ranker so that concurrent requests cannot queue conflicting comparisons
+        db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+
+        # Choose the comparisons in memory from the partial order, then queue them all at once
+        graph = PreferenceGraph.load(ranker.ranker_id)
+        proposed = graph.propose_comparisons(max_created)
+        if proposed:
+            db.cypher_query(queries.MERGE_QUEUED_PAIRS,
+                            {'ranker_id': ranker.ranker_id, 'pairs': [list(pair) for pair in proposed]})
+
+    invalidate_ranker(ranker.ranker_id)
+    return len(proposed)
+
+
+def list_item_properties(item_class) -> dict[str, dict]:
+    '''The properties of every item of item_class, by item id'''
+    results, _ = _read(for_item_class(queries.LIST_ITEM_PROPERTIES, item_class))
+    return {row[0]: row[1] for row in results}
+
+
+def list_ranker_ids(ranker_class) -> set[str]:
+    results, _ = _read(for_ranker_class(queries.LIST_RANKER_IDS, ranker_class))
+    return {row[0] for row in results}
+
+
+def get_items_by_ordinal(item_class, ordinals: list[int], projection: dict = None) -> dict:
+    '''The items with the given ordinals by ordinal, leaving out ordinals with no item of the class'''
+    results, _ = _read(for_item_class(queries.LIST_ITEMS_BY_ORDINAL, item_class,
+                                      projected=projection is not None),
+                       {'ordinals': ordinals,
+                        'fields': list(projection.values()) if projection is not None else None})
+    if projection is not None:
+        return {row[0]: _project(projection, row[1]) for row in results}
+    return {row[0]: item_class.inflate(row[1]) for row in results}
+
+
+def _is_discover_cursor(after: list) -> bool:
+    # A seed, then the position and ordinal of the last item read
+    return (len(after) == 3 and isinstance(after[0], str)
+            and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in after[1:])
+            and isinstance(after[2], int))
+
+
+def list_undefined_known_items(ranker: Ranker, item_class, limit=100, projection: dict = None,
+                               seed: str = None, after: list = None, weighted: bool = False,
+                               filters: list[ItemFilter] = None) -> Page:
+    '''A page of a random sample of the items the ranker has not marked known or unknown
+
+    The sample is in the order seeded by seed, or a new seed if none is given, and each page's cursor
+    holds the seed and the position of its last item, so later pages read on through the same order.
+    Weighted samples favor widely known items, once refresh_popularity has run at least once.
+    Filtered samples are read in one query which applies the filters, however few items pass them.'''
+    if after is not None:
+        if not _is_discover_cursor(after):
+            raise NotFound('Invalid cursor')
+        seed, after = after[0], after[1:]
+    elif seed is None:
+        seed = token_hex(8)
+    order = get_order(ranker.ranker_id, seed)
+
+    if filters:
+        results, _ = _read(for_item_class(queries.DISCOVER_FILTERED_PAGE, item_class, projected=projection is not None),
+                           {'ranker_id': ranker.ranker_id, 'after': after, 'limit': limit, 'weighted': weighted,
+                            'fields': list(projection.values()) if projection is not None else None,
+                            'filters': _filter_params(filters), **order.params()})
+        if projection is not None:
+            found = [_project(projection, row[0]) for row in results]
+        else:
+            found = [item_class.inflate(row[0]) for row in results]
+        return Page(found, [seed, results[-1][1], results[-1][2]] if len(results) == limit else None)
+
+    membership = get_membership(ranker.ranker_id)
+
+    count = ordinal_count()
+    popularity = get_popularity() if weighted else None
+    weights = popularity.weights(count) if popularity is not None else None
+
+    found = []
+    for chunk in candidate_ordinals(order, count, membership, after, weights=weights):
+        by_ordinal = get_items_by_ordinal(item_class, [ordinal for _, ordinal in chunk], projection)
+        for position, ordinal in chunk:
+            if ordinal in by_ordinal:
+                found.append(by_ordinal[ordinal])
+                if len(found) == limit:
+                    return Page(found, [seed, position, ordinal])
+
+    return Page(found, None)
+
+
+def consensus_page(item_class, after: list = None, limit: int = 100, projection: dict = None) -> Page:
+    '''A page of (item, score, games) rows, from the highest consensus score down'''
+    def _query():
+        results, _ = _read(for_item_class(queries.CONSENSUS_PAGE, item_class, projected=projection is not None),
+                           {'after': after, 'limit': limit + 1,
+                            'fields': list(projection.values()) if projection is not None else None})
+        if projection is not None:
+            return [(_project(projection, row[0]), row[1], row[2], list(row[2:])) for row in results]
+        return [(freeze_node(row[0]), row[1], row[2], list(row[2:])) for row in results]
+
+    rows = get_or_set_for_consensus(_cache_name('consensus-page', item_class, after, limit, projection), _query)
+
+    results = [(item if projection is not None else thaw_node(item_class, item), score, games)
+               for item, games, score, _ in rows[:limit]]
+    return Page(results, rows[limit - 1][3] if len(rows) > limit else None)
 
 
 # Delete operations
 def delete_direct_preference(ranker: Ranker, preferred: Item, nonpreferred: Item):
-    with db.transaction:
-        if not direct_preference_exists:
+    with write_transaction():
+        if not direct_preference_exists(ranker, preferred, nonpreferred):
             return 'Invalid'
 
-        query = "MATCH (i)-[r:PREFERRED_TO_BY]->(j) "
-        query += f"WHERE i.item_id='{preferred.item_id}' AND j.item_id='{nonpreferred.item_id}' AND r.by='{ranker.ranker_id}' "
-        query += "DELETE r"
-        db.cypher_query(query)
+        # Lock the ranker, as removing the preference changes the descendant counts of the preferred item and its ancestors
+        db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+        graph = PreferenceGraph.load(ranker.ranker_id)
+
+        db.cypher_query(queries.DELETE_DIRECT_PREFERENCE,
+                        {'ranker_id': ranker.ranker_id,
+                         'preferred_id': preferred.item_id,
+                         'nonpreferred_id': nonpreferred.item_id})
+
+        if graph.knows(preferred.item_id) and graph.knows(nonpreferred.item_id):
+            graph.remove_edge(graph.index[preferred.item_id], graph.index[nonpreferred.item_id])
+            _set_descendant_counts(ranker.ranker_id, graph.descendant_counts([preferred.item_id]))
+
+    invalidate_ranker(ranker.ranker_id)
 
 
 def delete_ranker_knows(ranker: Ranker, item: Item):
-    with db.transaction:
+    with write_transaction():
+        # Lock the ranker and find the new counts of everything preferred to this item before its paths are removed
+        db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+        counts = PreferenceGraph.load(ranker.ranker_id).forget([item.item_id])
+
         # Delete all direct preferences the ranker has (or has queued) for this item in both directions
-        del_preference_query = "MATCH (i:Item)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY]-() "
-        del_preference_query += f"WHERE i.item_id='{item.item_id}' AND pc.by='{ranker.ranker_id}'"
-        del_preference_query += "DELETE pc"
-        db.cypher_query(del_preference_query)
+        db.cypher_query(queries.DELETE_PAIRWISE_FOR_ITEMS,
+                        {'ranker_id': ranker.ranker_id, 'item_ids': [item.item_id]})
 
         # Then delete this KNOWS relationship
-        del_preference_query = "MATCH (r:Ranker)-[kdk:KNOWS|DOES_NOT_KNOW]->(i) "
-        del_preference_query += f"WHERE i.item_id='{item.item_id}' AND r.ranker_id='{ranker.ranker_id}'"
-        del_preference_query += "DELETE kdk"
-        db.cypher_query(del_preference_query)
+        db.cypher_query(queries.DELETE_RANKER_KNOWS,
+                        {'ranker_id': ranker.ranker_id, 'item_id': item.item_id})
+
+        _set_descendant_counts(ranker.ranker_id, counts)
+
+    invalidate_ranker(ranker.ranker_id)
 
 
 def delete_ranker(ranker: Ranker):
-    with db.transaction:
-        # Delete all preferences the ranker has (or has queued) for all items in both directions
-        del_preference_query = f"MATCH (:Item)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY]-(:Item) "
-        del_preference_query += f"WHERE pc.by = '{ranker.ranker_id}' "
-        del_preference_query += f"DELETE pc"
-        db.cypher_query(del_preference_query)
+    delete_ranker_ids([ranker.ranker_id])
+
 
-        # Delete all KNOWS and DOES_NOT_KNOW relationships the ranker has for all items
-        ranker.known_items.disconnect_all()
-        ranker.unknown_items.disconnect_all()
+def delete_ranker_ids(ranker_ids: list[str]):
+    '''Deletes every ranker with one of the given ids, ignoring any which do not exist'''
+    if not ranker_ids:
+        return
 
-        # Then delete the ranker
-        ranker.delete()
+    with write_transaction():
+        # Delete all preferences the rankers have (or have queued) for all items in both directions
+        db.cypher_query(queries.DELETE_RANKERS_PAIRWISE, {'ranker_ids': ranker_ids})
+
+        # Then delete the rankers, along with their KNOWS and DOES_NOT_KNOW relationships
+        db.cypher_query(queries.DETACH_DELETE_RANKERS, {'ranker_ids': ranker_ids})
+
+    for ranker_id in ranker_ids:
+        invalidate_ranker(ranker_id)
 
 
 def delete_item(item: Item):
-    with db.transaction:
-        # Detach item from other items (removing preferences and queued compares for all rankers)
-        # Detach item from rankers (removing known relationships)
-        # Then delete item
-        del_preference_query = f"MATCH (i:Item) "
-        del_preference_query += f"WHERE i.item_id = '{item.item_id}'"
-        del_preference_query += f"DETACH DELETE i"
-        db.cypher_query(del_preference_query)
+    delete_item_ids([item.item_id])
+
+
+def delete_item_ids(item_ids: list[str]):
+    '''Deletes every item with one of the given ids, ignoring any which do not exist'''
+    if not item_ids:
+        return
+
+    with write_transaction():
+        # Every ranker who knows these items will have their ancestors lose descendants
+        # Rankers are locked in order of id, so two deletes sharing rankers cannot deadlock
+        results, _ = db.cypher_query(queries.RANKERS_KNOWING_ITEMS, {'item_ids': item_ids})
+        affected = []
+        for ranker_id, known_ids in sorted(results):
+            db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker_id})
+            affected.append((ranker_id, PreferenceGraph.load(ranker_id).forget(known_ids)))
+
+        # Detach items from other items (removing preferences and queued compares for all rankers)
+        # Detach items from rankers (removing known relationships)
+        # Then delete items
+        db.cypher_query(queries.DETACH_DELETE_ITEMS, {'item_ids': item_ids})
+
+        for ranker_id, counts in affected:
+            _set_descendant_counts(ranker_id, counts)
+
+    forget_ordinals(item_ids)
+    for ranker_id, _ in affected:
+        invalidate_ranker(ranker_id)
 
 
 def delete_all_queued_compares(ranker: Ranker, item_class):
-    item_labels = ':'.join(item_class.inherited_labels())
+    with write_transaction():
+        db.cypher_query(for_item_class(queries.DELETE_ALL_QUEUED_COMPARES, item_class),
+                        {'ranker_id': ranker.ranker_id})
+
+    invalidate_ranker(ranker.ranker_id)
+
+
+# Descendant count index
+def _set_descendant_counts(ranker_id: str, counts: list[tuple[str, int]]):
+    db.cypher_query(queries.SET_DESCENDANT_COUNTS,
+                    {'ranker_id': ranker_id, 'counts': [list(row) for row in counts]})
+
+
+def _fill_missing_descendant_counts(ranker: Ranker):
+    # Rankers from before counts were kept would sort as if nothing had descendants, so any missing
+    # counts are stored before sorting. This is checked once for each version of the ranker
+    def _fill():
+        results, _ = _read(queries.KNOWN_ITEM_IDS_WITHOUT_DESCENDANTS, {'ranker_id': ranker.ranker_id})
+        if results:
+            with write_transaction():
+                db.cypher_query(queries.LOCK_RANKER, {'ranker_id': ranker.ranker_id})
+                graph = PreferenceGraph.load(ranker.ranker_id)
+                _set_descendant_counts(ranker.ranker_id, [(item_id, graph.descendant_count(graph.index[item_id]))
+                                                          for item_id, in results if graph.knows(item_id)])
+        return True
+
+    get_or_set_for_ranker(ranker.ranker_id, 'descendants-filled', _fill)
+
+
+def refresh_descendant_counts(ranker: Ranker):
+    '''Rebuilds the stored descendant count of every item the ranker knows'''
+    with write_transaction():
+        db.cypher_query(queries.REBUILD_DESCENDANT_COUNTS, {'ranker_id': ranker.ranker_id})
 
-    query = f"MATCH (:{item_labels})-[c:COMPARE_WITH_BY]-(:{item_labels}) "
-    query += f"WHERE c.by='{ranker.ranker_id}' "
-    query += "DELETE c"
-    db.cypher_query(query)
+    invalidate_ranker(ranker.ranker_id)
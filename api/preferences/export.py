@@ -0,0 +1,198 @@
+'''Bulk export of every ranker's edges to compact columnar files, for offline analytics
+
+Edges are streamed out of the graph a page of rankers at a time and appended to one file of
+little-endian int32 values per column, so memory stays flat however large the graph is.
+Items are encoded by their ordinal, and rankers by their position in the export, with the
+ids for both written alongside. A manifest describes every table, and read_export maps the
+columns into memory with NumPy instead of loading them.
+
+    items:        ordinal              (ids in items.txt, line n is ordinal n, blank if it has no item)
+    rankers:      index                (ids in rankers.txt, line n is ranker n)
+    knows:        ranker, item
+    unknown:      ranker, item
+    preferences:  ranker, preferred, nonpreferred
+
+Exports are written to a temporary directory and renamed once complete, so a reader never
+sees a partial export. Each is named by the time it started, to the microsecond, with a random
+suffix, so exports started at the same moment never share a directory.'''
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from secrets import token_hex
+from typing import NamedTuple
+import numpy as np
+from django.conf import settings
+from neomodel import db
+from . import queries
+from .ordinals import assign_missing_ordinals, ordinal_count
+
+logger = logging.getLogger(__name__)
+
+DTYPE = '<i4'
+RANKER_PAGE_SIZE = getattr(settings, 'GRAPH_EXPORT_RANKER_PAGE_SIZE', 1000)
+ITEM_PAGE_SIZE = 50000
+TABLES = {
+    'items': ['ordinal'],
+    'rankers': ['index'],
+    'knows': ['ranker', 'item'],
+    'unknown': ['ranker', 'item'],
+    'preferences': ['ranker', 'preferred', 'nonpreferred'],
+}
+
+
+def get_export_dir() -> Path:
+    return Path(getattr(settings, 'GRAPH_EXPORT_DIR', 'exports'))
+
+
+def iter_items(page_size: int = ITEM_PAGE_SIZE):
+    '''Yields pages of (ordinal, item_id) rows in order of ordinal'''
+    for first in range(0, ordinal_count(), page_size):
+        results, _ = db.cypher_query(queries.EXPORT_ITEMS_PAGE, {'first': first, 'last': first + page_size})
+        if results:
+            yield results
+
+
+def iter_rankers(page_size: int = RANKER_PAGE_SIZE):
+    '''Yields pages of (ranker_id, known ordinals, unknown ordinals, preferred ordinal pairs) rows in order of id'''
+    after = None
+    while True:
+        results, _ = db.cypher_query(queries.EXPORT_RANKERS_PAGE, {'after': after, 'limit': page_size})
+        if not results:
+            return
+        yield results
+        after = results[-1][0]
+
+
+class _Table:
+    '''Appends int32 columns to one file each, counting the rows written'''
+
+    def __init__(self, directory: Path, name: str):
+        self.files = {column: open(directory / f'{name}.{column}.bin', 'wb') for column in TABLES[name]}
+        self.rows = 0
+
+    def append(self, **columns):
+        lengths = {len(values) for values in columns.values()}
+        for column, values in columns.items():
+            np.asarray(values, dtype=DTYPE).tofile(self.files[column])
+        self.rows += lengths.pop()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def write_export(directory: Path = None) -> dict:
+    '''Exports every item, ranker and edge to a new directory under the export directory, returning its manifest'''
+    root = Path(directory) if directory is not None else get_export_dir()
+    # Names sort in the order the exports started
+    name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-{token_hex(4)}"
+    partial = root / f'.{name}.partial'
+    partial.mkdir(parents=True)
+
+    # Every edge is written by the ordinals at either end
+    assign_missing_ordinals()
+
+    tables = {table: _Table(partial, table) for table in TABLES}
+    try:
+        with open(partial / 'items.txt', 'w') as item_ids:
+            line = 0
+            for rows in iter_items():
+                tables['items'].append(ordinal=[row[0] for row in rows])
+                for ordinal, item_id in rows:
+                    item_ids.write('\n' * (ordinal - line) + f'{item_id}\n')
+                    line = ordinal + 1
+
+        with open(partial / 'rankers.txt', 'w') as ranker_ids:
+            for rows in iter_rankers():
+                for ranker_id, known, unknown, preferences in rows:
+                    index = tables['rankers'].rows
+                    tables['rankers'].append(index=[index])
+                    ranker_ids.write(f'{ranker_id}\n')
+                    tables['knows'].append(ranker=[index] * len(known), item=known)
+                    tables['unknown'].append(ranker=[index] * len(unknown), item=unknown)
+                    tables['preferences'].append(ranker=[index] * len(preferences),
+                                                 preferred=[pair[0] for pair in preferences],
+                                                 nonpreferred=[pair[1] for pair in preferences])
+    except Exception:
+        for table in tables.values():
+            table.close()
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    for table in tables.values():
+        table.close()
+
+    manifest = {'name': name,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'dtype': DTYPE,
+                'tables': {table: {'rows': tables[table].rows,
+                                   'columns': {column: f'{table}.{column}.bin' for column in columns}}
+                           for table, columns in TABLES.items()},
+                'ids': {'items': 'items.txt', 'rankers': 'rankers.txt'}}
+    with open(partial / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(partial, root / name)
+    logger.info('Exported %d rankers, %d items and %d preferences to %s', tables['rankers'].rows,
+                tables['items'].rows, tables['preferences'].rows, root / name)
+    return manifest
+
+
+def latest_export(directory: Path = None) -> Path:
+    '''The most recent complete export, or None if there is none'''
+    root = Path(directory) if directory is not None else get_export_dir()
+    exports = sorted(path for path in root.glob('*') if (path / 'manifest.json').exists()) if root.exists() else []
+    return exports[-1] if exports else None
+
+
+class Export(NamedTuple):
+    manifest: dict
+    # Each table's columns, mapped into memory
+    tables: dict
+
+    def columns(self, table: str) -> tuple:
+        return tuple(self.tables[table][column] for column in TABLES[table])
+
+
+def _map_column(path: Path, rows: int, dtype: str) -> np.ndarray:
+    # Memory maps can not be empty, and an empty array behaves the same
+    return np.memmap(path, dtype=dtype, mode='r', shape=(rows,)) if rows else np.zeros(0, dtype=dtype)
+
+
+def read_export(path: Path = None) -> Export:
+    '''Maps every column of an export into memory, the latest one by default'''
+    path = Path(path) if path is not None else latest_export()
+    if path is None:
+        raise FileNotFoundError('There is no graph export to read')
+
+    with open(path / 'manifest.json', 'r') as f:
+        manifest = json.load(f)
+
+    tables = {table: {column: _map_column(path / filename, info['rows'], manifest['dtype'])
+                      for column, filename in info['columns'].items()}
+              for table, info in manifest['tables'].items()}
+    return Export(manifest, tables)
+
+
+def read_ids(path: Path, name: str) -> list[str]:
+    '''The item or ranker ids of an export, indexed by item ordinal or ranker index'''
+    with open(Path(path) / f'{name}.txt', 'r') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def _export_in_background(**kwargs):
+    try:
+        write_export(**kwargs)
+    except Exception:
+        logger.exception('Background graph export failed')
+
+
+def start_export(**kwargs) -> threading.Thread:
+    '''Runs write_export in a background thread, so a request can start an export without waiting on it'''
+    thread = threading.Thread(target=_export_in_background, kwargs=kwargs, name='graph-export', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,212 @@
+from array import array
+from itertools import islice
+from neomodel import db
+from . import queries
+
+
+class PreferenceGraph:
+    '''In-memory copy of a single ranker's preference DAG
+
+    Each known item is given an integer index, and preferences are stored as arrays of indices
+    so that reachability can be checked without any further queries to the database.
+    Queued comparisons are kept separately, in both directions, as they have no preferred item yet.'''
+
+    def __init__(self, ranker_id: str, item_ids: list[str], edges: list[tuple[str, str]],
+                 compares: list[tuple[str, str]] = (), stored_counts: list[int] = None):
+        self.ranker_id = ranker_id
+        self.item_ids = list(item_ids)
+        self.index = {item_id: n for n, item_id in enumerate(self.item_ids)}
+        self.children = [array('i') for _ in self.item_ids]
+        self.parents = [array('i') for _ in self.item_ids]
+        self.compares = [array('i') for _ in self.item_ids]
+        self.stored_counts = list(stored_counts) if stored_counts is not None else [0] * len(self.item_ids)
+
+        # Preferences only exist between known items, but skip any left behind on an unknown one
+        for preferred_id, nonpreferred_id in edges:
+            if self.knows(preferred_id) and self.knows(nonpreferred_id):
+                self.add_edge(self.index[preferred_id], self.index[nonpreferred_id])
+
+        for left_id, right_id in compares:
+            if self.knows(left_id) and self.knows(right_id):
+                self.add_compare(self.index[left_id], self.index[right_id])
+
+    @classmethod
+    def load(cls, ranker_id: str):
+        '''Loads the ranker's known items, preferences and queued comparisons in a single query'''
+        results, _ = db.cypher_query(queries.LOAD_PREFERENCE_GRAPH, {'ranker_id': ranker_id})
+
+        item_ids = [row[0] for row in results]
+        stored_counts = [row[1] or 0 for row in results]
+        edges = [(row[0], nonpreferred_id) for row in results for nonpreferred_id in row[2]]
+        compares = [(row[0], compare_id) for row in results for compare_id in row[3]]
+        return cls(ranker_id, item_ids, edges, compares=compares, stored_counts=stored_counts)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def knows(self, item_id: str) -> bool:
+        return item_id in self.index
+
+    def has_edge(self, u: int, v: int) -> bool:
+        return v in self.children[u]
+
+    def add_edge(self, u: int, v: int):
+        if not self.has_edge(u, v):
+            self.children[u].append(v)
+            self.parents[v].append(u)
+
+    def remove_edge(self, u: int, v: int):
+        if self.has_edge(u, v):
+            self.children[u].remove(v)
+            self.parents[v].remove(u)
+
+    def add_compare(self, u: int, v: int):
+        if v not in self.compares[u]:
+            self.compares[u].append(v)
+            self.compares[v].append(u)
+
+    def _search(self, start: int, *neighbors: list[array], stop: int = None) -> bytearray:
+        # Depth-first search along any of the given adjacencies, returning a mask of every index
+        # reachable from start (excluding start itself). Stops early if the stop index is reached
+        visited = bytearray(len(self.item_ids))
+        stack = [n for adjacency in neighbors for n in adjacency[start]]
+        while stack:
+            n = stack.pop()
+            if visited[n]:
+                continue
+            visited[n] = 1
+            if n == stop:
+                break
+            for adjacency in neighbors:
+                stack.extend(adjacency[n])
+        return visited
+
+    def reaches(self, u: int, v: int) -> bool:
+        '''True if u is preferred to v, directly or indirectly'''
+        return bool(self._search(u, self.children, stop=v)[v])
+
+    def descendants(self, u: int) -> list[int]:
+        return [n for n, seen in enumerate(self._search(u, self.children)) if seen]
+
+    def ancestors(self, u: int) -> list[int]:
+        return [n for n, seen in enumerate(self._search(u, self.parents)) if seen]
+
+    def descendant_count(self, u: int) -> int:
+        return sum(self._search(u, self.children))
+
+    def try_insert(self, preferred_id: str, nonpreferred_id: str) -> bool:
+        '''Adds the preference if both items are known and it would not create a cycle'''
+        if not (self.knows(preferred_id) and self.knows(nonpreferred_id)):
+            return False
+
+        u, v = self.index[preferred_id], self.index[nonpreferred_id]
+        if u == v or self.reaches(v, u):
+            return False
+
+        self.add_edge(u, v)
+        return True
+
+    def remove_compare(self, u: int, v: int):
+        if v in self.compares[u]:
+            self.compares[u].remove(v)
+            self.compares[v].remove(u)
+
+    def forget(self, item_ids: list[str]) -> list[tuple[str, int]]:
+        '''Removes every preference and queued comparison on the given items
+
+        Returns the new descendant counts of the items which were preferred to them'''
+        forgotten = [self.index[item_id] for item_id in item_ids if self.knows(item_id)]
+
+        affected = set()
+        for u in forgotten:
+            affected.update(self.ancestors(u))
+
+        for u in forgotten:
+            for v in list(self.children[u]):
+                self.remove_edge(u, v)
+            for v in list(self.parents[u]):
+                self.remove_edge(v, u)
+            for v in list(self.compares[u]):
+                self.remove_compare(u, v)
+
+        affected.difference_update(forgotten)
+        return [(self.item_ids[u], self.descendant_count(u)) for u in sorted(affected)]
+
+    def descendant_counts(self, item_ids: list[str]) -> list[tuple[str, int]]:
+        '''Descendant counts for the given items and all of their ancestors'''
+        affected = set()
+        for item_id in item_ids:
+            u = self.index[item_id]
+            affected.add(u)
+            affected.update(self.ancestors(u))
+
+        return [(self.item_ids[u], self.descendant_count(u)) for u in sorted(affected)]
+
+    def connected(self, u: int, v: int) -> bool:
+        '''True if a path of preferences and queued comparisons joins u and v in either direction
+
+        Queuing a comparison between connected items could let some answer to the queue create a cycle'''
+        return bool(self._search(u, self.children, self.compares, stop=v)[v]
+                    or self._search(v, self.children, self.compares, stop=u)[u])
+
+    def try_queue(self, left_id: str, right_id: str) -> bool:
+        '''Queues a comparison if both items are known and either answer is guaranteed to be acyclic'''
+        if not (self.knows(left_id) and self.knows(right_id)):
+            return False
+
+        u, v = self.index[left_id], self.index[right_id]
+        if u == v or self.connected(u, v):
+            return False
+
+        self.add_compare(u, v)
+        return True
+
+    def layers(self) -> list[int]:
+        '''The length of the longest chain of preferences above each item
+
+        Items in the same layer are never comparable, so each layer is an antichain of the partial order'''
+        layer = [0] * len(self.item_ids)
+        in_degree = [len(parents) for parents in self.parents]
+        ready = [n for n, degree in enumerate(in_degree) if degree == 0]
+        while ready:
+            n = ready.pop()
+            for child in self.children[n]:
+                layer[child] = max(layer[child], layer[n] + 1)
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    ready.append(child)
+        return layer
+
+    def _candidate_comparisons(self):
+        # Items in the same layer are incomparable, and neighbours in the current sort order are the
+        # comparisons most likely to split it in half, as in a merge sort. Larger layers leave the most
+        # uncertainty so are drawn from first, then each layer is paired at increasing distances
+        layer = self.layers()
+        antichains = {}
+        for n in range(len(self.item_ids)):
+            antichains.setdefault(layer[n], []).append(n)
+
+        ordered = [sorted(members, key=lambda n: (-self.stored_counts[n], self.item_ids[n]))
+                   for members in sorted(antichains.values(), key=len, reverse=True) if len(members) > 1]
+
+        # Disjoint neighbouring pairs first, like the first round of a merge
+        for members in ordered:
+            for k in range(0, len(members) - 1, 2):
+                yield members[k], members[k + 1]
+
+        for distance in range(1, max((len(members) for members in ordered), default=0)):
+            for members in ordered:
+                for k in range(len(members) - distance):
+                    yield members[k], members[k + distance]
+
+    def propose_comparisons(self, limit: int, max_attempts: int = None) -> list[tuple[str, str]]:
+        '''Queues up to limit of the most informative comparisons, returning the item ids of each'''
+        max_attempts = max_attempts if max_attempts is not None else 50 * limit
+        proposed = []
+        for u, v in islice(self._candidate_comparisons(), max_attempts):
+            if len(proposed) >= limit:
+                break
+            if not self.connected(u, v):
+                self.add_compare(u, v)
+                proposed.append((self.item_ids[u], self.item_ids[v]))
+        return proposed
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from preferences.ordinals import assign_missing_ordinals
+
+
+class Command(BaseCommand):
+    help = 'Gives an ordinal to every item created before ordinals were assigned'
+
+    def handle(self, *args, **options):
+        count = assign_missing_ordinals()
+        self.stdout.write(f'Assigned ordinals to {count} items')
@@ -0,0 +1,36 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks import suite
+from benchmarks.timing import find_regressions, write_results
+
+
+class Command(BaseCommand):
+    help = ('Times every preferences query and movie endpoint against synthetic users, movies and preferences '
+            'at several graph sizes. Seeds and clears Postgres and Neo4j, so only run against a disposable database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=list(suite.SCALES), dest='scales',
+                            help='Graph size to run, may be repeated (default: tiny and small)')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--skip-endpoints', action='store_true')
+        parser.add_argument('--output', help='Write JSON results to this path instead of stdout')
+        parser.add_argument('--baseline', help='Fail if any median is slower than in these earlier JSON results')
+        parser.add_argument('--threshold', type=float, default=1.5,
+                            help='How many times slower than the baseline counts as a regression')
+
+    def handle(self, *args, **options):
+        results = suite.run(options['scales'] or ['tiny', 'small'], options['repeat'], seed=options['seed'],
+                            include_endpoints=not options['skip_endpoints'])
+        write_results(results, output=options['output'], stream=self.stdout)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+            regressions = find_regressions(baseline['scales'], results['scales'], options['threshold'])
+            for regression in regressions:
+                self.stderr.write(f"{regression['name']}: {regression['baseline']:.1f}ms -> "
+                                  f"{regression['result']:.1f}ms ({regression['ratio']:.2f}x)")
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
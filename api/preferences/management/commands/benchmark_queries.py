@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from benchmarks import plan_cache
+from benchmarks.timing import write_results
+
+
+class Command(BaseCommand):
+    help = ('Compares plan cache reuse and latency of the sort, queue and insert queries with and without '
+            'parameterization. Seeds synthetic rankers and items, so only run against a disposable database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rankers', type=int, default=10)
+        parser.add_argument('--items', type=int, default=500)
+        parser.add_argument('--known', type=int, default=200)
+        parser.add_argument('--preferences', type=int, default=400)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--rounds', type=int, default=2,
+                            help='Runs of each variant, each on a fresh graph, alternating which goes first')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', help='Write JSON results to this path instead of stdout')
+
+    def handle(self, *args, **options):
+        graph = {name: options[name] for name in ['rankers', 'items', 'known', 'preferences']}
+        results = plan_cache.run(graph, options['repeat'], rounds=options['rounds'], seed=options['seed'])
+
+        write_results(results, output=options['output'], stream=self.stdout)
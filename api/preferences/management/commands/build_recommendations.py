@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from preferences.export import write_export
+from preferences.recommend import BLOCK_SIZE, NEIGHBOR_COUNT, build_neighbors
+
+
+class Command(BaseCommand):
+    help = 'Finds the most similar items to every item from a graph export, for recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--export', help='Export directory to read (defaults to the latest export)')
+        parser.add_argument('--fresh', action='store_true', help='Export the graph first and read that export')
+        parser.add_argument('--neighbors', type=int, default=NEIGHBOR_COUNT, help='Neighbors kept per item')
+        parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Items compared at a time')
+
+    def handle(self, *args, **options):
+        export = options['export']
+        if options['fresh']:
+            manifest = write_export()
+            export = None
+            self.stdout.write(f'Exported {manifest["name"]}')
+
+        count = build_neighbors(export, k=options['neighbors'], block_size=options['block_size'])
+        self.stdout.write(f'Found neighbors of {count} items')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from preferences.export import write_export
+
+
+class Command(BaseCommand):
+    help = 'Writes every item, ranker and edge in the graph to compact columnar files for offline analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write the export into (defaults to GRAPH_EXPORT_DIR)')
+
+    def handle(self, *args, **options):
+        manifest = write_export(options['output'])
+        counts = ', '.join(f'{info["rows"]} {table}' for table, info in manifest['tables'].items())
+        self.stdout.write(f'Exported {manifest["name"]}: {counts}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from preferences.cypher import refresh_descendant_counts
+from preferences.models import Ranker
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored descendant counts used to topologically sort each ranker\'s items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ranker_ids', nargs='*',
+                            help='Only rebuild these rankers (defaults to all rankers)')
+
+    def handle(self, *args, **options):
+        if options['ranker_ids']:
+            rankers = Ranker.nodes.filter(ranker_id__in=options['ranker_ids'])
+        else:
+            rankers = Ranker.nodes.all()
+
+        count = 0
+        for ranker in rankers:
+            refresh_descendant_counts(ranker)
+            count += 1
+
+        self.stdout.write(f'Rebuilt descendant counts for {count} rankers')
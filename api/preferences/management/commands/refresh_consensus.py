@@ -0,0 +1,32 @@
+from time import sleep
+from django.core.management.base import BaseCommand
+from preferences.consensus import BATCH_SIZE, refresh_consensus
+
+
+class Command(BaseCommand):
+    help = 'Updates the consensus score of each item with the preferences added since the last update, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Preferences read per query')
+        parser.add_argument('--interval', type=float, default=5 * 60.0,
+                            help='Seconds to wait between updates')
+        parser.add_argument('--once', action='store_true', help='Update once and exit')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Fit the scores again from every preference, then exit')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.report(refresh_consensus(True, options['batch_size']), 'Rebuilt the consensus from {} preferences')
+            return
+
+        while True:
+            self.report(refresh_consensus(False, options['batch_size']), 'Added {} preferences to the consensus')
+            if options['once']:
+                return
+            sleep(options['interval'])
+
+    def report(self, read, message):
+        if read is None:
+            self.stdout.write('Another update of the consensus is running')
+        else:
+            self.stdout.write(message.format(read))
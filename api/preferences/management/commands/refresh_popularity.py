@@ -0,0 +1,20 @@
+from time import sleep
+from django.core.management.base import BaseCommand
+from preferences.popularity import BATCH_SIZE, refresh_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recounts how many rankers know each item, for popularity weighted discovery, repeating until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Items counted per query')
+        parser.add_argument('--interval', type=float, default=15 * 60.0,
+                            help='Seconds to wait between refreshes')
+        parser.add_argument('--once', action='store_true', help='Refresh once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write(f'Counted popularity of {refresh_popularity(options["batch_size"])} items')
+            if options['once']:
+                return
+            sleep(options['interval'])
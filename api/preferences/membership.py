@@ -0,0 +1,76 @@
+'''Which items each ranker knows and does not know, as a compact index cached per ranker
+
+The index holds the ordinals of the ranker's known and unknown items as two sorted int arrays,
+a few kilobytes for a thousand items, so any number of items are looked up with a binary search
+and no query. It is rebuilt from the graph on a cache miss, and cached under the ranker's version
+like any other result, so it is dropped as soon as the ranker marks anything known or unknown.
+Items created before ordinals were assigned are not in the index until assign_item_ordinals runs,
+so they are looked up in the graph instead.'''
+from array import array
+from bisect import bisect_left
+from typing import NamedTuple
+from neomodel import db
+from . import queries
+from .cache import get_or_set_for_ranker
+from .ordinals import get_ordinals
+
+UNDEFINED = 'undefined'
+
+
+def _contains(ordinals: array, ordinal: int) -> bool:
+    n = bisect_left(ordinals, ordinal)
+    return n < len(ordinals) and ordinals[n] == ordinal
+
+
+class Membership(NamedTuple):
+    known: array
+    unknown: array
+
+    def knows(self, ordinal: int) -> bool:
+        return _contains(self.known, ordinal)
+
+    def does_not_know(self, ordinal: int) -> bool:
+        return _contains(self.unknown, ordinal)
+
+    def status(self, ordinal: int):
+        '''True if the ranker knows the item, False if not, or 'undefined' if they have not said'''
+        if self.knows(ordinal):
+            return True
+        if self.does_not_know(ordinal):
+            return False
+        return UNDEFINED
+
+
+def load_membership(ranker_id: str) -> Membership:
+    # Items created before ordinals were assigned have none, and are left out until assign_item_ordinals runs
+    results, _ = db.cypher_query(queries.RANKER_MEMBERSHIP, {'ranker_id': ranker_id})
+    known, unknown = results[0] if results else ([], [])
+    return Membership(array('i', sorted(known)), array('i', sorted(unknown)))
+
+
+def get_membership(ranker_id: str) -> Membership:
+    return get_or_set_for_ranker(ranker_id, 'membership', lambda: load_membership(ranker_id))
+
+
+def item_statuses(ranker_id: str, item_ids: list[str]) -> dict:
+    '''Whether the ranker knows each item, by item id, as in Membership.status'''
+    membership = get_membership(ranker_id)
+    ordinals = get_ordinals(item_ids)
+    statuses = {item_id: membership.status(ordinal) for item_id, ordinal in ordinals.items()}
+
+    unnumbered = [item_id for item_id in item_ids if item_id not in ordinals]
+    if unnumbered:
+        statuses.update(_graph_statuses(ranker_id, unnumbered))
+    return {item_id: statuses.get(item_id, UNDEFINED) for item_id in item_ids}
+
+
+def _graph_statuses(ranker_id: str, item_ids: list[str]) -> dict:
+    # Read straight from the ranker's KNOWS and DOES_NOT_KNOW edges, as the index has no ordinal for these items
+    results, _ = db.cypher_query(queries.RANKER_KNOWS_ITEMS, {'ranker_id': ranker_id, 'item_ids': item_ids})
+    statuses = {}
+    for item_id, knows, does_not_know in results:
+        if knows:
+            statuses[item_id] = True
+        elif does_not_know:
+            statuses[item_id] = False
+    return statuses
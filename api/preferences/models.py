@@ -1,9 +1,11 @@
 from django_neomodel import DjangoNode
-from neomodel import StringProperty, RelationshipTo, StructuredRel
+from neomodel import IntegerProperty, StringProperty, RelationshipTo, StructuredRel
 
 
 class Preference(StructuredRel):
     by = StringProperty(required=True)
+    # Milliseconds since the epoch, so the consensus can read only the preferences added since its last run
+    created = IntegerProperty()
 
 class QueuedComparison(StructuredRel):
     by = StringProperty(required=True)
@@ -11,6 +13,11 @@ class QueuedComparison(StructuredRel):
 class Item(DjangoNode):
     '''Profile for a an item which rankes prefer over other items'''
     item_id = StringProperty(required=True, unique_index=True)
+    # Small integer id for compact indexes, assigned once when the item is created
+    ordinal = IntegerProperty(index=True)
+    # How many rankers know and do not know the item, recounted by refresh_popularity
+    known_count = IntegerProperty()
+    unknown_count = IntegerProperty()
     preferred_to_items = RelationshipTo('Item', 'PREFERRED_TO_BY', model=Preference)
     queued_compares = RelationshipTo('Item', 'COMPARE_WITH_BY', model=QueuedComparison)
     class Meta:
@@ -22,4 +29,20 @@ class Ranker(DjangoNode):
     known_items = RelationshipTo('Item', 'KNOWS')
     unknown_items = RelationshipTo('Item', 'DOES_NOT_KNOW')
     class Meta:
-        app_label = 'preferences'
\ No newline at end of file
+        app_label = 'preferences'
+
+class Sequence(DjangoNode):
+    '''A counter handed out in blocks, such as the next free item ordinal'''
+    # Unique, so concurrent MERGEs on a fresh graph can never create two sequences and reuse ordinals
+    name = StringProperty(required=True, unique_index=True)
+    next = IntegerProperty()
+    class Meta:
+        app_label = 'preferences'
+
+class Consensus(DjangoNode):
+    '''How far the consensus ranking has read through the preferences, by creation time'''
+    # Unique, so refreshes locked through different caches can never each create their own state
+    name = StringProperty(required=True, unique_index=True)
+    until = IntegerProperty()
+    class Meta:
+        app_label = 'preferences'
@@ -0,0 +1,101 @@
+'''Small integer ordinals for items, so sets of items can be held as compact sorted arrays
+
+Ordinals are reserved in blocks from a sequence node and never change while an item exists,
+so they are cached with no timeout. An item's cached ordinal is forgotten when the item is deleted
+or given a new ordinal, as it is when created again after a delete. Every cached ordinal is
+forgotten at once when the sequence itself is created, as it is after the graph has been cleared,
+by moving every key to a new epoch.
+
+Ordinals are only given out when items are inserted, by insert_items and so by graph sync, or by
+assign_missing_ordinals for items created before they were. Reading them never writes to the graph,
+and ids with no ordinal are cached for a short while too, so they are not looked up on every read.'''
+from time import time_ns
+from django.core.cache import cache
+from neomodel import db
+from . import queries
+
+EPOCH_KEY = 'preferences:ordinal:epoch'
+# Cached for ids with no item, or an item with no ordinal yet, which insert_items forgets when it numbers them
+NO_ORDINAL = -1
+NO_ORDINAL_TIMEOUT = 300
+
+
+def _epoch() -> int:
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None:
+        cache.add(EPOCH_KEY, time_ns(), timeout=None)
+        epoch = cache.get(EPOCH_KEY)
+    return epoch
+
+
+def _ordinal_key(epoch: int, item_id: str) -> str:
+    return f'preferences:ordinal:{epoch}:{item_id}'
+
+
+def forget_all_ordinals():
+    '''Drops every cached ordinal, for when items are deleted other than through delete_item_ids'''
+    try:
+        cache.incr(EPOCH_KEY)
+    except ValueError:
+        cache.add(EPOCH_KEY, time_ns(), timeout=None)
+
+
+def reserve_ordinals(count: int) -> range:
+    if count <= 0:
+        return range(0)
+
+    results, _ = db.cypher_query(queries.RESERVE_ORDINALS, {'count': count})
+    first, created = results[0]
+    if created:
+        # A new sequence starts again from zero, so any ordinals cached before it are wrong
+        forget_all_ordinals()
+    return range(first, first + count)
+
+
+def ordinal_count() -> int:
+    '''The number of ordinals reserved so far, so every item has an ordinal below it'''
+    results, _ = db.cypher_query(queries.ORDINAL_COUNT)
+    return results[0][0]
+
+
+def ordinals_for_new_items(item_ids: list[str]) -> dict[str, int]:
+    '''Reserves an ordinal for each of the items which does not have one yet'''
+    results, _ = db.cypher_query(queries.ITEM_IDS_WITH_ORDINALS, {'item_ids': item_ids})
+    numbered = {row[0] for row in results}
+    new_ids = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in numbered]
+    return dict(zip(new_ids, reserve_ordinals(len(new_ids))))
+
+
+def assign_missing_ordinals() -> int:
+    '''Gives an ordinal to every item created before they were assigned, returning how many were missing'''
+    results, _ = db.cypher_query(queries.ITEM_IDS_WITHOUT_ORDINALS)
+    item_ids = [row[0] for row in results]
+    ordinals = [[item_id, ordinal] for item_id, ordinal in zip(item_ids, reserve_ordinals(len(item_ids)))]
+    if ordinals:
+        db.cypher_query(queries.SET_MISSING_ORDINALS, {'ordinals': ordinals})
+        forget_ordinals(item_ids)
+    return len(ordinals)
+
+
+def get_ordinals(item_ids: list[str]) -> dict[str, int]:
+    '''The ordinal of each of the given items, leaving out any ids with no item or no ordinal'''
+    epoch = _epoch()
+    keys = {_ordinal_key(epoch, item_id): item_id for item_id in item_ids}
+    ordinals = {keys[key]: ordinal for key, ordinal in cache.get_many(list(keys)).items()}
+
+    missing = [item_id for item_id in keys.values() if item_id not in ordinals]
+    if missing:
+        results, _ = db.cypher_query(queries.ITEM_ORDINALS, {'item_ids': missing})
+        found = {row[0]: row[1] for row in results if row[1] is not None}
+        cache.set_many({_ordinal_key(epoch, item_id): ordinal for item_id, ordinal in found.items()}, timeout=None)
+        cache.set_many({_ordinal_key(epoch, item_id): NO_ORDINAL for item_id in missing if item_id not in found},
+                       timeout=NO_ORDINAL_TIMEOUT)
+        ordinals.update(found)
+
+    return {item_id: ordinals[item_id] for item_id in item_ids if ordinals.get(item_id, NO_ORDINAL) != NO_ORDINAL}
+
+
+def forget_ordinals(item_ids: list[str]):
+    '''Drops the cached ordinals of deleted or renumbered items, as an item created again gets a new one'''
+    epoch = _epoch()
+    cache.delete_many([_ordinal_key(epoch, item_id) for item_id in item_ids])
@@ -0,0 +1,54 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class GraphCursorPagination:
+    '''Keyset pagination for lists read directly from the graph
+
+    The cursor holds the sort key of the last result on the previous page, so each page is read
+    with a single query that starts after it, and the order stays stable from page to page'''
+    page_size = api_settings.PAGE_SIZE or 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_after(self, request) -> list:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            after = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+        except (DecodeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(after, list):
+            raise NotFound(self.invalid_cursor_message)
+
+        return after
+
+    def encode_cursor(self, after: list) -> str:
+        return urlsafe_b64encode(json.dumps(after).encode('ascii')).decode('ascii')
+
+    def get_next_link(self, request, after: list) -> str:
+        if after is None:
+            return None
+
+        url = request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(after))
+
+    def get_paginated_data(self, request, results: list, after: list, results_key='results') -> dict:
+        return {'next': self.get_next_link(request, after), results_key: results}
@@ -0,0 +1,69 @@
+'''How widely each item is known, aggregated across every ranker by a background job
+
+refresh_popularity counts the KNOWS and DOES_NOT_KNOW relationships of each item in batches of
+ordinals, stores the counts on the item nodes, and caches a table of each ordinal's weight so
+discovery can favor widely known items without reading any counts per request. Each process keeps
+its own copy of the table, and only fetches it again when a refresh has replaced it.'''
+from secrets import token_hex
+from typing import NamedTuple
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from neomodel import db
+from . import queries
+from .ordinals import ordinal_count
+
+BATCH_SIZE = getattr(settings, 'PREFERENCES_POPULARITY_BATCH_SIZE', 10000)
+POPULARITY_KEY = 'preferences:popularity'
+POPULARITY_VERSION_KEY = 'preferences:popularity:version'
+
+
+def item_weight(known_count: int, unknown_count: int) -> float:
+    '''How many rankers know the item, scaled by the smoothed share of those asked who know it'''
+    return (known_count + 1) * (known_count + 1) / (known_count + unknown_count + 2)
+
+
+# Items created since the last refresh weigh as much as an item nobody has been asked about
+FLOOR_WEIGHT = item_weight(0, 0)
+
+
+class Popularity(NamedTuple):
+    counted: np.ndarray
+
+    def weights(self, ordinal_count: int) -> np.ndarray:
+        '''The weight of each ordinal below ordinal_count, by ordinal'''
+        if ordinal_count <= len(self.counted):
+            return self.counted[:ordinal_count]
+        return np.concatenate([self.counted, np.full(ordinal_count - len(self.counted), FLOOR_WEIGHT)])
+
+
+def refresh_popularity(batch_size: int = BATCH_SIZE) -> int:
+    '''Recounts who knows each item and replaces the cached weight table, returning the number of items counted'''
+    count = ordinal_count()
+    weights, counted = np.full(count, FLOOR_WEIGHT), 0
+    for first in range(0, count, batch_size):
+        results, _ = db.cypher_query(queries.REFRESH_ITEM_POPULARITY, {'first': first, 'last': first + batch_size})
+        for ordinal, known_count, unknown_count in results:
+            weights[ordinal] = item_weight(known_count, unknown_count)
+        counted += len(results)
+
+    # The table is replaced before its version, so a process never reads an older table under a newer version
+    cache.set(POPULARITY_KEY, weights if counted else None, timeout=None)
+    cache.set(POPULARITY_VERSION_KEY, token_hex(8), timeout=None)
+    return counted
+
+
+_loaded = {}
+
+
+def get_popularity() -> Popularity:
+    '''The weight table from the last refresh, or None if there has not been one'''
+    version = cache.get(POPULARITY_VERSION_KEY)
+    if version is None:
+        return None
+
+    if _loaded.get('version') != version:
+        weights = cache.get(POPULARITY_KEY)
+        _loaded['popularity'] = Popularity(weights) if weights is not None else None
+        _loaded['version'] = version
+    return _loaded['popularity']
@@ -0,0 +1,412 @@
+'''Registry of every Cypher statement used by the preferences app
+
+Statements are fixed templates, and all values are passed to db.cypher_query as parameters,
+so Neo4j sees the same query text on every call and can reuse its cached execution plan.
+Statements that match on a specific item class have an {item_labels} placeholder which is
+filled in by for_item_class; the set of item classes is small and fixed, so is the set of texts.
+Statements that return items as {i} (and {j}) return either the nodes or, when projected, only
+the values of the properties listed in $fields, in that order.
+Statements with an {i_filter} (and {j_filter}) placeholder only match items passing every filter
+in $filters, a list of {property, op, value} maps, so any combination of filters shares one text.'''
+from functools import lru_cache
+
+
+# Boolean checks
+# The ordinals of every item the ranker knows and does not know, as two lists which leave out items with no ordinal
+RANKER_MEMBERSHIP = (
+    "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+    "OPTIONAL MATCH (r)-[:KNOWS]->(k:Item) "
+    "WITH r, collect(k.ordinal) AS known "
+    "OPTIONAL MATCH (r)-[:DOES_NOT_KNOW]->(u:Item) "
+    "RETURN known, collect(u.ordinal)")
+
+# Whether the ranker knows or does not know each item, for items with no ordinal in the membership index
+RANKER_KNOWS_ITEMS = (
+    "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+    "UNWIND $item_ids AS item_id "
+    "MATCH (i:Item {item_id: item_id}) "
+    "RETURN item_id, exists((r)-[:KNOWS]->(i)), exists((r)-[:DOES_NOT_KNOW]->(i))")
+
+DIRECT_PREFERENCE_EXISTS = (
+    "MATCH (:Item {item_id: $preferred_id})-[p:PREFERRED_TO_BY {by: $ranker_id}]->(:Item {item_id: $nonpreferred_id}) "
+    "RETURN count(p) > 0")
+
+FIND_EXISTING_ITEM_IDS = (
+    "MATCH (i:{item_labels}) "
+    "WHERE i.item_id IN $item_ids "
+    "RETURN i.item_id")
+
+
+# Item ordinals
+# Every item is given a small integer ordinal, which never changes once set, for compact indexes
+# The sequence is locked before it is read so concurrent reservations never overlap, and the
+# uniqueness constraint on its name, installed with the Sequence model's labels, keeps it a singleton
+RESERVE_ORDINALS = (
+    "MERGE (s:Sequence {name: 'item_ordinal'}) "
+    "ON CREATE SET s.next = 0, s._created = true "
+    "SET s._lock = true "
+    "WITH s, s.next AS first, s._created IS NOT NULL AS created "
+    "SET s.next = first + $count "
+    "REMOVE s._lock, s._created "
+    "RETURN first, created")
+
+ITEM_IDS_WITH_ORDINALS = (
+    "UNWIND $item_ids AS item_id "
+    "MATCH (i:Item {item_id: item_id}) "
+    "WHERE i.ordinal IS NOT NULL "
+    "RETURN item_id")
+
+ITEM_IDS_WITHOUT_ORDINALS = (
+    "MATCH (i:Item) "
+    "WHERE i.ordinal IS NULL "
+    "RETURN i.item_id")
+
+SET_MISSING_ORDINALS = (
+    "UNWIND $ordinals AS row "
+    "MATCH (i:Item {item_id: row[0]}) "
+    "SET i.ordinal = coalesce(i.ordinal, row[1])")
+
+ORDINAL_COUNT = (
+    "OPTIONAL MATCH (s:Sequence {name: 'item_ordinal'}) "
+    "RETURN coalesce(s.next, 0)")
+
+ITEM_ORDINALS = (
+    "UNWIND $item_ids AS item_id "
+    "MATCH (i:Item {item_id: item_id}) "
+    "RETURN item_id, i.ordinal")
+
+# Item popularity
+# Counted over a range of ordinals at a time, so each batch is read through the ordinal index
+REFRESH_ITEM_POPULARITY = (
+    "MATCH (i:Item) "
+    "WHERE i.ordinal >= $first AND i.ordinal < $last "
+    "SET i.known_count = size((:Ranker)-[:KNOWS]->(i)), "
+    "i.unknown_count = size((:Ranker)-[:DOES_NOT_KNOW]->(i)) "
+    "RETURN i.ordinal, i.known_count, i.unknown_count")
+
+# Consensus
+# New preferences are found by the time they were created, read a page at a time in creation order
+CREATE_PREFERENCE_CREATED_INDEX = (
+    "CREATE INDEX preference_created IF NOT EXISTS FOR ()-[p:PREFERRED_TO_BY]-() ON (p.created)")
+
+# The window ends by the database's clock, which set every created time, rather than the caller's
+# The state is a singleton, kept unique by the constraint on its name installed with the Consensus model's labels
+GET_CONSENSUS_STATE = (
+    "MERGE (c:Consensus {name: 'bradley_terry'}) "
+    "ON CREATE SET c.until = -1 "
+    "RETURN c.until, timestamp() - $settle_ms")
+
+SET_CONSENSUS_STATE = (
+    "MERGE (c:Consensus {name: 'bradley_terry'}) "
+    "SET c.until = $until")
+
+# Preferences created in the window (since, until], after the (created, id) of the last one read
+LIST_PREFERENCE_EDGES_PAGE = (
+    "MATCH (i:Item)-[p:PREFERRED_TO_BY]->(j:Item) "
+    "WHERE p.created > $since AND p.created <= $until "
+    "AND ($after IS NULL OR p.created > $after[0] OR (p.created = $after[0] AND id(p) > $after[1])) "
+    "RETURN i.ordinal, j.ordinal, p.created AS created, id(p) AS id "
+    "ORDER BY created, id "
+    "LIMIT $limit")
+
+# A rebuild reads every preference in no particular order, so it takes them by ranges of the
+# preferring item's ordinal, including those from before creation times were recorded
+LIST_PREFERENCE_EDGES_BY_ORDINAL = (
+    "MATCH (i:Item)-[p:PREFERRED_TO_BY]->(j:Item) "
+    "WHERE i.ordinal >= $first AND i.ordinal < $last AND coalesce(p.created, 0) <= $until "
+    "RETURN i.ordinal, j.ordinal")
+
+LIST_CONSENSUS_SCORES = (
+    "MATCH (i:Item) "
+    "WHERE i.consensus_score IS NOT NULL "
+    "RETURN i.ordinal, i.consensus_score, i.consensus_count")
+
+SET_CONSENSUS_SCORES = (
+    "UNWIND $scores AS row "
+    "MATCH (i:Item {ordinal: row[0]}) "
+    "SET i.consensus_score = row[1], i.consensus_count = row[2]")
+
+CLEAR_CONSENSUS_SCORES = (
+    "MATCH (i:Item) "
+    "WHERE i.consensus_score IS NOT NULL "
+    "CALL { WITH i REMOVE i.consensus_score, i.consensus_count } IN TRANSACTIONS OF 10000 ROWS")
+
+CONSENSUS_PAGE = (
+    "MATCH (i:{item_labels}) "
+    "WHERE i.consensus_score IS NOT NULL "
+    "AND ($after IS NULL OR i.consensus_score < $after[0] "
+    "OR (i.consensus_score = $after[0] AND i.item_id > $after[1])) "
+    "RETURN {i}, i.consensus_count, i.consensus_score AS score, i.item_id AS item_id "
+    "ORDER BY score DESC, item_id "
+    "LIMIT $limit")
+
+# Export
+EXPORT_ITEMS_PAGE = (
+    "MATCH (i:Item) "
+    "WHERE i.ordinal >= $first AND i.ordinal < $last "
+    "RETURN i.ordinal AS ordinal, i.item_id "
+    "ORDER BY ordinal")
+
+# Each subquery aggregates, so a ranker with no edges of a kind still returns one row with an empty list
+EXPORT_RANKERS_PAGE = (
+    "MATCH (r:Ranker) "
+    "WHERE $after IS NULL OR r.ranker_id > $after "
+    "WITH r ORDER BY r.ranker_id LIMIT $limit "
+    "CALL { WITH r MATCH (r)-[:KNOWS]->(k:Item) RETURN collect(k.ordinal) AS known } "
+    "CALL { WITH r MATCH (r)-[:DOES_NOT_KNOW]->(u:Item) RETURN collect(u.ordinal) AS unknown } "
+    "CALL { WITH r MATCH (r)-[:KNOWS]->(i:Item)-[:PREFERRED_TO_BY {by: r.ranker_id}]->(j:Item) "
+    "RETURN collect([i.ordinal, j.ordinal]) AS preferences } "
+    "RETURN r.ranker_id, known, unknown, preferences")
+
+# Create operations
+# Items are merged on their id, so creating the same item twice only updates its properties
+MERGE_ITEMS = (
+    "UNWIND $items AS item "
+    "MERGE (i:{item_labels} {{item_id: item.properties.item_id}}) "
+    "SET i += item.properties "
+    "SET i.ordinal = coalesce(i.ordinal, item.ordinal)")
+
+MERGE_RANKERS = (
+    "UNWIND $ranker_ids AS ranker_id "
+    "MERGE (:{ranker_labels} {{ranker_id: ranker_id}})")
+
+# Each item is matched by id, so ids with no item are simply left out of the returned ids
+MARK_KNOWN = (
+    "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+    "UNWIND $item_ids AS item_id "
+    "MATCH (i:Item {item_id: item_id}) "
+    "OPTIONAL MATCH (r)-[d:DOES_NOT_KNOW]->(i) "
+    "DELETE d "
+    "WITH r, i "
+    "MERGE (r)-[k:KNOWS]->(i) "
+    "ON CREATE SET k.descendants = 0 "
+    "RETURN i.item_id")
+
+# Marking an item unknown also removes any preferences or queued comparisons on it
+MARK_UNKNOWN = (
+    "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+    "UNWIND $item_ids AS item_id "
+    "MATCH (i:Item {item_id: item_id}) "
+    "OPTIONAL MATCH (i)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY {by: $ranker_id}]-() "
+    "DELETE pc "
+    "WITH DISTINCT r, i "
+    "OPTIONAL MATCH (r)-[k:KNOWS]->(i) "
+    "DELETE k "
+    "WITH r, i "
+    "MERGE (r)-[:DOES_NOT_KNOW]->(i) "
+    "RETURN i.item_id")
+
+DELETE_PAIRWISE_FOR_ITEMS = (
+    "MATCH (i:Item)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY]-() "
+    "WHERE i.item_id IN $item_ids AND pc.by = $ranker_id "
+    "DELETE pc")
+
+LOCK_RANKER = (
+    "MATCH (r:Ranker {ranker_id: $ranker_id}) "
+    "SET r.preferences_updated = timestamp()")
+
+LOAD_PREFERENCE_GRAPH = (
+    "MATCH (:Ranker {ranker_id: $ranker_id})-[k:KNOWS]->(i:Item) "
+    "OPTIONAL MATCH (i)-[:PREFERRED_TO_BY {by: $ranker_id}]->(j) "
+    "WITH i, k, collect(j.item_id) AS preferred_to "
+    "OPTIONAL MATCH (i)-[:COMPARE_WITH_BY {by: $ranker_id}]->(c) "
+    "RETURN i.item_id, k.descendants, preferred_to, collect(c.item_id)")
+
+DELETE_QUEUED_PAIRS = (
+    "UNWIND $pairs AS pair "
+    "MATCH (i:Item {item_id: pair[0]})-[c:COMPARE_WITH_BY {by: $ranker_id}]-(j:Item {item_id: pair[1]}) "
+    "DELETE c")
+
+MERGE_PREFERENCE_PAIRS = (
+    "UNWIND $pairs AS pair "
+    "MATCH (i:Item {item_id: pair[0]}), (j:Item {item_id: pair[1]}) "
+    "MERGE (i)-[p:PREFERRED_TO_BY {by: $ranker_id}]->(j) "
+    "ON CREATE SET p.created = timestamp()")
+
+MERGE_QUEUED_PAIRS = (
+    "UNWIND $pairs AS pair "
+    "MATCH (i:Item {item_id: pair[0]}), (j:Item {item_id: pair[1]}) "
+    "MERGE (i)-[:COMPARE_WITH_BY {by: $ranker_id}]->(j) "
+    "MERGE (i)<-[:COMPARE_WITH_BY {by: $ranker_id}]-(j)")
+
+
+# Retrieve operations
+GET_DIRECT_PREFERENCES = (
+    "MATCH (:Ranker {{ranker_id: $ranker_id}})-[:KNOWS]->(i:{item_labels})"
+    "-[:PREFERRED_TO_BY {{by: $ranker_id}}]->(j:{item_labels}) "
+    "RETURN i, j")
+
+# Every node of a class, for comparing the graph against the rows it is synced from
+LIST_ITEM_PROPERTIES = (
+    "MATCH (i:{item_labels}) "
+    "RETURN i.item_id, properties(i)")
+
+LIST_RANKER_IDS = (
+    "MATCH (r:{ranker_labels}) "
+    "RETURN r.ranker_id")
+
+# Paged statements return the nodes of each result followed by its sort key, and start after
+# the key given by $after (or from the beginning if it is null)
+GET_DIRECT_PREFERENCES_PAGE = (
+    "MATCH (:Ranker {{ranker_id: $ranker_id}})-[:KNOWS]->(i:{item_labels})"
+    "-[:PREFERRED_TO_BY {{by: $ranker_id}}]->(j:{item_labels}) "
+    "WHERE $after IS NULL OR i.item_id > $after[0] OR (i.item_id = $after[0] AND j.item_id > $after[1]) "
+    "RETURN {i}, {j}, i.item_id AS i_id, j.item_id AS j_id "
+    "ORDER BY i_id, j_id "
+    "LIMIT $limit")
+
+# Descendant counts are maintained on the KNOWS relationship, so no path expansion is needed here
+# Ties are broken by item_id so the order is consistent across requests
+TOPOLOGICAL_SORT = (
+    "MATCH (:Ranker {{ranker_id: $ranker_id}})-[k:KNOWS]->(i:{item_labels}) "
+    "WHERE {i_filter} "
+    "RETURN i "
+    "ORDER BY coalesce(k.descendants, 0) DESC, i.item_id")
+
+TOPOLOGICAL_SORT_PAGE = (
+    "MATCH (:Ranker {{ranker_id: $ranker_id}})-[k:KNOWS]->(i:{item_labels}) "
+    "WHERE {i_filter} "
+    "WITH i, coalesce(k.descendants, 0) AS descendants "
+    "WHERE $after IS NULL OR descendants < $after[0] OR (descendants = $after[0] AND i.item_id > $after[1]) "
+    "RETURN {i}, descendants, i.item_id AS item_id "
+    "ORDER BY descendants DESC, item_id "
+    "LIMIT $limit")
+
+LIST_KNOWN_ITEMS_PAGE = (
+    "MATCH (:Ranker {{ranker_id: $ranker_id}})-[:KNOWS]->(i:{item_labels}) "
+    "WHERE $after IS NULL OR i.item_id > $after[0] "
+    "RETURN {i}, i.item_id AS item_id "
+    "ORDER BY item_id "
+    "LIMIT $limit")
+
+# i.item_id < j.item_id prevents double-counting, as each queued comparison is stored in both directions
+LIST_QUEUED_COMPARES = (
+    "MATCH (u:Ranker {{ranker_id: $ranker_id}})-[:KNOWS]->(i:{item_labels})"
+    "-[:COMPARE_WITH_BY {{by: $ranker_id}}]->(j:{item_labels})<-[:KNOWS]-(u) "
+    "WHERE i.item_id < j.item_id AND {i_filter} AND {j_filter} "
+    "RETURN i, j")
+
+LIST_QUEUED_COMPARES_LIMIT = LIST_QUEUED_COMPARES + " LIMIT $limit"
+
+LIST_QUEUED_COMPARES_PAGE = (
+    "MATCH (u:Ranker {{ranker_id: $ranker_id}})-[:KNOWS]->(i:{item_labels})"
+    "-[:COMPARE_WITH_BY {{by: $ranker_id}}]->(j:{item_labels})<-[:KNOWS]-(u) "
+    "WHERE i.item_id < j.item_id AND {i_filter} AND {j_filter} "
+    "AND ($after IS NULL OR i.item_id > $after[0] OR (i.item_id = $after[0] AND j.item_id > $after[1])) "
+    "RETURN {i}, {j}, i.item_id AS i_id, j.item_id AS j_id "
+    "ORDER BY i_id, j_id "
+    "LIMIT $limit")
+
+# Filtered discovery orders every matching item the ranker has not classified by the same seeded
+# positions as preferences.sampling, so a narrow filter costs this one query instead of many draws
+# Uncounted items weigh as much as an item nobody has been asked about, as in item_weight
+DISCOVER_FILTERED_PAGE = (
+    "MATCH (r:Ranker {{ranker_id: $ranker_id}}) "
+    "MATCH (i:{item_labels}) "
+    "WHERE i.ordinal IS NOT NULL AND {i_filter} AND NOT EXISTS((r)-[:KNOWS|DOES_NOT_KNOW]->(i)) "
+    "WITH i, ($a * i.ordinal + $b) % $modulus AS hashed "
+    "WITH i, (hashed * hashed + $c) % $modulus AS hashed "
+    "WITH i, -log(toFloat(hashed + 1) / ($modulus + 1)) / CASE WHEN $weighted "
+    "THEN (coalesce(i.known_count, 0) + 1.0) ^ 2 / (coalesce(i.known_count, 0) + coalesce(i.unknown_count, 0) + 2) "
+    "ELSE 1.0 END AS position "
+    "WHERE $after IS NULL OR position > $after[0] OR (position = $after[0] AND i.ordinal > $after[1]) "
+    "RETURN {i}, position, i.ordinal AS ordinal "
+    "ORDER BY position, ordinal "
+    "LIMIT $limit")
+
+# Discovery samples ordinals in Python and only looks up the items it draws, through the ordinal index
+LIST_ITEMS_BY_ORDINAL = (
+    "UNWIND $ordinals AS ordinal "
+    "MATCH (i:{item_labels} {{ordinal: ordinal}}) "
+    "RETURN ordinal, {i}")
+
+
+# Delete operations
+DELETE_DIRECT_PREFERENCE = (
+    "MATCH (:Item {item_id: $preferred_id})-[p:PREFERRED_TO_BY {by: $ranker_id}]->(:Item {item_id: $nonpreferred_id}) "
+    "DELETE p")
+
+DELETE_RANKER_KNOWS = (
+    "MATCH (:Ranker {ranker_id: $ranker_id})-[kdk:KNOWS|DOES_NOT_KNOW]->(:Item {item_id: $item_id}) "
+    "DELETE kdk")
+
+DELETE_RANKERS_PAIRWISE = (
+    "MATCH (:Item)-[pc:PREFERRED_TO_BY|COMPARE_WITH_BY]-(:Item) "
+    "WHERE pc.by IN $ranker_ids "
+    "DELETE pc")
+
+DETACH_DELETE_RANKERS = (
+    "MATCH (r:Ranker) "
+    "WHERE r.ranker_id IN $ranker_ids "
+    "DETACH DELETE r")
+
+RANKERS_KNOWING_ITEMS = (
+    "MATCH (r:Ranker)-[:KNOWS]->(i:Item) "
+    "WHERE i.item_id IN $item_ids "
+    "RETURN r.ranker_id, collect(i.item_id)")
+
+DETACH_DELETE_ITEMS = (
+    "MATCH (i:Item) "
+    "WHERE i.item_id IN $item_ids "
+    "DETACH DELETE i")
+
+DELETE_ALL_QUEUED_COMPARES = (
+    "MATCH (:{item_labels})-[c:COMPARE_WITH_BY {{by: $ranker_id}}]-(:{item_labels}) "
+    "DELETE c")
+
+
+# Descendant count index
+SET_DESCENDANT_COUNTS = (
+    "UNWIND $counts AS row "
+    "MATCH (:Ranker {ranker_id: $ranker_id})-[k:KNOWS]->(:Item {item_id: row[0]}) "
+    "SET k.descendants = row[1]")
+
+# Known items of rankers from before descendant counts were kept, which have none stored yet
+KNOWN_ITEM_IDS_WITHOUT_DESCENDANTS = (
+    "MATCH (:Ranker {ranker_id: $ranker_id})-[k:KNOWS]->(i:Item) "
+    "WHERE k.descendants IS NULL "
+    "RETURN i.item_id")
+
+REBUILD_DESCENDANT_COUNTS = (
+    "MATCH (:Ranker {ranker_id: $ranker_id})-[k:KNOWS]->(i:Item) "
+    "OPTIONAL MATCH (i)-[:PREFERRED_TO_BY* {by: $ranker_id}]->(j) "
+    "WITH k, count(DISTINCT j) AS descendants "
+    "SET k.descendants = descendants")
+
+
+def _returned_item(node: str, projected: bool) -> str:
+    return f"[field IN $fields | {node}[field]]" if projected else node
+
+
+def _item_filter(node: str) -> str:
+    # 'any' matches a list property sharing any of the values, 'gte' and 'lte' bound a property
+    # A missing property gives null, which fails the filter
+    return ("all(f IN $filters WHERE CASE f.op "
+            f"WHEN 'any' THEN any(v IN f.value WHERE v IN {node}[f.property]) "
+            f"WHEN 'gte' THEN {node}[f.property] >= f.value "
+            f"WHEN 'lte' THEN {node}[f.property] <= f.value END)")
+
+
+@lru_cache(maxsize=None)
+def _format_labels(statement: str, item_labels: str, projected: bool) -> str:
+    return statement.format(item_labels=item_labels,
+                            i=_returned_item('i', projected),
+                            j=_returned_item('j', projected),
+                            i_filter=_item_filter('i'),
+                            j_filter=_item_filter('j'))
+
+
+@lru_cache(maxsize=None)
+def _format_ranker_labels(statement: str, ranker_labels: str) -> str:
+    return statement.format(ranker_labels=ranker_labels)
+
+
+def for_ranker_class(statement: str, ranker_class) -> str:
+    '''Fills in the labels of ranker_class for a statement with a {ranker_labels} placeholder'''
+    return _format_ranker_labels(statement, ':'.join(ranker_class.inherited_labels()))
+
+
+def for_item_class(statement: str, item_class, projected: bool = False) -> str:
+    '''Fills in the labels of item_class for a statement with an {item_labels} placeholder,
+    and whether any items it returns are projected'''
+    return _format_labels(statement, ':'.join(item_class.inherited_labels()), projected)
@@ -0,0 +1,161 @@
+'''Item to item recommendations from which items are known and preferred by the same rankers
+
+build_neighbors reads a graph export into a sparse ranker by item matrix, where each item a ranker
+knows counts one and each time they prefer it to another item counts one more. The cosine
+similarity of every pair of item columns is computed a block of items at a time with SciPy, and
+only the top k neighbors of each item are kept, in a file of NumPy arrays indexed by ordinal.
+
+recommend then needs no traversal of the graph: it scores the neighbors of the ranker's top sorted
+items, drops the ones they already know, and looks up only the items it returns.'''
+import logging
+import os
+from math import log2
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from .cache import get_or_set_for_ranker
+from .cypher import get_items_by_ordinal, topological_sort_page
+from .export import get_export_dir, read_export
+from .membership import get_membership
+from .models import Ranker
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_COUNT = 50
+BLOCK_SIZE = 1024
+# Damps the similarity of items which only a few rankers have in common
+SHRINKAGE = 10.0
+# How many of the ranker's top sorted items their recommendations are drawn from
+SEED_COUNT = 20
+
+
+def get_neighbors_path() -> Path:
+    return Path(getattr(settings, 'RECOMMENDATIONS_PATH', get_export_dir() / 'neighbors.npz'))
+
+
+class Neighbors(NamedTuple):
+    # Row n holds the ordinals of ordinal n's nearest items, padded with -1, and their similarities
+    ordinals: np.ndarray
+    similarities: np.ndarray
+    # Changes with every build, so results cached from an older build are never read
+    version: str
+
+
+def _ranker_item_matrix(export) -> sparse.csr_matrix:
+    knows_rankers, knows_items = export.columns('knows')
+    preference_rankers, preferred, _ = export.columns('preferences')
+    shape = (export.manifest['tables']['rankers']['rows'],
+             int(max(knows_items.max(initial=-1), preferred.max(initial=-1))) + 1)
+
+    rows = np.concatenate([knows_rankers, preference_rankers])
+    columns = np.concatenate([knows_items, preferred])
+    # Duplicate entries are summed, so each preference adds one to the preferred item
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+
+
+def build_neighbors(export_path: Path = None, k: int = NEIGHBOR_COUNT, block_size: int = BLOCK_SIZE) -> int:
+    '''Finds the k most similar items to every item in an export, the latest by default, and saves them
+
+    Returns the number of items with any neighbors'''
+    export = read_export(export_path)
+    matrix = _ranker_item_matrix(export)
+    n_items = matrix.shape[1]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    transposed = matrix.T.tocsr()
+    # Both products have the same sparsity, so their rows line up entry for entry once sorted
+    known = (matrix > 0).astype(np.float32)
+    known_transposed = known.T.tocsr()
+
+    ordinals = np.full((n_items, k), -1, dtype=np.int32)
+    similarities = np.zeros((n_items, k), dtype=np.float32)
+    for start in range(0, n_items, block_size):
+        block = (transposed[start:start + block_size] @ matrix).tocsr()
+        common = (known_transposed[start:start + block_size] @ known).tocsr()
+        block.sort_indices()
+        common.sort_indices()
+
+        for row in range(block.shape[0]):
+            item = start + row
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            neighbors = block.indices[begin:end]
+            scores = block.data[begin:end] * inverse_norms[item] * inverse_norms[neighbors]
+
+            shared = common.data[begin:end]
+            scores = scores * shared / (shared + SHRINKAGE)
+            scores[neighbors == item] = 0
+
+            top = np.argsort(-scores)[:k]
+            top = top[scores[top] > 0]
+            ordinals[item, :len(top)] = neighbors[top]
+            similarities[item, :len(top)] = scores[top]
+
+    path = get_neighbors_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.partial.npz')
+    np.savez(partial, ordinals=ordinals, similarities=similarities,
+             version=np.array(export.manifest['name']))
+    os.replace(partial, path)
+
+    built = int((ordinals[:, 0] >= 0).sum())
+    logger.info('Found neighbors of %d of %d items, from %d rankers', built, n_items, matrix.shape[0])
+    return built
+
+
+_loaded = {}
+
+
+def load_neighbors() -> Neighbors:
+    '''The neighbors from the last build, reloaded only when the file changes, or None if there is none'''
+    path = get_neighbors_path()
+    try:
+        modified = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if _loaded.get('modified') != modified:
+        with np.load(path) as arrays:
+            _loaded['neighbors'] = Neighbors(arrays['ordinals'], arrays['similarities'], str(arrays['version']))
+        _loaded['modified'] = modified
+    return _loaded['neighbors']
+
+
+def score_candidates(neighbors: Neighbors, seeds: list[int], exclude) -> dict[int, float]:
+    '''Sums the similarity of each neighbor of the seed ordinals, discounting later seeds by their rank'''
+    scores = {}
+    for rank, seed in enumerate(seeds):
+        if seed >= len(neighbors.ordinals):
+            continue
+        weight = 1.0 / log2(rank + 2)
+        for ordinal, similarity in zip(neighbors.ordinals[seed].tolist(), neighbors.similarities[seed].tolist()):
+            if ordinal < 0:
+                break
+            if not exclude(ordinal):
+                scores[ordinal] = scores.get(ordinal, 0.0) + weight * similarity
+    return scores
+
+
+def recommend(ranker: Ranker, item_class, limit: int = 20, projection: dict = None) -> list:
+    '''Items the ranker does not know yet, most similar to the items they rank highest first, as (item, score) rows'''
+    neighbors = load_neighbors()
+    if neighbors is None:
+        return []
+
+    def _compute():
+        seeds = topological_sort_page(ranker, item_class, limit=SEED_COUNT, projection={'ordinal': 'ordinal'})
+        membership = get_membership(ranker.ranker_id)
+        scores = score_candidates(neighbors, [item['ordinal'] for item in seeds.results
+                                              if item['ordinal'] is not None], membership.knows)
+
+        # A few spare candidates are kept, as some ordinals may belong to another class of item
+        best = sorted(scores, key=lambda ordinal: (-scores[ordinal], ordinal))[:2 * limit]
+        return [(ordinal, scores[ordinal]) for ordinal in best]
+
+    name = ':'.join(['recommend', neighbors.version, *item_class.inherited_labels(), str(limit)])
+    best = get_or_set_for_ranker(ranker.ranker_id, name, _compute)
+
+    items = get_items_by_ordinal(item_class, [ordinal for ordinal, _ in best], projection)
+    return [(items[ordinal], score) for ordinal, score in best if ordinal in items][:limit]
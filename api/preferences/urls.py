@@ -1,25 +1,32 @@
 from django.urls import path
 from . import views
+from .asynchronous import graph_view
 
 urlpatterns = [
     path('sort/',
-         views.RankerViewSet.as_view({'get': 'get_sorted_list'})),
+         graph_view(views.RankerViewSet, {'get': 'get_sorted_list'})),
+    path('recommend/',
+         graph_view(views.RankerViewSet, {'get': 'recommend'})),
     path('queue/',
-         views.RankerViewSet.as_view({'get': 'get_comparisons_queue',
-                                      'post': 'reset_comparisons_queue',
-                                      'delete': 'clear_comparisons_queue'})),
+         graph_view(views.RankerViewSet, {'get': 'get_comparisons_queue',
+                                          'post': 'reset_comparisons_queue',
+                                          'delete': 'clear_comparisons_queue'})),
     path('knows/',
-         views.RankerKnowsViewSet.as_view({'get': 'list',
-                                           'post': 'create'})),
+         graph_view(views.RankerKnowsViewSet, {'get': 'list',
+                                               'post': 'create'})),
     path('knows/<str:item_id>/',
-         views.RankerKnowsViewSet.as_view({'get': 'retrieve',
-                                           'delete': 'destroy'})),
+         graph_view(views.RankerKnowsViewSet, {'get': 'retrieve',
+                                               'delete': 'destroy'})),
     path('discover/',
-         views.RankerKnowsViewSet.as_view({'get': 'discover'})),
+         graph_view(views.RankerKnowsViewSet, {'get': 'discover'})),
     path('preferences/',
-         views.RankerPairwiseViewSet.as_view({'get': 'list',
-                                              'post': 'create'})),
+         graph_view(views.RankerPairwiseViewSet, {'get': 'list',
+                                                  'post': 'create'})),
     path('preferences/<str:preferred_id>/<str:nonpreferred_id>/',
-         views.RankerPairwiseViewSet.as_view({'get': 'retrieve',
-                                              'delete': 'destroy'})),
+         graph_view(views.RankerPairwiseViewSet, {'get': 'retrieve',
+                                                  'delete': 'destroy'})),
+    path('consensus/',
+         views.ConsensusViewSet.as_view({'get': 'list'})),
+    path('export/', views.export_graph),
+    path('metrics/', views.graph_metrics),
 ]
@@ -1,15 +1,22 @@
+import json
 from django.http import Http404
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.viewsets import GenericViewSet
-from rest_framework.permissions import IsAuthenticated
-from neomodel.exceptions import DoesNotExist
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from .models import Ranker, Item
-from .cypher import (delete_all_queued_compares, delete_direct_preference, delete_ranker_knows,
-                     direct_preference_exists, get_direct_preferences, insert_preferences,
-                     insert_ranker_knows, list_queued_compares, ranker_does_not_know_item, ranker_knows_item,
-                     topological_sort, populate_queued_compares, list_undefined_known_items)
+from .cypher import (ItemFilter, consensus_page, delete_all_queued_compares, delete_direct_preference, delete_ranker_knows,
+                     direct_preference_exists, find_existing_item_ids, get_direct_preferences_page,
+                     insert_preference_ids, insert_ranker_knows_ids, list_known_items_page, list_queued_compares_page,
+                     ranker_knows_status, topological_sort_page, populate_queued_compares,
+                     list_undefined_known_items, PREFERENCE_WARNING)
+from .connection import metrics
+from .export import latest_export, start_export
+from .recommend import recommend
 from .serializers import RankerSerializer, ItemSerializer
+from .pagination import GraphCursorPagination
 
 
 def get_serializer_for_item(self, item: Item):
@@ -17,45 +24,145 @@ def get_serializer_for_item(self, item: Item):
     return ItemSerializer(item)
 
 
+@api_view(http_method_names=['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def export_graph(request):
+    '''Returns the manifest of the latest export of the graph, or starts a new export in the background'''
+    if request.method == 'POST':
+        start_export()
+        return Response(data={'message': 'Exporting the graph'}, status=status.HTTP_202_ACCEPTED)
+
+    path = latest_export()
+    if path is None:
+        raise Http404
+
+    with open(path / 'manifest.json', 'r') as f:
+        return Response(data=json.load(f))
+
+
+@api_view(http_method_names=['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def graph_metrics(request):
+    '''Returns the timings of the sessions and queries this process has run, or clears them'''
+    if request.method == 'DELETE':
+        metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response(data=metrics.snapshot())
+
+
+def get_item_filters(view, request) -> list[ItemFilter]:
+    # Each query parameter in view.item_filters filters on a property, with one integer or,
+    # for 'any', a comma separated list of them
+    filters = []
+    for param, (property, op) in view.item_filters.items():
+        value = request.query_params.get(param)
+        if not value:
+            continue
+
+        try:
+            values = [int(v) for v in value.split(',')] if op == 'any' else int(value)
+        except ValueError:
+            raise ParseError(f'{param} must be an integer')
+        filters.append(ItemFilter(property, op, values))
+    return filters
+
+
+def get_item_data(view, items: list) -> list:
+    # Projected items are read as plain dicts, so are returned without inflating or serializing them
+    if view.item_projection is not None:
+        return list(items)
+    return [view.serialize_item(item).data for item in items]
+
+
+def get_ranker(view):
+    # The async views read the ranker alongside the user, and leave it on the request
+    nodes = getattr(view.request, 'graph_nodes', {})
+    if 'ranker' in nodes:
+        ranker = nodes['ranker']
+    else:
+        ranker = view.ranker_class.nodes.get_or_none(ranker_id=view.request.user.id)
+    if ranker is None:
+        raise Http404
+
+    view.check_object_permissions(view.request, ranker)
+    return ranker
+
+
+def get_items(view, item_ids: list[str]) -> list:
+    # Every item is read in one round trip to the graph, unless the async view already read them
+    items = getattr(view.request, 'graph_nodes', {}).get('items')
+    if items is None:
+        items = {item.item_id: item for item in view.item_class.nodes.filter(item_id__in=item_ids)}
+    if not all(item_id in items for item_id in item_ids):
+        raise Http404
+
+    for item_id in set(item_ids):
+        view.check_object_permissions(view.request, items[item_id])
+    return [items[item_id] for item_id in item_ids]
+
+
 class RankerViewSet(GenericViewSet):
     serializer_class = RankerSerializer
     permission_classes = [IsAuthenticated]
     ranker_class = Ranker
     item_class = Item
     serialize_item = get_serializer_for_item
+    # Maps each output field of a list item to the node property it is read from, or None to serialize nodes
+    item_projection = None
+    # Maps each query parameter that filters lists to the item property and filter op it applies
+    item_filters = {}
+    cursor_pagination_class = GraphCursorPagination
 
     def get_queryset(self):
         pass
 
     def get_object(self):
-        try:
-            obj = self.ranker_class.nodes.get(ranker_id=self.request.user.id)
-        except DoesNotExist:
-            raise Http404
-
-        self.check_object_permissions(self.request, obj)
-
-        return obj
+        return get_ranker(self)
 
     def get_sorted_list(self, request, *args, **kwargs):
         ranker = self.get_object()
-        sorted_known_items = topological_sort(ranker, self.item_class)
-        data = [self.serialize_item(item).data for item in sorted_known_items]
-        return Response(data)
+        paginator = self.cursor_pagination_class()
+        page = topological_sort_page(ranker, self.item_class,
+                                     after=paginator.get_after(request),
+                                     limit=paginator.get_page_size(request),
+                                     projection=self.item_projection,
+                                     filters=get_item_filters(self, request))
+        data = get_item_data(self, page.results)
+        return Response(paginator.get_paginated_data(request, data, page.after))
+
+    def recommend(self, request, *args, **kwargs):
+        ranker = self.get_object()
+        recommendations = recommend(ranker, self.item_class,
+                                    limit=self.cursor_pagination_class().get_page_size(request),
+                                    projection=self.item_projection)
+        items = get_item_data(self, [item for item, _ in recommendations])
+        data = [{**item, 'score': score} for item, (_, score) in zip(items, recommendations)]
+        return Response(data=data)
 
     def get_comparisons_queue(self, request, *args, **kwargs):
         ranker = self.get_object()
-        data = [[self.serialize_item(i).data, self.serialize_item(j).data]
-                for i, j in list_queued_compares(ranker, self.item_class)]
+        paginator = self.cursor_pagination_class()
+        page = list_queued_compares_page(ranker, self.item_class,
+                                         after=paginator.get_after(request),
+                                         limit=paginator.get_page_size(request),
+                                         projection=self.item_projection,
+                                         filters=get_item_filters(self, request))
+        data = [get_item_data(self, pair) for pair in page.results]
 
-        return Response(data)
+        return Response(paginator.get_paginated_data(request, data, page.after))
 
     def reset_comparisons_queue(self, request, *args, **kwargs):
         ranker = self.get_object()
         populate_queued_compares(ranker, self.item_class)
-        data = [[self.serialize_item(i).data, self.serialize_item(j).data]
-                for i, j in list_queued_compares(ranker, self.item_class)]
-        return Response(data, status=status.HTTP_201_CREATED)
+
+        # Return the first page of the new queue
+        paginator = self.cursor_pagination_class()
+        page = list_queued_compares_page(ranker, self.item_class, limit=paginator.get_page_size(request),
+                                         projection=self.item_projection,
+                                         filters=get_item_filters(self, request))
+        data = [get_item_data(self, pair) for pair in page.results]
+        return Response(paginator.get_paginated_data(request, data, page.after), status=status.HTTP_201_CREATED)
 
     def clear_comparisons_queue(self, request, *args, **kwargs):
         ranker = self.get_object()
@@ -69,62 +176,51 @@ class RankerKnowsViewSet(GenericViewSet):
     ranker_class = Ranker
     item_class = Item
     serialize_item = get_serializer_for_item
+    # Maps each output field of a list item to the node property it is read from, or None to serialize nodes
+    item_projection = None
+    # Maps each query parameter that filters lists to the item property and filter op it applies
+    item_filters = {}
+    cursor_pagination_class = GraphCursorPagination
+    # Whether discover favors widely known items unless the request says otherwise
+    discover_weighted = False
 
     def get_queryset(self):
         pass
 
     def get_ranker(self):
-        try:
-            ranker = self.ranker_class.nodes.get(ranker_id=self.request.user.id)
-        except DoesNotExist:
-            raise Http404
-
-        self.check_object_permissions(self.request, ranker)
-
-        return ranker
+        return get_ranker(self)
 
     def get_item(self):
-        try:
-            item = self.item_class.nodes.get(item_id=self.kwargs['item_id'])
-        except DoesNotExist:
-            raise Http404
-
-        self.check_object_permissions(self.request, item)
-
+        item, = get_items(self, [self.kwargs['item_id']])
         return item
 
     def list(self, request, *args, **kwargs):
         ranker = self.get_ranker()
-        known_items = ranker.known_items.all()
-        data = [self.serialize_item(item).data for item in known_items]
-        return Response(data=data)
+        paginator = self.cursor_pagination_class()
+        page = list_known_items_page(ranker, self.item_class,
+                                     after=paginator.get_after(request),
+                                     limit=paginator.get_page_size(request),
+                                     projection=self.item_projection)
+        data = get_item_data(self, page.results)
+        return Response(data=paginator.get_paginated_data(request, data, page.after))
 
     def retrieve(self, request, *args, **kwargs):
         ranker = self.get_ranker()
         item = self.get_item()
 
-        if ranker_knows_item(ranker, item):
-            return Response(data={'knows': True})
-        elif ranker_does_not_know_item(ranker, item):
-            return Response(data={'knows': False})
-        else:
-            return Response(data={'knows': 'undefined'})
+        return Response(data={'knows': ranker_knows_status(ranker, item)})
 
     def create(self, request, *args, **kwargs):
         ranker = self.get_ranker()
-        try:
-            known_items = [self.item_class.nodes.get(item_id=i)
-                           for i in self.request.data['known_ids']]
-            unknown_items = [self.item_class.nodes.get(item_id=i)
-                             for i in self.request.data['unknown_ids']]
-        except DoesNotExist:
-            raise Http404
 
-        insert_ranker_knows(ranker,
-                            known_items=known_items,
-                            unknown_items=unknown_items)
+        # Ids are written in bulk without looking up each item, and any which do not exist are reported back
+        missing_ids = insert_ranker_knows_ids(ranker,
+                                              known_ids=[str(i) for i in self.request.data.get('known_ids', [])],
+                                              unknown_ids=[str(i) for i in self.request.data.get('unknown_ids', [])])
 
-        return Response(status=status.HTTP_201_CREATED)
+        data = {'missing_ids': missing_ids} if missing_ids else {}
+
+        return Response(data=data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         ranker = self.get_ranker()
@@ -134,9 +230,21 @@ class RankerKnowsViewSet(GenericViewSet):
 
     def discover(self, request, *args, **kwargs):
         ranker = self.get_ranker()
-        discoverable_items = list_undefined_known_items(ranker, self.item_class)
-        data = [self.serialize_item(item).data for item in discoverable_items]
-        return Response(data=data)
+        paginator = self.cursor_pagination_class()
+
+        weighted = request.query_params.get('weighted')
+        weighted = weighted.lower() in ('1', 'true', 'yes') if weighted is not None else self.discover_weighted
+
+        # Passing the same seed again returns the same sample, and the cursor reads on through it
+        page = list_undefined_known_items(ranker, self.item_class,
+                                          limit=paginator.get_page_size(request),
+                                          projection=self.item_projection,
+                                          seed=request.query_params.get('seed'),
+                                          after=paginator.get_after(request),
+                                          weighted=weighted,
+                                          filters=get_item_filters(self, request))
+        data = get_item_data(self, page.results)
+        return Response(data=paginator.get_paginated_data(request, data, page.after))
 
 
 class RankerPairwiseViewSet(GenericViewSet):
@@ -145,42 +253,36 @@ class RankerPairwiseViewSet(GenericViewSet):
     ranker_class = Ranker
     item_class = Item
     serialize_item = get_serializer_for_item
+    # Maps each output field of a list item to the node property it is read from, or None to serialize nodes
+    item_projection = None
+    # Maps each query parameter that filters lists to the item property and filter op it applies
+    item_filters = {}
+    cursor_pagination_class = GraphCursorPagination
 
     def get_queryset(self):
         pass
 
     def get_ranker(self):
-        try:
-            ranker = self.ranker_class.nodes.get(ranker_id=self.request.user.id)
-        except DoesNotExist:
-            raise Http404
-
-        self.check_object_permissions(self.request, ranker)
-
-        return ranker
+        return get_ranker(self)
 
     def get_items(self):
-        try:
-            preferred = self.item_class.nodes.get(item_id=self.kwargs['preferred_id'])
-            nonpreferred = self.item_class.nodes.get(
-                item_id=self.kwargs['nonpreferred_id'])
-        except DoesNotExist:
-            raise Http404
-
-        self.check_object_permissions(self.request, preferred)
-        self.check_object_permissions(self.request, nonpreferred)
-
+        preferred, nonpreferred = get_items(self, [self.kwargs['preferred_id'], self.kwargs['nonpreferred_id']])
         return preferred, nonpreferred
 
     def list(self, request, *args, **kwargs):
         ranker = self.get_ranker()
         ranker_data = self.serializer_class(ranker).data
 
-        preference_data = [[self.serialize_item(i).data, self.serialize_item(j).data]
-                           for i, j in get_direct_preferences(ranker, self.item_class)]
+        paginator = self.cursor_pagination_class()
+        page = get_direct_preferences_page(ranker, self.item_class,
+                                           after=paginator.get_after(request),
+                                           limit=paginator.get_page_size(request),
+                                           projection=self.item_projection)
+        preference_data = [get_item_data(self, pair) for pair in page.results]
 
         # Combine into a single JSON object
-        data = {'ranker': ranker_data, 'preferences': preference_data}
+        data = {'ranker': ranker_data,
+                **paginator.get_paginated_data(request, preference_data, page.after, results_key='preferences')}
 
         return Response(data)
 
@@ -197,16 +299,27 @@ class RankerPairwiseViewSet(GenericViewSet):
     def create(self, request, *args, **kwargs):
         ranker = self.get_ranker()
 
-        try:
-            preferences = [(self.item_class.nodes.get(item_id=preference['preferred_id']),
-                            self.item_class.nodes.get(item_id=preference['nonpreferred_id']))
-                           for preference in self.request.data['preferences']]
-        except DoesNotExist:
-            raise Http404
+        pairs = [(str(preference['preferred_id']), str(preference['nonpreferred_id']))
+                 for preference in self.request.data['preferences']]
 
-        warnings = insert_preferences(ranker, preferences)
+        # Check every id exists in one query, and reject only the pairs naming an item which does not
+        existing = find_existing_item_ids(self.item_class, [item_id for pair in pairs for item_id in pair])
+        accepted = iter(insert_preference_ids(ranker, [pair for pair in pairs if existing.issuperset(pair)]))
 
-        data = {'warnings': warnings} if warnings else {}
+        results, warnings = [], []
+        for preferred_id, nonpreferred_id in pairs:
+            result = {'preferred_id': preferred_id, 'nonpreferred_id': nonpreferred_id}
+            if not existing.issuperset((preferred_id, nonpreferred_id)):
+                result.update(accepted=False, reason='Item does not exist')
+            else:
+                result['accepted'] = next(accepted)
+            if not result['accepted']:
+                warnings.append(PREFERENCE_WARNING.format(preferred_id, nonpreferred_id))
+            results.append(result)
+
+        data = {'results': results}
+        if warnings:
+            data['warnings'] = warnings
 
         return Response(data=data, status=status.HTTP_201_CREATED)
 
@@ -215,3 +328,26 @@ class RankerPairwiseViewSet(GenericViewSet):
         preferred, nonpreferred = self.get_items()
         delete_direct_preference(ranker, preferred, nonpreferred)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ConsensusViewSet(GenericViewSet):
+    '''Every item ranked by the consensus of all rankers' preferences, which anyone may read'''
+    permission_classes = [AllowAny]
+    item_class = Item
+    serialize_item = get_serializer_for_item
+    # Maps each output field of a list item to the node property it is read from, or None to serialize nodes
+    item_projection = None
+    cursor_pagination_class = GraphCursorPagination
+
+    def get_queryset(self):
+        pass
+
+    def list(self, request, *args, **kwargs):
+        paginator = self.cursor_pagination_class()
+        page = consensus_page(self.item_class,
+                              after=paginator.get_after(request),
+                              limit=paginator.get_page_size(request),
+                              projection=self.item_projection)
+        items = get_item_data(self, [item for item, _, _ in page.results])
+        data = [{**item, 'score': score, 'games': games} for item, (_, score, games) in zip(items, page.results)]
+        return Response(data=paginator.get_paginated_data(request, data, page.after))
@@ -11,6 +11,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.rankable.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rankable.settings.dev')
+os.environ.setdefault('GRAPH_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
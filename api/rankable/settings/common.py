@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,7 +26,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.postgres',
-    'debug_toolbar',
     'rest_framework',
     'djoser',
     'django_neomodel',
@@ -36,7 +36,6 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,6 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'preferences.connection.GraphSessionMiddleware',
 ]
 
 ROOT_URLCONF = 'rankable.urls'
@@ -65,6 +65,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'rankable.wsgi.application'
+ASGI_APPLICATION = 'rankable.asgi.application'
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -133,4 +134,39 @@ DJOSER = {
     }
 }
 
-RANKED_ITEM_MODEL = 'movies.Movie'
\ No newline at end of file
+RANKED_ITEM_MODEL = 'movies.Movie'
+# Directory of cached IMDB-API result pages, read before calling the API and written after
+IMDB_CACHE_DIR = None
+# Only ever read cached pages, never the API
+IMDB_OFFLINE = False
+
+# Movie and user changes are written to the graph by the sync_graph worker, this many at a time
+GRAPH_SYNC_BATCH_SIZE = 1000
+# Write changes to the graph as soon as they are recorded, instead of leaving them to the worker
+GRAPH_SYNC_IMMEDIATE = False
+
+# Connections to Neo4j are pooled and shared by every thread, and a request holds at most one per access mode
+NEO4J_MAX_CONNECTION_POOL_SIZE = 100
+# Seconds a query waits for a free connection before failing
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = 60.0
+# Seconds before a pooled connection is closed and replaced
+NEO4J_MAX_CONNECTION_LIFETIME = 3600
+
+# Serve the ranker views as async views, each request on threads of its own, which rankable.asgi turns on
+GRAPH_ASYNC_VIEWS = os.environ.get('GRAPH_ASYNC_VIEWS') == '1'
+# Threads the async views run their requests on, which caps how many queries a worker has in flight
+GRAPH_ASYNC_THREADS = NEO4J_MAX_CONNECTION_POOL_SIZE
+
+# Items counted per query when refresh_popularity recounts who knows each item
+PREFERENCES_POPULARITY_BATCH_SIZE = 10000
+
+# Preferences read per query when refresh_consensus updates the consensus scores
+PREFERENCES_CONSENSUS_BATCH_SIZE = 100000
+
+# Directory that export_graph writes each export of the graph's edges into
+GRAPH_EXPORT_DIR = BASE_DIR.parent / 'exports'
+# Nearest neighbors of every item, built from the latest export by build_recommendations
+RECOMMENDATIONS_PATH = GRAPH_EXPORT_DIR / 'neighbors.npz'
+
+# Typeahead results are cached for a short time, and dropped as soon as any movie changes
+MOVIES_TYPEAHEAD_CACHE_TIMEOUT = 60
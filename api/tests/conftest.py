@@ -1,11 +1,21 @@
 import pytest
 from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from neomodel import db, install_all_labels, remove_all_labels, clear_neo4j_database
 from model_bakery import baker
 from users.models import User
 from movies.models import Movie
 from preferences.models import Item, Ranker
+from preferences import cypher
+from preferences.ordinals import forget_all_ordinals
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    '''Ids restart with every test database, so nothing cached by an earlier test may be read by a later one'''
+    cache.clear()
+    yield
 
 
 @pytest.fixture
@@ -91,15 +101,15 @@ def setup_neo4j():
 
     remove_all_labels()
     clear_neo4j_database(db)
+    forget_all_ordinals()
 
 @pytest.fixture()
 def insert_known_items():
     known_pairs = []
 
     def _insert_known_items(ranker: Ranker, items_to_know: list[Item], *args, **kwargs):
-        for item in items_to_know:
-            ranker.known_items.connect(item)
-            known_pairs.append((ranker, item))
+        cypher.insert_ranker_knows(ranker, items_to_know, [])
+        known_pairs.extend((ranker, item) for item in items_to_know)
         return
 
     yield _insert_known_items
@@ -113,9 +123,8 @@ def insert_unknown_items():
     unknown_pairs = []
 
     def _insert_unknown_items(ranker: Ranker, items_not_known: list[Item], *args, **kwargs):
-        for item in items_not_known:
-            ranker.unknown_items.connect(item)
-            unknown_pairs.append((ranker, item))
+        cypher.insert_ranker_knows(ranker, [], items_not_known)
+        unknown_pairs.extend((ranker, item) for item in items_not_known)
         return
 
     yield _insert_unknown_items
@@ -129,9 +138,10 @@ def insert_preferences():
     preference_triples = []
 
     def _insert_preferences(ranker: Ranker, item_pairs: list[tuple[Item, Item]], *args, **kwargs):
-        for i, j in item_pairs:
-            i.preferred_to_items.connect(j, {'by': ranker.ranker_id})
-            preference_triples.append((ranker, i, j))
+        # Through the same path as the api, so the descendant counts are kept as they would be
+        inserted = cypher.insert_preferences(ranker, item_pairs)
+        assert not inserted.warnings, inserted.warnings
+        preference_triples.extend((ranker, i, j) for i, j in item_pairs)
         return
 
     yield _insert_preferences
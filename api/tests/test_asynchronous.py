@@ -0,0 +1,99 @@
+import asyncio
+from time import perf_counter, sleep
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from core.models import Movie as MovieNode
+from core.views import MovieRankerKnowsViewSet, MovieRankerViewSet
+from preferences.asynchronous import GraphUserAuthentication, async_view, graph_view
+from preferences.cypher import Page
+
+
+def _authenticated_get(url, user):
+    return APIRequestFactory().get(url, HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+
+
+class TestAsyncView:
+    def test_returns_coroutine_view_keeping_viewset_attributes(self):
+        view = async_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+
+        assert asyncio.iscoroutinefunction(view)
+        assert view.cls is MovieRankerViewSet
+        assert view.csrf_exempt
+        assert view.initkwargs['authentication_classes'][0] is GraphUserAuthentication
+        assert MovieRankerViewSet.authentication_classes[0] is not GraphUserAuthentication
+
+    def test_if_async_views_not_set_returns_sync_view(self, settings):
+        settings.GRAPH_ASYNC_VIEWS = False
+
+        view = graph_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+
+        assert not asyncio.iscoroutinefunction(view)
+
+    @pytest.mark.django_db
+    def test_if_authenticated_get_returns_sorted_list(self, user_with_movie_preferences):
+        view = async_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+        request = _authenticated_get('/api/movies/sort/', user_with_movie_preferences)
+
+        response = async_to_sync(view)(request)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 5
+
+    @pytest.mark.django_db
+    def test_if_graph_call_is_slow_second_request_is_not_blocked(self, user_with_movie_preferences, monkeypatch):
+        def slow_sort_page(*args, **kwargs):
+            sleep(0.5)
+            return Page([], None)
+        monkeypatch.setattr('preferences.views.topological_sort_page', slow_sort_page)
+        view = async_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+        requests = [_authenticated_get('/api/movies/sort/', user_with_movie_preferences) for _ in range(2)]
+
+        async def get_both():
+            started = perf_counter()
+            responses = await asyncio.gather(*[view(request) for request in requests])
+            return responses, perf_counter() - started
+
+        responses, elapsed = async_to_sync(get_both)()
+
+        assert [response.status_code for response in responses] == [status.HTTP_200_OK] * 2
+        assert elapsed < 1.0
+
+    @pytest.mark.django_db
+    def test_reads_ranker_and_items_before_view_runs(self, user_with_movie_preferences):
+        view = async_view(MovieRankerKnowsViewSet, {'get': 'retrieve'})
+        item_id = MovieNode.nodes.all()[0].item_id
+        request = _authenticated_get(f'/api/movies/knows/{item_id}/', user_with_movie_preferences)
+
+        response = async_to_sync(view)(request, item_id=item_id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert request.graph_nodes['ranker'].ranker_id == str(user_with_movie_preferences.id)
+        assert list(request.graph_nodes['items']) == [item_id]
+
+    @pytest.mark.django_db
+    def test_if_not_authenticated_get_returns_401(self):
+        view = async_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+        request = APIRequestFactory().get('/api/movies/sort/')
+
+        response = async_to_sync(view)(request)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert not hasattr(request, 'graph_user')
+
+    @pytest.mark.django_db
+    def test_authenticates_user_read_before_view_runs(self, user_with_movie_preferences, monkeypatch):
+        # The user read along with the graph nodes is the one the view sees, without authenticating again
+        def authenticate(self, request):
+            raise AssertionError('The token was authenticated again')
+        monkeypatch.setattr(JWTAuthentication, 'authenticate', authenticate)
+        view = async_view(MovieRankerViewSet, {'get': 'get_sorted_list'})
+        request = _authenticated_get('/api/movies/sort/', user_with_movie_preferences)
+
+        response = async_to_sync(view)(request)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert request.graph_user == user_with_movie_preferences
@@ -0,0 +1,45 @@
+import inspect
+import random
+import re
+from benchmarks import endpoints, functions
+from benchmarks.timing import find_regressions, percentile
+from core.urls import urlpatterns
+from preferences import cypher
+
+
+class TestBenchmarkTiming:
+    def test_if_percentile_of_samples_returns_nearest_rank(self):
+        samples = [5.0, 1.0, 3.0, 2.0, 4.0]
+
+        assert percentile(samples, 50) == 3.0
+        assert percentile(samples, 99) == 5.0
+        assert percentile([], 50) == 0.0
+
+    def test_if_slower_than_threshold_returns_regression(self):
+        baseline = {'tiny': {'functions': {'topological_sort': {'p50_ms': 10.0},
+                                           'insert_preference_ids': {'p50_ms': 10.0}}}}
+        results = {'tiny': {'functions': {'topological_sort': {'p50_ms': 20.0},
+                                          'insert_preference_ids': {'p50_ms': 12.0}},
+                            'endpoints': {'GET /api/movies/sort/': {'p50_ms': 50.0}}}}
+
+        regressions = find_regressions(baseline, results, threshold=1.5)
+
+        assert [regression['name'] for regression in regressions] == ['tiny/functions/topological_sort']
+        assert regressions[0]['ratio'] == 2.0
+
+
+class TestBenchmarkCoverage:
+    def test_if_every_public_cypher_function_has_a_case(self):
+        public = {name for name, member in inspect.getmembers(cypher, inspect.isfunction)
+                  if member.__module__ == cypher.__name__ and not name.startswith('_')}
+
+        cases = functions._cases(['bm00000000', 'bm00000001'], random.Random(0))
+
+        assert public - set(cases) == set()
+
+    def test_if_every_core_endpoint_has_a_case(self):
+        routes = {'/' + re.sub(r'<\w+:', '<', str(pattern.pattern)) for pattern in urlpatterns}
+
+        cases = [*endpoints._cases(['bm00000000'], random.Random(0)), *endpoints._admin_cases()]
+
+        assert routes - {name.split(' ', 1)[1] for name in cases} == set()
@@ -0,0 +1,71 @@
+import pytest
+from core.models import Movie as MovieNode, User as UserNode
+from preferences.cache import get_or_set_for_ranker, invalidate_ranker, ranker_version
+from preferences.cypher import (delete_direct_preference, get_direct_preferences, insert_items, insert_preference_ids,
+                                insert_ranker_knows_ids, topological_sort)
+from preferences.membership import item_statuses
+
+
+@pytest.fixture
+def ranker_knowing_movies(setup_neo4j, bake_user, bake_movie):
+    ranker = UserNode.nodes.get(ranker_id=bake_user().id)
+    movie_ids = [movie.id for movie in bake_movie(_quantity=3)]
+    insert_ranker_knows_ids(ranker, movie_ids, [])
+    return ranker, movie_ids
+
+
+class TestRankerCache:
+    def test_if_cached_does_not_compute_again(self):
+        calls = []
+
+        first = get_or_set_for_ranker('ranker', 'name', lambda: calls.append(1) or 'result')
+        second = get_or_set_for_ranker('ranker', 'name', lambda: calls.append(1) or 'result')
+
+        assert first == second == 'result'
+        assert len(calls) == 1
+
+    def test_if_invalidated_computes_again(self):
+        get_or_set_for_ranker('ranker', 'name', lambda: 'old')
+        version = ranker_version('ranker')
+
+        invalidate_ranker('ranker')
+
+        assert ranker_version('ranker') > version
+        assert get_or_set_for_ranker('ranker', 'name', lambda: 'new') == 'new'
+
+    @pytest.mark.django_db
+    def test_if_preference_inserted_read_after_misses(self, ranker_knowing_movies):
+        ranker, movie_ids = ranker_knowing_movies
+        assert get_direct_preferences(ranker, MovieNode) == []
+
+        insert_preference_ids(ranker, [(movie_ids[0], movie_ids[1])])
+
+        assert [(i.item_id, j.item_id) for i, j in get_direct_preferences(ranker, MovieNode)] == [tuple(movie_ids[:2])]
+
+    @pytest.mark.django_db
+    def test_if_preference_deleted_read_after_misses(self, ranker_knowing_movies):
+        ranker, movie_ids = ranker_knowing_movies
+        insert_preference_ids(ranker, [(movie_ids[0], movie_ids[1])])
+        [(preferred, nonpreferred)] = get_direct_preferences(ranker, MovieNode)
+
+        delete_direct_preference(ranker, preferred, nonpreferred)
+
+        assert get_direct_preferences(ranker, MovieNode) == []
+
+    @pytest.mark.django_db
+    def test_if_marked_unknown_read_after_misses(self, ranker_knowing_movies):
+        ranker, movie_ids = ranker_knowing_movies
+        assert item_statuses(ranker.ranker_id, movie_ids[:1]) == {movie_ids[0]: True}
+
+        insert_ranker_knows_ids(ranker, [], movie_ids[:1])
+
+        assert item_statuses(ranker.ranker_id, movie_ids[:1]) == {movie_ids[0]: False}
+
+    @pytest.mark.django_db
+    def test_if_known_item_updated_read_after_misses(self, ranker_knowing_movies):
+        ranker, movie_ids = ranker_knowing_movies
+        topological_sort(ranker, MovieNode)
+
+        insert_items(MovieNode, [{'item_id': movie_ids[0], 'title': 'Renamed'}])
+
+        assert {movie.item_id: movie.title for movie in topological_sort(ranker, MovieNode)}[movie_ids[0]] == 'Renamed'
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient
+from rest_framework import status
+from core.models import Movie as MovieNode
+from preferences.connection import GraphSessionMiddleware, _Metrics, _request_sessions, metrics
+from preferences.cypher import list_item_properties
+
+
+class TestMetrics:
+    def test_if_timings_recorded_reports_count_mean_and_max(self):
+        timings = _Metrics()
+
+        timings.record('query.read', 1.0)
+        timings.record('query.read', 3.0)
+
+        assert timings.snapshot() == {'query.read': {'count': 2, 'mean_ms': 2.0, 'max_ms': 3.0}}
+
+    def test_if_reset_reports_nothing(self):
+        timings = _Metrics()
+        timings.record('begin', 1.0)
+
+        timings.reset()
+
+        assert timings.snapshot() == {}
+
+
+class TestGraphMetrics:
+    url = '/api/graph/metrics/'
+
+    @pytest.mark.django_db
+    def test_if_not_admin_get_returns_403(self, authenticated_user_client):
+        response = authenticated_user_client.get(self.url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.mark.django_db
+    def test_if_admin_after_reading_graph_reports_read_queries(self, setup_neo4j, bake_user, create_client):
+        client = create_client(bake_user(is_staff=True))
+        metrics.reset()
+        list_item_properties(MovieNode)
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['query.read']['count'] >= 1
+
+
+class TestGraphSessionMiddleware:
+    @pytest.mark.django_db
+    def test_if_served_sync_shares_one_session_across_reads(self, setup_neo4j):
+        def get_response(request):
+            list_item_properties(MovieNode)
+            list_item_properties(MovieNode)
+            return _request_sessions.get()
+
+        sessions = GraphSessionMiddleware(get_response)(None)
+
+        assert len(sessions) == 1
+        assert _request_sessions.get() is None
+
+    @pytest.mark.django_db
+    def test_if_served_async_shares_one_session_across_reads(self, setup_neo4j):
+        @sync_to_async
+        def read():
+            list_item_properties(MovieNode)
+            list_item_properties(MovieNode)
+
+        async def get_response(request):
+            await read()
+            return _request_sessions.get()
+
+        middleware = GraphSessionMiddleware(get_response)
+        sessions = async_to_sync(middleware)(None)
+
+        assert asyncio.iscoroutinefunction(middleware)
+        assert len(sessions) == 1
+        assert _request_sessions.get() is None
+
+    @pytest.mark.django_db
+    def test_if_requested_with_async_client_returns_200(self, setup_neo4j):
+        async def get():
+            return await AsyncClient().get('/api/movies/consensus/')
+
+        response = async_to_sync(get)()
+
+        assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from django.core.cache import cache
+from neomodel import db
+from neomodel.exceptions import UniqueProperty
+from rest_framework import status
+from preferences import queries
+from preferences.consensus import _LOCK_KEY, refresh_consensus, update_scores
+
+
+class TestUpdateScores:
+    def test_if_preferred_score_rises_above_nonpreferred(self):
+        scores, counts = np.zeros(3), np.zeros(3, dtype=np.int64)
+
+        update_scores(scores, counts, np.array([0, 0]), np.array([1, 2]))
+
+        assert scores[0] > 0 > scores[1]
+        assert scores[1] == scores[2]
+        assert list(counts) == [2, 1, 1]
+
+    def test_if_expected_result_moves_less_than_upset(self):
+        scores, counts = np.array([2.0, 0.0]), np.zeros(2, dtype=np.int64)
+        expected = scores.copy()
+        update_scores(expected, counts, np.array([0]), np.array([1]))
+
+        upset = scores.copy()
+        update_scores(upset, counts, np.array([1]), np.array([0]))
+
+        assert expected[0] - scores[0] < upset[1] - scores[1]
+
+
+@pytest.fixture
+def preferences_created_at(user_with_movie_preferences):
+    '''Sets the creation time of every preference, or removes it for None'''
+    def _preferences_created_at(created):
+        db.cypher_query("MATCH ()-[p:PREFERRED_TO_BY]->() SET p.created = $created", {'created': created})
+    return _preferences_created_at
+
+
+class TestRefreshConsensus:
+    @pytest.mark.django_db
+    def test_if_preference_at_end_of_last_window_is_not_read_again(self, preferences_created_at):
+        preferences_created_at(1000)
+        db.cypher_query(queries.SET_CONSENSUS_STATE, {'until': 1000})
+
+        assert refresh_consensus() == 0
+
+    @pytest.mark.django_db
+    def test_if_preference_after_last_window_is_read_once(self, preferences_created_at):
+        preferences_created_at(1000)
+        db.cypher_query(queries.SET_CONSENSUS_STATE, {'until': 999})
+
+        assert refresh_consensus() == 5
+        assert refresh_consensus() == 0
+
+    @pytest.mark.django_db
+    def test_if_rebuild_reads_preferences_without_creation_time(self, preferences_created_at):
+        preferences_created_at(None)
+
+        assert refresh_consensus(rebuild=True) == 5
+
+    @pytest.mark.django_db
+    def test_if_another_run_holds_lock_nothing_is_read(self, preferences_created_at):
+        preferences_created_at(1000)
+        db.cypher_query(queries.SET_CONSENSUS_STATE, {'until': 999})
+        cache.add(_LOCK_KEY, 'other', timeout=60)
+        try:
+            assert refresh_consensus() is None
+        finally:
+            cache.delete(_LOCK_KEY)
+
+        assert refresh_consensus() == 5
+        assert cache.get(_LOCK_KEY) is None
+
+    @pytest.mark.django_db
+    def test_if_state_created_again_raises(self, preferences_created_at):
+        preferences_created_at(1000)
+        db.cypher_query(queries.SET_CONSENSUS_STATE, {'until': 999})
+
+        with pytest.raises(UniqueProperty):
+            db.cypher_query("CREATE (:Consensus {name: 'bradley_terry', until: -1})")
+
+        assert refresh_consensus() == 5
+
+
+class TestMovieConsensus:
+    url = '/api/movies/consensus/'
+
+    @pytest.mark.django_db
+    def test_if_not_authenticated_get_returns_200(self, api_client, setup_neo4j):
+        response = api_client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'results' in response.data
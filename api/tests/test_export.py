@@ -0,0 +1,47 @@
+import pytest
+from rest_framework import status
+from preferences.export import read_export, read_ids, write_export
+
+
+class TestWriteExport:
+    @pytest.mark.django_db
+    def test_if_exported_edges_match_graph(self, user_with_movie_preferences, tmp_path):
+        manifest = write_export(tmp_path)
+        export = read_export(tmp_path / manifest['name'])
+
+        rankers = read_ids(tmp_path / manifest['name'], 'rankers')
+        items = read_ids(tmp_path / manifest['name'], 'items')
+        ranker, preferred, nonpreferred = export.columns('preferences')
+
+        assert rankers == [str(user_with_movie_preferences.id)]
+        assert manifest['tables']['knows']['rows'] == 5
+        assert manifest['tables']['unknown']['rows'] == 1
+        assert len(ranker) == 5
+        assert all(items[ordinal] for ordinal in preferred) and all(items[ordinal] for ordinal in nonpreferred)
+
+    @pytest.mark.django_db
+    def test_if_exported_twice_at_once_writes_both(self, setup_neo4j, tmp_path):
+        first, second = write_export(tmp_path), write_export(tmp_path)
+
+        assert first['name'] != second['name']
+        assert (tmp_path / first['name'] / 'manifest.json').exists()
+        assert (tmp_path / second['name'] / 'manifest.json').exists()
+
+
+class TestExportGraph:
+    url = '/api/graph/export/'
+
+    @pytest.mark.django_db
+    def test_if_not_admin_get_returns_403(self, authenticated_user_client):
+        response = authenticated_user_client.get(self.url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.mark.django_db
+    def test_if_admin_and_no_export_get_returns_404(self, bake_user, create_client, settings, tmp_path):
+        settings.GRAPH_EXPORT_DIR = tmp_path
+        client = create_client(bake_user(is_staff=True))
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
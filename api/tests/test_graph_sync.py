@@ -0,0 +1,119 @@
+import threading
+from datetime import timedelta
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+from neomodel import db
+from core.models import Movie as MovieNode, SyncEvent
+from core.sync import MAX_BACKOFF, _defer, apply_events, flush, reconcile
+from movies.models import Genre
+from preferences.models import Item, Ranker
+
+
+@pytest.mark.django_db
+class TestGraphSync:
+    def test_if_movie_saved_creates_node_and_empties_queue(self, setup_neo4j, bake_movie):
+        movie = bake_movie(title='Synced', year=2001)
+
+        node = MovieNode.nodes.get(item_id=movie.id)
+        assert (node.title, node.year) == ('Synced', 2001)
+        assert not SyncEvent.objects.exists()
+
+    def test_if_movie_updated_updates_node(self, setup_neo4j, bake_movie):
+        movie = bake_movie(title='Before')
+        movie.title = 'After'
+        movie.save()
+
+        assert MovieNode.nodes.get(item_id=movie.id).title == 'After'
+
+    def test_if_genre_added_updates_node_genre_ids(self, setup_neo4j, bake_movie):
+        movie = bake_movie()
+        genre = Genre.objects.create(name='Horror')
+        movie.genres.add(genre)
+
+        assert MovieNode.nodes.get(item_id=movie.id).genre_ids == [genre.id]
+
+        genre.delete()
+
+        assert MovieNode.nodes.get(item_id=movie.id).genre_ids == []
+
+    def test_if_user_deleted_deletes_ranker(self, setup_neo4j, bake_user):
+        user = bake_user()
+        user_id = str(user.id)
+        user.delete()
+
+        assert Ranker.nodes.get_or_none(ranker_id=user_id) is None
+
+    def test_if_upsert_then_delete_applied_together_leaves_no_node(self, setup_neo4j):
+        apply_events([SyncEvent(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_UPSERT,
+                                object_id='tt0000001', payload={'title': 'Gone', 'year': 1999}),
+                      SyncEvent(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_DELETE,
+                                object_id='tt0000001')])
+
+        assert Item.nodes.get_or_none(item_id='tt0000001') is None
+
+    def test_if_earlier_event_held_back_flush_skips_later_events_for_object(self, setup_neo4j):
+        held_back = SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_UPSERT,
+                                             object_id='tt0000001', payload={'title': 'First', 'year': 1999},
+                                             available_at=timezone.now() + timedelta(minutes=5), attempts=1)
+        later = SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_DELETE,
+                                         object_id='tt0000001')
+        SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_UPSERT,
+                                 object_id='tt0000002', payload={'title': 'Other', 'year': 2000})
+
+        assert flush() == 1
+        assert set(SyncEvent.objects.values_list('id', flat=True)) == {held_back.id, later.id}
+        assert Item.nodes.get_or_none(item_id='tt0000002') is not None
+
+    def test_if_event_failed_many_times_it_is_held_back_for_max_backoff(self):
+        event = SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_DELETE,
+                                         object_id='tt0000001', attempts=100)
+        before = timezone.now()
+
+        _defer([(event, RuntimeError('graph unavailable'))])
+
+        event.refresh_from_db()
+        assert event.attempts == 101
+        assert before + MAX_BACKOFF <= event.available_at <= timezone.now() + MAX_BACKOFF
+
+    def test_if_node_missing_reconcile_reports_and_fixes_it(self, setup_neo4j, bake_movie):
+        movie = bake_movie()
+        db.cypher_query("MATCH (i:Item {item_id: $item_id}) DETACH DELETE i", {'item_id': movie.id})
+
+        assert reconcile()['movies']['missing'] == 1
+
+        reconcile(fix=True)
+
+        assert reconcile()['movies'] == {'missing': 0, 'stale': 0, 'extra': 0}
+        assert MovieNode.nodes.get(item_id=movie.id).title == movie.title
+
+
+@pytest.mark.django_db(transaction=True)
+def test_if_earlier_event_locked_by_another_worker_flush_skips_later_events_for_object(setup_neo4j):
+    earlier = SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_UPSERT,
+                                       object_id='tt0000001', payload={'title': 'First', 'year': 1999})
+    later = SyncEvent.objects.create(kind=SyncEvent.KIND_MOVIE, operation=SyncEvent.OPERATION_DELETE,
+                                     object_id='tt0000001')
+    locked, release = threading.Event(), threading.Event()
+
+    def _other_worker():
+        # Holds the earlier event as a worker applying it would, on a connection of its own
+        try:
+            with transaction.atomic():
+                list(SyncEvent.objects.select_for_update().filter(id=earlier.id))
+                locked.set()
+                release.wait(10)
+        finally:
+            connection.close()
+
+    worker = threading.Thread(target=_other_worker)
+    worker.start()
+    try:
+        assert locked.wait(10)
+        applied = flush()
+    finally:
+        release.set()
+        worker.join()
+
+    assert applied == 0
+    assert set(SyncEvent.objects.values_list('id', flat=True)) == {earlier.id, later.id}
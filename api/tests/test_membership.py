@@ -0,0 +1,146 @@
+from array import array
+import numpy as np
+import pytest
+from neomodel import clear_neo4j_database, db
+from neomodel.exceptions import UniqueProperty
+from core.models import Movie as MovieNode, User as UserNode
+from preferences.cypher import (insert_items, insert_ranker_knows_ids, insert_rankers, ranker_does_not_know_item,
+                                ranker_knows_item)
+from preferences.models import Item, Ranker
+from preferences.membership import UNDEFINED, Membership, item_statuses
+from preferences.ordinals import assign_missing_ordinals, get_ordinals, reserve_ordinals
+from preferences.popularity import Popularity, item_weight
+from preferences.sampling import candidate_ordinals, get_order
+
+
+class TestMembership:
+    def test_if_ordinal_in_known_returns_true(self):
+        membership = Membership(array('i', [1, 4, 9]), array('i', [2, 7]))
+
+        assert membership.status(4) is True
+        assert membership.status(7) is False
+
+    def test_if_ordinal_in_neither_returns_undefined(self):
+        membership = Membership(array('i', [1, 4, 9]), array('i', [2, 7]))
+
+        assert membership.status(0) == UNDEFINED
+        assert membership.status(5) == UNDEFINED
+        assert membership.status(10) == UNDEFINED
+        assert Membership(array('i'), array('i')).status(1) == UNDEFINED
+
+
+class TestCandidateOrdinals:
+    def test_if_sampled_never_returns_classified_ordinals(self):
+        membership = Membership(array('i', range(0, 100, 2)), array('i', range(1, 100, 4)))
+
+        ordinals = [ordinal for chunk in candidate_ordinals(get_order('ranker', 'seed'), 100, membership, chunk_size=7)
+                    for _, ordinal in chunk]
+
+        assert sorted(ordinals) == list(range(3, 100, 4))
+
+    def test_if_same_seed_returns_same_candidates(self):
+        membership = Membership(array('i', [1, 2, 3]), array('i'))
+
+        first = next(candidate_ordinals(get_order('ranker', 'seed'), 10 ** 6, membership))
+        second = next(candidate_ordinals(get_order('ranker', 'seed'), 10 ** 6, membership))
+
+        assert first == second
+
+    def test_if_read_after_cursor_returns_rest_of_same_order(self):
+        order = get_order('ranker', 'seed')
+        empty = Membership(array('i'), array('i'))
+        whole = [pair for chunk in candidate_ordinals(order, 50, empty) for pair in chunk]
+
+        # Marking items known does not move the rest of the order, before or after the cursor
+        membership = Membership(array('i', sorted([whole[5][1], whole[20][1]])), array('i'))
+        rest = [pair for chunk in candidate_ordinals(order, 50, membership, after=list(whole[9]), chunk_size=4)
+                for pair in chunk]
+
+        assert rest == whole[10:20] + whole[21:]
+
+    def test_if_weighted_draws_heaviest_first_and_uncounted_items_too(self):
+        membership = Membership(array('i', [3]), array('i'))
+        popularity = Popularity(np.array([0.5, 0.5, 0.5, 10.0 ** 6, 0.5, 10.0 ** 6]))
+
+        ordinals = [ordinal for chunk in candidate_ordinals(get_order('ranker', 'seed'), 8, membership,
+                                                            weights=popularity.weights(8))
+                    for _, ordinal in chunk]
+
+        assert ordinals[0] == 5
+        assert sorted(ordinals) == [0, 1, 2, 4, 5, 6, 7]
+
+
+class TestPopularity:
+    def test_if_widely_known_weighs_more(self):
+        assert item_weight(100, 10) > item_weight(10, 10) > item_weight(10, 100)
+        assert item_weight(0, 0) > 0
+
+
+@pytest.mark.django_db
+class TestOrdinals:
+    def test_if_graph_cleared_and_item_created_again_returns_new_ordinal(self, setup_neo4j):
+        insert_items(MovieNode, [{'item_id': 'first'}, {'item_id': 'second'}])
+        assert get_ordinals(['second']) == {'second': 1}
+
+        clear_neo4j_database(db)
+        insert_items(MovieNode, [{'item_id': 'second'}])
+
+        assert get_ordinals(['second']) == {'second': 0}
+
+    def test_if_item_deleted_around_delete_item_ids_and_created_again_returns_new_ordinal(self, setup_neo4j):
+        insert_items(MovieNode, [{'item_id': 'first'}, {'item_id': 'second'}])
+        assert get_ordinals(['first']) == {'first': 0}
+
+        db.cypher_query("MATCH (i:Item {item_id: 'first'}) DETACH DELETE i")
+        insert_items(MovieNode, [{'item_id': 'first'}])
+
+        assert get_ordinals(['first']) == {'first': 2}
+
+    def test_if_sequence_created_again_raises(self, setup_neo4j):
+        assert reserve_ordinals(2) == range(0, 2)
+
+        with pytest.raises(UniqueProperty):
+            db.cypher_query("CREATE (:Sequence {name: 'item_ordinal', next: 0})")
+
+        assert reserve_ordinals(1) == range(2, 3)
+
+    def test_if_item_has_no_ordinal_get_leaves_it_out_without_assigning_one(self, setup_neo4j):
+        db.cypher_query("CREATE (:Item:Movie {item_id: 'legacy'})")
+
+        assert get_ordinals(['legacy']) == {}
+        results, _ = db.cypher_query("MATCH (i:Item {item_id: 'legacy'}) RETURN i.ordinal")
+        assert results[0][0] is None
+
+        assign_missing_ordinals()
+
+        assert get_ordinals(['legacy']) == {'legacy': 0}
+
+    def test_if_id_has_no_item_get_caches_that_until_item_inserted(self, setup_neo4j, monkeypatch):
+        assert get_ordinals(['later']) == {}
+        statements = []
+        cypher_query = db.cypher_query
+        monkeypatch.setattr(db, 'cypher_query',
+                            lambda query, *args, **kwargs: statements.append(query) or cypher_query(query, *args, **kwargs))
+
+        assert get_ordinals(['later']) == {}
+        assert statements == []
+
+        insert_items(MovieNode, [{'item_id': 'later'}])
+
+        assert get_ordinals(['later']) == {'later': 0}
+
+
+@pytest.mark.django_db
+class TestItemStatuses:
+    def test_if_legacy_item_with_no_ordinal_known_returns_true(self, setup_neo4j):
+        db.cypher_query("CREATE (:Item:Movie {item_id: 'known'}), (:Item:Movie {item_id: 'unknown'}), "
+                        "(:Item:Movie {item_id: 'unstated'})")
+        insert_rankers(UserNode, ['ranker'])
+        ranker = Ranker.nodes.get(ranker_id='ranker')
+        insert_ranker_knows_ids(ranker, known_ids=['known'], unknown_ids=['unknown'])
+
+        assert get_ordinals(['known', 'unknown', 'unstated']) == {}
+        assert ranker_knows_item(ranker, Item.nodes.get(item_id='known'))
+        assert ranker_does_not_know_item(ranker, Item.nodes.get(item_id='unknown'))
+        assert item_statuses('ranker', ['known', 'unknown', 'unstated']) == {
+            'known': True, 'unknown': False, 'unstated': UNDEFINED}
@@ -1,7 +1,14 @@
 import json
+from base64 import urlsafe_b64encode
 import pytest
+from neomodel import db
 from rest_framework import status
+from preferences.cypher import (ItemFilter, delete_all_queued_compares, delete_item_ids, insert_queued_compares,
+                               list_undefined_known_items)
 from preferences.models import Item, Ranker
+from core.models import Movie as MovieNode, User as UserNode
+from core.serializers import MovieNodeSerialiazer
+from movies.models import Genre, Star
 
 
 class TestMovieDiscover:
@@ -18,6 +25,59 @@ class TestMovieDiscover:
 
         assert response.status_code == status.HTTP_200_OK
 
+    @pytest.mark.django_db
+    def test_if_seeded_get_returns_same_sample(self, user_client_with_movie_preferences):
+        first = user_client_with_movie_preferences.get(self.url, {'seed': 'abc'})
+        second = user_client_with_movie_preferences.get(self.url, {'seed': 'abc'})
+
+        assert first.data['results'] == second.data['results']
+
+    @pytest.mark.django_db
+    def test_if_filtered_by_rare_star_reads_one_query(self, setup_neo4j, bake_user, bake_movie, monkeypatch):
+        user = bake_user()
+        movies = bake_movie(_quantity=30)
+        star = Star.objects.create(name='Rare Star')
+        movies[7].stars.add(star)
+        ranker = UserNode.nodes.get(ranker_id=user.id)
+        statements = []
+        cypher_query = db.cypher_query
+        monkeypatch.setattr(db, 'cypher_query',
+                            lambda query, *args, **kwargs: statements.append(query) or cypher_query(query, *args, **kwargs))
+
+        page = list_undefined_known_items(ranker, MovieNode, limit=10, filters=[ItemFilter('star_ids', 'any', [star.id])])
+
+        assert [movie.item_id for movie in page.results] == [movies[7].id]
+        assert len(statements) == 1
+
+    @pytest.mark.django_db
+    def test_if_cursor_invalid_returns_404(self, user_client_with_movie_preferences):
+        response = user_client_with_movie_preferences.get(self.url, {'cursor': 'x'})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('after', [[], ['seed'], [1, 2, 3], ['seed', 'x', 3], ['seed', 0.5, 'x'], ['seed', 1, 2, 3]])
+    def test_if_cursor_not_seed_position_and_ordinal_returns_404(self, user_client_with_movie_preferences, after):
+        cursor = urlsafe_b64encode(json.dumps(after).encode('ascii')).decode('ascii')
+
+        response = user_client_with_movie_preferences.get(self.url, {'cursor': cursor})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.django_db
+    def test_if_items_marked_between_pages_next_page_neither_skips_nor_repeats(self, setup_neo4j, bake_user,
+                                                                              bake_movie, create_client):
+        client = create_client(bake_user())
+        bake_movie(_quantity=6)
+        whole = [movie['id'] for movie in client.get(self.url, {'seed': 'abc', 'page_size': 6}).data['results']]
+        first = client.get(self.url, {'seed': 'abc', 'page_size': 2})
+
+        client.post('/api/movies/knows/', {'known_ids': [whole[0]], 'unknown_ids': [whole[2]]}, format='json')
+        second = client.get(first.data['next'])
+
+        assert [movie['id'] for movie in first.data['results']] == whole[:2]
+        assert [movie['id'] for movie in second.data['results']] == whole[3:5]
+
 
 class TestMovieKnowsList:
     url = '/api/movies/knows/'
@@ -53,6 +113,18 @@ class TestMovieKnowsList:
 
         assert response.status_code == status.HTTP_201_CREATED
 
+    @pytest.mark.django_db
+    def test_if_movie_dne_post_returns_201_with_missing_ids(self, setup_neo4j, authenticated_user_client, bake_movie):
+        known_movie = bake_movie()
+
+        data = {'known_ids': [known_movie.id, 'xxxgarbagexxx'], 'unknown_ids': []}
+
+        response = authenticated_user_client.post(
+            self.url, data, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['missing_ids'] == ['xxxgarbagexxx']
+
 
 class TestMovieKnowsDetail:
     url = '/api/movies/knows/'
@@ -148,6 +220,140 @@ class TestMovieSort():
 
         assert response.status_code == status.HTTP_200_OK
 
+    @pytest.mark.django_db
+    def test_if_preferences_posted_get_returns_sorted_order(self, setup_neo4j, create_client, bake_user, bake_movie, insert_known_items):
+        user = bake_user()
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        movies = bake_movie(_quantity=4)
+        items = [Item.nodes.get(item_id=movie.id) for movie in movies]
+        insert_known_items(ranker, items)
+        client = create_client(user)
+
+        # D->C->B->A
+        data = {'preferences':
+                [{'preferred_id': items[i].item_id, 'nonpreferred_id': items[j].item_id}
+                 for i, j in [(3, 2), (2, 1), (1, 0)]]}
+        client.post('/api/movies/preferences/', data, format='json')
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [movie['id'] for movie in response.data['results']] == [items[i].item_id for i in [3, 2, 1, 0]]
+
+    @pytest.fixture
+    def chain(self, setup_neo4j, create_client, bake_user, bake_movie, insert_known_items, insert_preferences):
+        '''A client whose ranker prefers D->C->B->A, seeded through the fixtures rather than the api'''
+        user = bake_user()
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        movies = bake_movie(_quantity=4)
+        items = [Item.nodes.get(item_id=movie.id) for movie in movies]
+        insert_known_items(ranker, items)
+        insert_preferences(ranker, [(items[i], items[j]) for i, j in [(3, 2), (2, 1), (1, 0)]])
+        return create_client(user), [item.item_id for item in items]
+
+    @pytest.mark.django_db
+    def test_if_preferences_inserted_get_returns_sorted_order(self, chain):
+        client, item_ids = chain
+
+        response = client.get(self.url)
+
+        assert [movie['id'] for movie in response.data['results']] == [item_ids[i] for i in [3, 2, 1, 0]]
+
+    @pytest.mark.django_db
+    def test_if_preference_deleted_get_returns_new_order(self, chain):
+        client, item_ids = chain
+        client.delete(f'/api/movies/preferences/{item_ids[2]}/{item_ids[1]}/')
+
+        response = client.get(self.url)
+
+        # D->C and B->A are left, so D and B each have one descendant and lead C and A
+        assert {movie['id'] for movie in response.data['results'][:2]} == {item_ids[3], item_ids[1]}
+
+    @pytest.mark.django_db
+    def test_if_knows_deleted_get_returns_new_order(self, chain):
+        client, item_ids = chain
+        client.delete(f'/api/movies/knows/{item_ids[2]}/')
+
+        response = client.get(self.url)
+
+        # Only B->A is left
+        assert response.data['results'][0]['id'] == item_ids[1]
+
+    @pytest.mark.django_db
+    def test_if_item_deleted_get_returns_new_order(self, chain):
+        client, item_ids = chain
+        delete_item_ids([item_ids[2]])
+
+        response = client.get(self.url)
+
+        assert response.data['results'][0]['id'] == item_ids[1]
+
+    @pytest.mark.django_db
+    def test_if_descendant_counts_missing_get_returns_sorted_order(self, chain):
+        client, item_ids = chain
+        # As for a ranker whose preferences were stored before descendant counts were kept
+        db.cypher_query("MATCH (:Ranker)-[k:KNOWS]->(:Item) REMOVE k.descendants")
+
+        response = client.get(self.url)
+
+        assert [movie['id'] for movie in response.data['results']] == [item_ids[i] for i in [3, 2, 1, 0]]
+
+    @pytest.mark.django_db
+    def test_if_filtered_by_genre_get_returns_only_that_genre(self, setup_neo4j, create_client, bake_user, bake_movie,
+                                                             insert_known_items):
+        user = bake_user()
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        movies = bake_movie(_quantity=3)
+        genre = Genre.objects.create(name='Horror')
+        movies[1].genres.add(genre)
+        insert_known_items(ranker, [Item.nodes.get(item_id=movie.id) for movie in movies])
+
+        response = create_client(user).get(self.url, {'genre': genre.id})
+
+        assert [movie['id'] for movie in response.data['results']] == [movies[1].id]
+
+    @pytest.mark.django_db
+    def test_if_filter_invalid_get_returns_400(self, user_client_with_movie_preferences):
+        response = user_client_with_movie_preferences.get(self.url, {'year_min': 'recent'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.django_db
+    def test_if_paginated_get_returns_each_item_once_in_order(self, user_client_with_movie_preferences):
+        full_response = user_client_with_movie_preferences.get(self.url)
+
+        ids = []
+        response = user_client_with_movie_preferences.get(self.url, {'page_size': 2})
+        while True:
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['results']) <= 2
+            ids += [movie['id'] for movie in response.data['results']]
+            if not response.data['next']:
+                break
+            response = user_client_with_movie_preferences.get(response.data['next'])
+
+        assert ids == [movie['id'] for movie in full_response.data['results']]
+
+    @pytest.mark.django_db
+    def test_if_invalid_cursor_get_returns_404(self, user_client_with_movie_preferences):
+        response = user_client_with_movie_preferences.get(self.url, {'cursor': 'xxxgarbagexxx'})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.django_db
+    def test_if_projected_get_returns_same_fields_as_serializer(self, setup_neo4j, create_client, bake_user, bake_movie, insert_known_items):
+        user = bake_user()
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        movie = bake_movie()
+        item = MovieNode.nodes.get(item_id=movie.id)
+        insert_known_items(ranker, [item])
+        client = create_client(user)
+
+        response = client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [MovieNodeSerialiazer(item).data]
+
 
 class TestMovieQueue:
     url = '/api/movies/queue/'
@@ -185,6 +391,24 @@ class TestMovieQueue:
 
         assert response.status_code == status.HTTP_204_NO_CONTENT
 
+    @pytest.mark.django_db
+    def test_if_queued_pair_comparable_or_already_queued_it_is_not_queued(self, setup_neo4j, bake_user, bake_movie,
+                                                                          insert_known_items, insert_preferences):
+        user = bake_user()
+        items = [Item.nodes.get(item_id=movie.id) for movie in bake_movie(_quantity=3)]
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        insert_known_items(ranker, items)
+        insert_preferences(ranker, [(items[0], items[1])])
+
+        inserted = insert_queued_compares(ranker, [(items[1], items[0]), (items[0], items[2]), (items[2], items[0])])
+
+        results, _ = db.cypher_query("MATCH (i:Item)-[:COMPARE_WITH_BY {by: $ranker_id}]->(j:Item) "
+                                     "RETURN i.item_id, j.item_id", {'ranker_id': ranker.ranker_id})
+        assert inserted == 1
+        assert sorted(map(tuple, results)) == sorted([(items[0].item_id, items[2].item_id),
+                                                      (items[2].item_id, items[0].item_id)])
+        delete_all_queued_compares(ranker, MovieNode)
+
 
 class TestMoviePrefersList:
     url = '/api/movies/preferences/'
@@ -242,6 +466,7 @@ class TestMoviePrefersList:
 
         assert response.status_code == status.HTTP_201_CREATED
         assert len(response.data['warnings']) == 1
+        assert [result['accepted'] for result in response.data['results']] == [True, True, False]
 
     @pytest.mark.django_db
     def test_if_unknown_movie_post_returns_201_with_warning(self, setup_neo4j, create_client, bake_user, bake_movie, insert_known_items, insert_unknown_items):
@@ -265,6 +490,26 @@ class TestMoviePrefersList:
         assert len(response.data['warnings']) == 6
 
 
+    @pytest.mark.django_db
+    def test_if_movie_dne_post_returns_201_and_inserts_other_pairs(self, setup_neo4j, create_client, bake_user, bake_movie, insert_known_items):
+        user = bake_user()
+        ranker = Ranker.nodes.get(ranker_id=user.id)
+        movies = bake_movie(_quantity=2)
+        insert_known_items(ranker, [Item.nodes.get(item_id=movie.id) for movie in movies])
+        client = create_client(user)
+
+        data = {'preferences': [{'preferred_id': movies[0].id, 'nonpreferred_id': 'xxxgarbagexxx'},
+                                {'preferred_id': movies[0].id, 'nonpreferred_id': movies[1].id}]}
+
+        response = client.post(self.url, data, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        missing, inserted = response.data['results']
+        assert missing['accepted'] is False and missing['reason'] == 'Item does not exist'
+        assert inserted['accepted'] is True
+        assert len(response.data['warnings']) == 1
+
+
 class TestMoviePrefersDetail:
     url = '/api/movies/preferences/'
 
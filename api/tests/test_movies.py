@@ -1,6 +1,11 @@
+import numpy as np
 import pytest
+from django.db import connection
 from rest_framework import status
-from movies.models import Movie
+from core.models import Movie as MovieNode
+from movies.importer import _ids_by_name, import_catalog
+from movies.affinity import rank_scores, score_groups
+from movies.models import Genre, Movie, Star
 
 
 @pytest.mark.django_db
@@ -35,6 +40,30 @@ class TestRetrieveMovie:
 
         assert response.status_code == status.HTTP_200_OK
         assert response.data['id'] == test_movie.id
+        assert 'knows' not in response.data
+
+    def test_if_authenticated_returns_whether_user_knows_movie(self, setup_neo4j, bake_user, bake_movie, create_client):
+        user = bake_user()
+        known_movie, unknown_movie, other_movie = bake_movie(_quantity=3)
+        client = create_client(user)
+        client.post('/api/movies/knows/', {'known_ids': [known_movie.id], 'unknown_ids': [unknown_movie.id]},
+                    format='json')
+
+        responses = [client.get('/api/movies/info/{}/'.format(movie.id))
+                     for movie in [known_movie, unknown_movie, other_movie]]
+
+        assert [response.data['knows'] for response in responses] == [True, False, 'undefined']
+
+    def test_if_user_marks_cached_movie_returns_new_status(self, setup_neo4j, bake_user, bake_movie, create_client):
+        user = bake_user()
+        movie = bake_movie()
+        client = create_client(user)
+        client.get('/api/movies/info/{}/'.format(movie.id))
+
+        client.post('/api/movies/knows/', {'known_ids': [movie.id]}, format='json')
+        response = client.get('/api/movies/info/{}/'.format(movie.id))
+
+        assert response.data['knows'] == True
 
 
 @pytest.fixture
@@ -55,7 +84,7 @@ class TestSearchMovie:
         response = search_movie('anything')
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == []
+        assert response.data['results'] == []
 
     def test_returns_matching_movies_returns_movies_and_200(self, search_movie, bake_movie):
         searched_movie = bake_movie(title='The Greatest Showman')
@@ -66,4 +95,142 @@ class TestSearchMovie:
         response = search_movie(q='showman')
 
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) > 0
+        assert [movie['id'] for movie in response.data['results']] == [searched_movie.id]
+
+    def test_if_star_added_matches_star_name(self, search_movie, bake_movie):
+        movie = bake_movie()
+        star = Star.objects.create(name='Hugh Jackman')
+        movie.stars.add(star)
+
+        response = search_movie(q='jackman')
+
+        assert [result['id'] for result in response.data['results']] == [movie.id]
+
+    def test_if_movie_added_is_not_hidden_by_cache(self, search_movie, bake_movie):
+        first = bake_movie(title='The Greatest Showman')
+        search_movie(q='showman')
+
+        second = bake_movie(title='Showman Returns')
+        response = search_movie(q='showman')
+
+        assert {movie['id'] for movie in response.data['results']} == {first.id, second.id}
+
+    def test_if_paginated_returns_limited_results(self, api_client, bake_movie):
+        bake_movie(title='Showman', _quantity=3)
+
+        response = api_client.get('/api/movies/info/search/', {'q': 'showman', 'limit': 2})
+
+        assert len(response.data['results']) == 2
+        assert response.data['count'] == 3
+
+
+class TestMovieAffinity:
+    url = '/api/movies/affinity/'
+
+    def test_if_not_authenticated_get_returns_401(self, api_client):
+        response = api_client.get(self.url)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.django_db
+    def test_if_genre_of_every_known_movie_counts_them(self, user_client_with_movie_preferences):
+        genre = Genre.objects.create(name='Drama')
+        for movie in Movie.objects.all():
+            movie.genres.add(genre)
+
+        response = user_client_with_movie_preferences.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['name'], item['movies']) for item in response.data['genres']] == [('Drama', 5)]
+
+    def test_if_movies_ranked_higher_group_scores_higher(self):
+        scores = rank_scores(4)
+
+        affinity, counts = score_groups(np.array([0, 1, 2, 3]), np.array([0, 0, 1, 1]), 2, scores)
+
+        assert affinity[0] > 0 > affinity[1]
+        assert list(counts) == [2, 2]
+
+
+@pytest.fixture
+def typeahead_movie(api_client):
+    def do_typeahead_movie(q, **params):
+        return api_client.get('/api/movies/info/typeahead/', {'q': q, **params})
+    return do_typeahead_movie
+
+
+@pytest.mark.django_db
+class TestTypeaheadMovie:
+    def test_if_no_query_returns_400(self, typeahead_movie):
+        response = typeahead_movie('')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_if_limit_not_an_integer_returns_400(self, typeahead_movie):
+        response = typeahead_movie('show', limit='ten')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_if_partial_word_returns_prefix_matches_first(self, typeahead_movie, bake_movie):
+        inner = bake_movie(title='The Greatest Showman')
+        prefix = bake_movie(title='Showgirls')
+        bake_movie(title='Unrelated')
+
+        response = typeahead_movie('show')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [movie['id'] for movie in response.data] == [prefix.id, inner.id]
+
+    def test_if_substring_query_can_use_trigram_index(self, bake_movie):
+        bake_movie(title='The Greatest Showman')
+
+        # The table is too small for the planner to choose the index unless scans are ruled out
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Movie.objects.filter(title__icontains='show').explain()
+
+        assert 'movie_title_upper_trgm_idx' in plan
+
+    def test_if_movie_added_is_not_hidden_by_cache(self, typeahead_movie, bake_movie):
+        typeahead_movie('cached')
+        movie = bake_movie(title='Cached Title')
+
+        response = typeahead_movie('cached')
+
+        assert [result['id'] for result in response.data] == [movie.id]
+
+
+@pytest.mark.django_db
+class TestImportMovies:
+    def test_imports_fixture_page_with_genres_stars_and_nodes(self, setup_neo4j):
+        result = import_catalog(start=1, pages=1)
+
+        assert result.created == 3
+        assert set(Movie.objects.values_list('id', flat=True)) == {'tt9000001', 'tt9000002', 'tt9000003'}
+        assert set(Movie.objects.get(id='tt9000002').genres.values_list('name', flat=True)) == {'Action', 'Crime', 'Drama'}
+        assert Star.objects.filter(name='Bob Example').count() == 1
+        assert MovieNode.nodes.get(item_id='tt9000003').year == 2010
+
+    def test_if_imported_twice_skips_existing_movies(self, setup_neo4j):
+        import_catalog(start=1, pages=1)
+
+        result = import_catalog(start=1, pages=1)
+
+        assert result.created == 0
+        assert result.skipped == 3
+        assert Movie.objects.count() == 3
+
+    def test_if_page_not_cached_records_it_and_imports_the_rest(self, setup_neo4j):
+        # Only the first page has a fixture, and its movies are still in the batch when the second fails
+        result = import_catalog(start=1, pages=2)
+
+        assert result.failed == (251,)
+        assert result.created == 3
+        assert Movie.objects.count() == 3
+
+    def test_if_star_inserted_twice_keeps_one_row(self):
+        first = _ids_by_name(Star, {'Bob Example'})
+        second = _ids_by_name(Star, {'Bob Example', 'Alice Example'})
+
+        assert second['Bob Example'] == first['Bob Example']
+        assert Star.objects.filter(name='Bob Example').count() == 1
@@ -0,0 +1,58 @@
+from preferences.graph import PreferenceGraph
+
+
+def make_graph(edges):
+    # Movies A-F, with preferences (A,B), (A,C), (B,D), (C,D), (E,F) by default
+    return PreferenceGraph('ranker', list('ABCDEF'), edges)
+
+
+class TestPreferenceGraph:
+    edges = [('A', 'B'), ('A', 'C'), ('B', 'D'), ('C', 'D'), ('E', 'F')]
+
+    def test_if_transitive_preference_reaches(self):
+        graph = make_graph(self.edges)
+
+        assert graph.reaches(graph.index['A'], graph.index['D'])
+        assert not graph.reaches(graph.index['D'], graph.index['A'])
+        assert not graph.reaches(graph.index['A'], graph.index['F'])
+
+    def test_if_cyclic_insert_is_rejected(self):
+        graph = make_graph(self.edges)
+
+        assert not graph.try_insert('D', 'A')
+        assert not graph.try_insert('A', 'A')
+        assert graph.try_insert('A', 'D')
+
+    def test_if_unknown_item_insert_is_rejected(self):
+        graph = make_graph(self.edges)
+
+        assert not graph.try_insert('A', 'G')
+
+    def test_descendant_counts_include_ancestors(self):
+        graph = make_graph(self.edges)
+        graph.try_insert('D', 'E')
+
+        counts = dict(graph.descendant_counts(['D']))
+
+        assert counts == {'A': 5, 'B': 3, 'C': 3, 'D': 2}
+
+    def test_proposed_comparisons_are_never_comparable(self):
+        graph = make_graph(self.edges)
+        possible = [{'A', 'E'}, {'A', 'F'}, {'B', 'C'}, {'B', 'E'}, {'B', 'F'}, {'C', 'E'}, {'C', 'F'}]
+
+        proposed = graph.propose_comparisons(10)
+
+        assert proposed
+        assert all(set(pair) in possible for pair in proposed)
+
+    def test_if_totally_ordered_no_comparisons_proposed(self):
+        graph = make_graph([('A', 'B'), ('B', 'C'), ('C', 'D'), ('D', 'E'), ('E', 'F')])
+
+        assert graph.propose_comparisons(10) == []
+
+    def test_if_queued_comparison_connects_pair_it_is_not_queued(self):
+        # Queuing {C,D} after {A,B} with B->C and D->A would allow A->B->C->D->A
+        graph = make_graph([('B', 'C'), ('D', 'A')])
+
+        assert graph.try_queue('A', 'B')
+        assert not graph.try_queue('C', 'D')
@@ -0,0 +1,57 @@
+import ast
+import re
+from pathlib import Path
+from string import Formatter
+import pytest
+from core.models import Movie as MovieNode, User as UserNode
+from preferences import queries
+from preferences.queries import for_item_class, for_ranker_class
+
+PLACEHOLDERS = {'item_labels', 'ranker_labels', 'i', 'j', 'i_filter', 'j_filter'}
+# Names fixed by the schema rather than values, and the operators of item filters
+FIXED_STRINGS = {"'item_ordinal'", "'bradley_terry'", "'any'", "'gte'", "'lte'"}
+QUERY_FUNCTIONS = {'cypher_query', '_read', 'run_in_auto_commit'}
+
+STATEMENTS = {name: value for name, value in vars(queries).items() if name.isupper() and isinstance(value, str)}
+
+
+def _filled(statement: str) -> str:
+    if any(f'{{{placeholder}}}' in statement for placeholder in PLACEHOLDERS - {'ranker_labels'}):
+        return for_item_class(statement, MovieNode)
+    if '{ranker_labels}' in statement:
+        return for_ranker_class(statement, UserNode)
+    return statement
+
+
+class TestQueryRegistry:
+    @pytest.mark.parametrize('name', sorted(STATEMENTS))
+    def test_if_template_only_has_known_placeholders(self, name):
+        statement = STATEMENTS[name]
+        if _filled(statement) == statement:
+            return
+
+        fields = {field for _, field, _, _ in Formatter().parse(statement) if field is not None}
+
+        assert fields <= PLACEHOLDERS
+
+    @pytest.mark.parametrize('name', sorted(STATEMENTS))
+    def test_if_statement_has_no_inlined_string_values(self, name):
+        literals = set(re.findall(r"'[^']*'|\"[^\"]*\"", _filled(STATEMENTS[name])))
+
+        assert literals <= FIXED_STRINGS
+
+    def test_if_every_query_sent_is_a_registry_statement(self):
+        # A statement built from values at the call site would be a new text, and a new plan, per call
+        built = []
+        for path in Path(queries.__file__).parent.glob('*.py'):
+            for node in ast.walk(ast.parse(path.read_text())):
+                if not (isinstance(node, ast.Call) and node.args):
+                    continue
+                function = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, 'id', None)
+                statement = node.args[0]
+                if function in QUERY_FUNCTIONS and (
+                        isinstance(statement, (ast.Constant, ast.JoinedStr, ast.BinOp))
+                        or (isinstance(statement, ast.Call) and getattr(statement.func, 'attr', None) == 'format')):
+                    built.append(f'{path.name}:{node.lineno}')
+
+        assert built == []
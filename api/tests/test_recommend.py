@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from rest_framework import status
+from preferences.recommend import Neighbors, score_candidates
+
+
+class TestScoreCandidates:
+    def test_if_neighbor_of_top_item_scores_higher(self):
+        neighbors = Neighbors(np.array([[2, -1], [3, -1], [-1, -1], [-1, -1]]),
+                              np.array([[0.5, 0.0], [0.5, 0.0], [0.0, 0.0], [0.0, 0.0]]), 'test')
+
+        scores = score_candidates(neighbors, [0, 1], exclude=lambda ordinal: False)
+
+        assert scores[2] > scores[3]
+
+    def test_if_excluded_is_not_scored(self):
+        neighbors = Neighbors(np.array([[1, 2]]), np.array([[0.9, 0.1]]), 'test')
+
+        scores = score_candidates(neighbors, [0], exclude=lambda ordinal: ordinal == 1)
+
+        assert list(scores) == [2]
+
+
+class TestMovieRecommend:
+    url = '/api/movies/recommend/'
+
+    def test_if_not_authenticated_get_returns_401(self, api_client):
+        response = api_client.get(self.url)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.django_db
+    def test_if_not_built_get_returns_empty(self, user_client_with_movie_preferences, settings, tmp_path):
+        settings.RECOMMENDATIONS_PATH = tmp_path / 'neighbors.npz'
+
+        response = user_client_with_movie_preferences.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == []